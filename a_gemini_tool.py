@@ -1,19 +1,21 @@
-import os
 import json
 import re
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
+import ai_cache
+import gemini_client
+import metrics
+from ai_cache import cached_ai_call
 
-model = None
-if api_key:
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-pro-latest')
-    except Exception as e:
-        print(f"初始化 Gemini 模型時發生錯誤: {e}")
+# prompt 內容變更時請調高對應版本號，舊的快取就不會再被命中
+WORD_INFO_PROMPT_VERSION = 1
+EXPLANATION_PROMPT_VERSION = 1
+SUGGESTIONS_PROMPT_VERSION = 1
+# 同一個查詢正在呼叫 AI 時，其他請求等它的上限：與 gemini_client.generate 等待結果的上限相同
+COALESCE_WAIT_SECONDS = gemini_client.DEADLINE_SECONDS + 1
+# 後端 (Gemini / 錄製重播 / 合成) 由 gemini_client 統一管理，呼叫都有期限與重試；
+# 每次呼叫附上的 task 與 context 讓合成後端能產生對應格式的回應
 
 def clean_json_response(text):
     """安全地清理 AI 回傳的 markdown json 標籤"""
@@ -23,8 +25,10 @@ def clean_json_response(text):
     text = re.sub(r"\s*```$", "", text)
     return text
 
+@cached_ai_call("get_word_info", WORD_INFO_PROMPT_VERSION, wait_timeout=COALESCE_WAIT_SECONDS)
+@metrics.ai_call("get_word_info")
 def get_word_info(word):
-    if not model: return {"error": "AI 模型未初始化，請檢查 API Key。"}
+    if not gemini_client.available(): return {"error": "AI 模型未初始化，請檢查 API Key。"}
     try:
         prompt = f"""
         You are a professional lexicographer and English teacher creating data for a learning app.
@@ -41,62 +45,91 @@ def get_word_info(word):
         - "etymology": {{ "prefixes": [{{ "part": "string", "meaning": "string" }}], "roots": [{{ "part": "string", "meaning": "string" }}], "suffixes": [{{ "part": "string", "meaning": "string" }}] }}.
         - "relations": {{ "synonyms": ["string"], "antonyms": ["string"] }}.
         """
-        response = model.generate_content(prompt)
-        cleaned_response = clean_json_response(response.text)
+        cleaned_response = clean_json_response(gemini_client.generate(prompt, task="word_info", context={"word": word}))
         ai_data = json.loads(cleaned_response)
         return ai_data
     except Exception as e:
         print(f"AI 查詢 '{word}' 或 JSON 解析時發生錯誤: {e}")
         return {"error": f"AI 查詢時發生嚴重錯誤，請檢查終端機日誌。"}
 
+@metrics.ai_call("get_sentence_feedback")
 def get_sentence_feedback(word, user_sentence):
-    # 【測試模式】攔截特定的單字與句子，回傳對應的假資料
-    
-    # 測試情境 1：完美的句子 (測試 UI 的 ✅ 綠色成功提示)
-    if word == "abandon" and "sinking ship" in user_sentence.lower():
-        return {
-            "analysis": "文法完全正確！時態與語意都非常清晰。使用 'refused to do something' 的句型搭配這個單字非常道地。",
-            "suggestion": "The captain refused to abandon the sinking ship. (你的句子已經很棒了，維持這樣就好！)",
-            "usage_ok": True
-        }
-        
-    # 測試情境 2：單字用法對，但有小文法錯誤 (測試 UI 修正建議)
-    elif word == "absolute" and "confident" in user_sentence.lower():
-        return {
-            "analysis": "你使用了 'absolute' 這個形容詞來修飾，方向是正確的。不過 'confident' 是形容詞，在動詞 have 後面應該要用名詞 'confidence' 才符合文法。",
-            "suggestion": "I have absolute confidence in you.",
-            "usage_ok": True
-        }
-        
-    # 測試情境 3：單字用法錯誤、語境不自然 (測試 UI 的 ⚠️ 橘色警告提示)
-    elif word == "desert" and "homework" in user_sentence.lower():
-        return {
-            "analysis": "'desert' 通常用來指「遺棄、拋棄（人、地方或重大責任）」，帶有殘忍或背棄的意味。用來形容「放棄寫作業」語氣太重且非常不自然。",
-            "suggestion": "I want to give up on my homework. (放棄一般的事物用 give up 即可)",
-            "usage_ok": False
-        }
-        
-    # 預設回覆：如果你隨便打其他的句子，就給這個預設值
-    return {
-        "analysis": "這是一個預設的測試分析。你的句子結構基本完整。",
-        "suggestion": "這是 AI 建議的優化版本。",
-        "usage_ok": True
-    }
-
-def get_wrong_answer_explanation(word, definition, user_guess, sentence):
-    if not model: return "AI 模型未初始化"
+    if not gemini_client.available(): return {"error": "AI 模型未初始化"}
     try:
         prompt = f"""
+        As a friendly English teacher, review a student's sentence that should use the word "{word}".
+        The student wrote: "{user_sentence}"
+
+        Return a single, valid JSON object with exactly three keys:
+        - "analysis": (string) A short grammar and meaning analysis in Traditional Chinese.
+        - "suggestion": (string) An improved version of the sentence, optionally followed by a short note in Traditional Chinese.
+        - "usage_ok": (boolean) Whether "{word}" is used naturally and correctly.
+        """
+        cleaned_response = clean_json_response(gemini_client.generate(
+            prompt, task="sentence_feedback", context={"word": word, "sentence": user_sentence}))
+        return json.loads(cleaned_response)
+    except Exception as e:
+        print(f"AI 批改句子時發生錯誤: {e}")
+        return {"error": f"AI 批改時發生錯誤: {e}"}
+
+def _is_explanation_error(text):
+    return text.startswith("AI 模型未初始化") or text.startswith("AI 詳解生成時發生錯誤")
+
+def _explanation_context(word, definition, user_guess, sentence):
+    return {"word": word, "definition": definition, "guess": user_guess, "sentence": sentence}
+
+def _explanation_prompt(word, definition, user_guess, sentence):
+    return f"""
         As a helpful English teacher, a student is reviewing "{word}" (definition: {definition}) but answered incorrectly with "{user_guess}" for the sentence: "{sentence}".
         Provide a brief, friendly explanation in Traditional Chinese to help the student remember.
         """
-        response = model.generate_content(prompt)
-        return response.text
+
+@cached_ai_call("get_wrong_answer_explanation", EXPLANATION_PROMPT_VERSION, is_error=_is_explanation_error,
+                wait_timeout=COALESCE_WAIT_SECONDS)
+@metrics.ai_call("get_wrong_answer_explanation", is_error=_is_explanation_error)
+def get_wrong_answer_explanation(word, definition, user_guess, sentence):
+    if not gemini_client.available(): return "AI 模型未初始化"
+    args = (word, definition, user_guess, sentence)
+    try:
+        return gemini_client.generate(_explanation_prompt(*args), task="explanation", context=_explanation_context(*args))
     except Exception as e:
         return f"AI 詳解生成時發生錯誤: {e}"
 
+def get_cached_wrong_answer_explanation(word, definition, user_guess, sentence):
+    """只查快取，不呼叫 AI；沒有時回傳 None。"""
+    return ai_cache.lookup("get_wrong_answer_explanation", EXPLANATION_PROMPT_VERSION, (word, definition, user_guess, sentence))
+
+def stream_wrong_answer_explanation(word, definition, user_guess, sentence):
+    """逐段產生答錯詳解 (Gemini 串流)；完整結果寫回與 get_wrong_answer_explanation 相同的快取。"""
+    args = (word, definition, user_guess, sentence)
+    cached = get_cached_wrong_answer_explanation(*args)
+    if cached is not None:
+        yield cached
+        return
+    yield from _stream_explanation(args)
+
+@metrics.ai_call("stream_wrong_answer_explanation", is_error=_is_explanation_error)
+def _stream_explanation(args):
+    if not gemini_client.available():
+        yield "AI 模型未初始化"
+        return
+    parts = []
+    try:
+        for text in gemini_client.stream(_explanation_prompt(*args), task="explanation",
+                                         context=_explanation_context(*args)):
+            parts.append(text)
+            yield text
+    except Exception as e:
+        yield f"AI 詳解生成時發生錯誤: {e}"
+        return
+    if parts:
+        ai_cache.store("get_wrong_answer_explanation", EXPLANATION_PROMPT_VERSION, args, "".join(parts))
+
+@cached_ai_call("get_english_suggestions_from_chinese", SUGGESTIONS_PROMPT_VERSION,
+                wait_timeout=COALESCE_WAIT_SECONDS)
+@metrics.ai_call("get_english_suggestions_from_chinese")
 def get_english_suggestions_from_chinese(chinese_term):
-    if not model: return {"error": "AI 模型未初始化"}
+    if not gemini_client.available(): return {"error": "AI 模型未初始化"}
     try:
         prompt = f"""
         As a linguistic expert and translator, your task is to suggest English words based on a Traditional Chinese term.
@@ -110,16 +143,17 @@ def get_english_suggestions_from_chinese(chinese_term):
 
         Provide 3 to 5 distinct suggestions.
         """
-        response = model.generate_content(prompt)
-        cleaned_response = clean_json_response(response.text)
+        cleaned_response = clean_json_response(gemini_client.generate(
+            prompt, task="suggestions", context={"term": chinese_term}))
         ai_data = json.loads(cleaned_response)
         return ai_data
     except Exception as e:
         print(f"AI 建議生成時發生錯誤: {e}")
         return {"error": f"AI 建議生成時發生錯誤: {e}"}
 
+@metrics.ai_call("generate_multi_word_cloze")
 def generate_multi_word_cloze(words_list):
-    if not model: return {"error": "AI 模型未初始化"}
+    if not gemini_client.available(): return {"error": "AI 模型未初始化"}
     word_string = ", ".join(words_list)
     try:
         prompt = f"""
@@ -129,8 +163,8 @@ def generate_multi_word_cloze(words_list):
         Return a single, valid JSON object with one key, "story".
         The value of "story" should be the complete story you created.
         """
-        response = model.generate_content(prompt)
-        cleaned_response = clean_json_response(response.text)
+        cleaned_response = clean_json_response(gemini_client.generate(
+            prompt, task="multi_cloze", context={"words": list(words_list)}))
         ai_data = json.loads(cleaned_response)
         return ai_data
     except Exception as e:
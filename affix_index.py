@@ -0,0 +1,184 @@
+# affix_index.py - 詞源 (字首/字根/字尾) → 單字的反向索引，以及「和你學過的字共用詞源」的推薦
+#
+# 資料庫裡的部分由 schema._affix_index 維護：關聯表上的 (affix_id, word_id) 索引、每個詞源的單字數 (affix_counts，
+# 只計有定義的字，同探索頁) 與每種詞源的版本號，觸發器涵蓋 /save、匯入腳本與其他 worker 的寫入。
+# 推薦用的 posting list (每個詞源的 word id 陣列) 放在行程內，版本號沒變就直接使用；
+# 打分數是把使用者學過的詞源的 posting list 用 Counter 一次累加 (C 層迴圈)，不必逐字查詢。
+import math
+import os
+import threading
+from array import array
+from collections import Counter, namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+import level_catalog
+
+EXPLORE_LIMIT = int(os.getenv("EXPLORE_LIMIT", "200"))     # 探索頁最多列出幾個不在列表中的字
+RECOMMEND_LIMIT = 20
+MAX_RECOMMEND_LIMIT = 100
+POOL_FACTOR = 5             # 每批依共用詞源數取 limit 的幾倍當候選，再依權重排序
+# 字根最能代表字義，字首次之，字尾多半只決定詞性
+KIND_WEIGHTS = {"prefix": 0.6, "root": 1.0, "suffix": 0.4}
+
+Kind = namedtuple("Kind", "table column link_table link_column display")
+KINDS = {
+    "prefix": Kind("prefixes", "prefix", "word_prefixes", "prefix_id", "字首"),
+    "root": Kind("roots", "root", "word_roots", "root_id", "字根"),
+    "suffix": Kind("suffixes", "suffix", "word_suffixes", "suffix_id", "字尾"),
+}
+
+_postings = {}          # kind -> (version, {affix_id: array[word_id] (排序好)})
+_postings_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"postings_hits": 0, "postings_loads": 0, "explores": 0, "recommendations": 0, "candidates_scored": 0}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def postings(conn, kind):
+    """回傳 {affix_id: 排序好的 word id 陣列}；版本號沒變就用行程內的快取。"""
+    # 先讀版本再讀資料 (同 level_catalog)：讀取期間有變動時存下的是舊版本號，下次會重新載入
+    row = conn.execute("SELECT version FROM affix_index_versions WHERE kind = ?", (kind,)).fetchone()
+    version = row[0] if row else 0
+    cached = _postings.get(kind)
+    if cached is not None and cached[0] == version:
+        _bump("postings_hits")
+        return cached[1]
+    k = KINDS[kind]
+    rows = conn.execute(f"SELECT {k.link_column}, word_id FROM {k.link_table} ORDER BY {k.link_column}, word_id")
+    index = {affix_id: array("q", map(itemgetter(1), group)) for affix_id, group in groupby(rows, itemgetter(0))}
+    with _postings_lock:
+        _postings[kind] = (version, index)
+    _bump("postings_loads")
+    return index
+
+
+def get_affix(conn, kind, affix_id):
+    """{"id", "part", "meaning", "word_count"}；找不到時回傳 None。"""
+    k = KINDS[kind]
+    row = conn.execute(f"""
+        SELECT a.id, a.{k.column} AS part, a.meaning, coalesce(c.word_count, 0) AS word_count
+        FROM {k.table} a LEFT JOIN affix_counts c ON c.kind = ? AND c.affix_id = a.id
+        WHERE a.id = ?
+    """, (kind, affix_id)).fetchone()
+    return dict(row) if row else None
+
+
+def _words_by_id(conn, word_ids):
+    rows = {}
+    for start in range(0, len(word_ids), 500):
+        chunk = word_ids[start:start + 500]
+        for r in conn.execute(f"SELECT id, word, definition, level FROM words WHERE id IN ({','.join('?' * len(chunk))})",
+                              chunk):
+            rows[r["id"]] = dict(r)
+    return rows
+
+
+def explore(conn, kind, affix_id, user_id, limit=EXPLORE_LIMIT):
+    """含這個詞源的單字，分成 (在使用者列表中的, 其他字典單字 (最多 limit 個))，都依拼字排序。"""
+    _bump("explores")
+    members = level_catalog.membership(conn, user_id)
+    posting = postings(conn, kind).get(affix_id, ())
+    mine = [word_id for word_id in posting if word_id in members]
+    rows = _words_by_id(conn, mine)
+    in_list = sorted(rows.values(), key=itemgetter("word"))
+    k = KINDS[kind]
+    # 走 (affix_id, word_id) 索引；多取 len(mine) 個，扣掉列表中的字後仍有 limit 個
+    others = [dict(r) for r in conn.execute(f"""
+        SELECT w.id, w.word, w.definition, w.level
+        FROM {k.link_table} l JOIN words w ON w.id = l.word_id
+        WHERE l.{k.link_column} = ? AND w.definition IS NOT NULL
+        ORDER BY w.word
+        LIMIT ?
+    """, (affix_id, limit + len(mine))) if r["id"] not in members][:limit]
+    return in_list, others
+
+
+def _shared_affixes(conn, word_ids):
+    """候選字的詞源：{word_id: [(kind, affix_id, part, meaning)]}，三種詞源一個 UNION ALL 查完。"""
+    placeholders = ",".join("?" * len(word_ids))
+    selects = [
+        f"SELECT '{kind}', l.word_id, a.id, a.{k.column}, a.meaning FROM {k.link_table} l "
+        f"JOIN {k.table} a ON a.id = l.{k.link_column} WHERE l.word_id IN ({placeholders})"
+        for kind, k in KINDS.items()
+    ]
+    affixes = {}
+    for kind, word_id, affix_id, part, meaning in conn.execute(" UNION ALL ".join(selects), word_ids * len(KINDS)):
+        affixes.setdefault(word_id, []).append((kind, affix_id, part, meaning))
+    return affixes
+
+
+def recommend(conn, user_id, limit=RECOMMEND_LIMIT):
+    """推薦不在使用者列表中的字典單字：依「和列表中的字共用幾個字首/字根/字尾」排序，
+    同分時詞源越少見 (posting 越短) 權重越高。回傳 dict 的 list，"shared" 列出共用的詞源。"""
+    _bump("recommendations")
+    members = level_catalog.membership(conn, user_id)
+    if not len(members):
+        return []
+    index = {kind: postings(conn, kind) for kind in KINDS}
+    # 使用者學過的詞源 (一個查詢)
+    selects = [
+        f"SELECT DISTINCT '{kind}', l.{k.link_column} FROM word_user_data ud "
+        f"JOIN {k.link_table} l ON l.word_id = ud.word_id WHERE ud.user_id = ?"
+        for kind, k in KINDS.items()
+    ]
+    profile = {}
+    shared = Counter()
+    for kind, affix_id in conn.execute(" UNION ALL ".join(selects), (user_id,) * len(KINDS)):
+        posting = index[kind].get(affix_id)
+        if posting:
+            profile[(kind, affix_id)] = KIND_WEIGHTS[kind] / math.log2(1 + len(posting))
+            shared.update(posting)
+    for word_id in members.ids:
+        shared.pop(word_id, None)
+    _bump("candidates_scored", len(shared))
+
+    # 空白字 (沒有定義) 不推薦；一批候選扣掉空白字後不足 limit 個就再往下取一批，直到候選用完
+    results = []
+    seen = 0
+    size = limit * POOL_FACTOR
+    while True:
+        ranked = shared.most_common(size)       # 同分時的順序與 most_common() 相同，前面幾批不會變
+        results += _score(conn, [word_id for word_id, _ in ranked[seen:]], profile)
+        seen = len(ranked)
+        if len(results) >= limit or seen < size:
+            break
+        size *= 2
+    results.sort(key=lambda w: (-len(w["shared"]), -w["score"], w["word"]))
+    return results[:limit]
+
+
+def _score(conn, pool, profile):
+    if not pool:
+        return []
+    affixes = _shared_affixes(conn, pool)
+    words = _words_by_id(conn, pool)
+    results = []
+    for word_id in pool:
+        word = words.get(word_id)
+        if word is None or word["definition"] is None:
+            continue
+        common = [a for a in affixes.get(word_id, ()) if (a[0], a[1]) in profile]
+        word["shared"] = [{"type": kind, "id": affix_id, "part": part, "meaning": meaning}
+                          for kind, affix_id, part, meaning in common]
+        word["score"] = round(sum(profile[(a[0], a[1])] for a in common), 4)
+        results.append(word)
+    return results
+
+
+def clear_memory():
+    with _postings_lock:
+        _postings.clear()
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    with _postings_lock:
+        snapshot["postings_affixes"] = sum(len(index) for _, index in _postings.values())
+        snapshot["postings_words"] = sum(len(p) for _, index in _postings.values() for p in index.values())
+    return snapshot
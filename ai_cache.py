@@ -0,0 +1,205 @@
+# ai_cache.py - Gemini 回應快取 (記憶體 LRU + SQLite 持久層 + 同 key 請求合併)
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = os.getenv("AI_CACHE_PATH", "ai_cache.db")
+MEMORY_ENTRIES = int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "2048"))
+DISK_MAX_ENTRIES = int(os.getenv("AI_CACHE_DISK_MAX_ENTRIES", "100000"))
+TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+TOUCH_INTERVAL = 3600   # 讀取時最多每小時更新一次 last_access，避免每次命中都寫檔
+
+_memory = LRUCache(maxsize=MEMORY_ENTRIES, ttl=TTL_SECONDS)
+_local = threading.local()
+_inflight = {}
+_inflight_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"disk_hits": 0, "misses": 0, "coalesced": 0, "coalesce_timeouts": 0, "disk_evictions": 0, "disk_expired": 0,
+          "disk_errors": 0, "upstream_errors": 0}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _disk():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_FILE, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ai_cache (
+                key TEXT PRIMARY KEY,
+                func TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_last_access ON ai_cache (last_access)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_key(func_name, version, args):
+    raw = json.dumps([func_name, version, _normalize(list(args))], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _disk_get(key):
+    conn = _disk()
+    row = conn.execute("SELECT value, created_at, last_access FROM ai_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    value, created_at, last_access = row
+    now = time.time()
+    if now - created_at > TTL_SECONDS:
+        conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+        conn.commit()
+        _bump("disk_expired")
+        return None
+    if now - last_access > TOUCH_INTERVAL:
+        conn.execute("UPDATE ai_cache SET last_access = ? WHERE key = ?", (now, key))
+        conn.commit()
+    return json.loads(value)
+
+
+def _disk_set(key, func_name, value):
+    conn = _disk()
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO ai_cache (key, func, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+        (key, func_name, json.dumps(value, ensure_ascii=False), now, now),
+    )
+    # 超過容量時，淘汰最久未使用的 10%
+    count = conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+    if count > DISK_MAX_ENTRIES:
+        excess = count - DISK_MAX_ENTRIES + DISK_MAX_ENTRIES // 10
+        cur = conn.execute(
+            "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY last_access LIMIT ?)", (excess,)
+        )
+        _bump("disk_evictions", cur.rowcount)
+    conn.commit()
+
+
+def purge_expired():
+    conn = _disk()
+    cur = conn.execute("DELETE FROM ai_cache WHERE created_at < ?", (time.time() - TTL_SECONDS,))
+    conn.commit()
+    _bump("disk_expired", cur.rowcount)
+    return cur.rowcount
+
+
+def lookup(func_name, version, args):
+    """查詢快取 (記憶體 → SQLite)；沒有命中時回傳 None。"""
+    key = make_key(func_name, version, args)
+    value = _memory.get(key)
+    if value is not None:
+        return value
+    try:
+        value = _disk_get(key)
+    except sqlite3.Error as e:
+        _bump("disk_errors")
+        logger.warning("AI 快取讀取失敗: %s", e)
+    if value is not None:
+        _bump("disk_hits")
+        _memory.set(key, value)
+    return value
+
+
+def store(func_name, version, args, value):
+    """寫入快取；串流產生的結果完成後也用這個寫回，讓下次直接命中。"""
+    key = make_key(func_name, version, args)
+    _memory.set(key, value)
+    try:
+        _disk_set(key, func_name, value)
+    except sqlite3.Error as e:
+        _bump("disk_errors")
+        logger.warning("AI 快取寫入失敗: %s", e)
+
+
+def cached_ai_call(func_name, version, is_error=lambda result: isinstance(result, dict) and "error" in result,
+                   wait_timeout=None):
+    """快取裝飾器：key 由函式名稱、prompt 版本與正規化後的參數組成；錯誤結果不快取。
+
+    同 key 合併的請求最多等 wait_timeout 秒 (應與上游呼叫的期限相同)，逾時就自己呼叫上游。"""
+
+    def decorator(func):
+        def call(args):
+            value = func(*args)
+            if is_error(value):
+                _bump("upstream_errors")
+            else:
+                store(func_name, version, args, value)
+            return value
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            value = lookup(func_name, version, args)
+            if value is not None:
+                return value
+            key = make_key(func_name, version, args)
+
+            # 同一個 key 只讓一個請求呼叫上游，其餘等待結果
+            with _inflight_lock:
+                future = _inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    _inflight[key] = future
+            if not leader:
+                _bump("coalesced")
+                try:
+                    return future.result(timeout=wait_timeout)
+                except TimeoutError:
+                    # 帶頭的請求卡住了：不再等它，也不取代它 (它完成時仍會寫入快取)
+                    _bump("coalesce_timeouts")
+                    return call(args)
+
+            _bump("misses")
+            try:
+                value = call(args)
+                future.set_result(value)
+                return value
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with _inflight_lock:
+                    _inflight.pop(key, None)
+
+        return wrapper
+
+    return decorator
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["memory"] = _memory.stats()
+    try:
+        snapshot["disk_entries"] = _disk().execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+    except sqlite3.Error:
+        snapshot["disk_entries"] = None
+    return snapshot
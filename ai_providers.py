@@ -0,0 +1,357 @@
+# ai_providers.py - AI 後端：Gemini、錄製/重播 (prompt → 回應存在 SQLite)、合成 (可設定延遲分布與錯誤率)
+#
+# 由 AI_PROVIDER 選擇 (gemini / record / replay / synthetic)。重試、期限、對沖與併發上限都在 gemini_client，
+# 這裡只負責「送出一次請求」，所以離線壓測時那些機制照樣會被觸發。
+#
+# 每個後端提供：
+#   name、available()、describe()、stats()
+#   async generate(prompt, timeout, generation_config, task, context) -> (文字, (prompt tokens, output tokens))
+#   stream(prompt, timeout, task, context) -> 逐段產生 (文字, 累計用量或 None)
+# task / context 由 a_gemini_tool 提供 (例如 "word_info", {"word": ...})；只有合成後端會用到。
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+DEFAULT_MODEL = "gemini-pro-latest"
+
+
+class ReplayMiss(LookupError):
+    """重播模式下找不到這個 prompt 的錄製結果。"""
+
+
+def usage_of(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, api_key, model_name=DEFAULT_MODEL):
+        self.model_name = model_name
+        self.model = None
+        if api_key:
+            try:
+                genai.configure(api_key=api_key)
+                self.model = genai.GenerativeModel(model_name)
+            except Exception as e:
+                print(f"初始化 Gemini 模型時發生錯誤: {e}")
+
+    def available(self):
+        return self.model is not None
+
+    def describe(self):
+        return self.model_name if self.model else None
+
+    def stats(self):
+        return {}
+
+    async def generate(self, prompt, timeout, generation_config=None, task=None, context=None):
+        response = await self.model.generate_content_async(
+            prompt, generation_config=generation_config, request_options={"timeout": timeout}
+        )
+        return response.text, usage_of(response)
+
+    def stream(self, prompt, timeout, task=None, context=None):
+        for chunk in self.model.generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+            usage = usage_of(chunk) if getattr(chunk, "usage_metadata", None) else None
+            yield chunk.text, usage
+
+
+class RecordReplayProvider:
+    """inner 不為 None 時是錄製模式 (轉送給 inner 並存下結果)，否則是重播模式。
+
+    key 是 prompt 與 generation_config 的雜湊，同一個 prompt 總是重播同一個回應；
+    replay_latency 為 True 時照錄製當時的延遲等待 (串流則平均分攤在每一段之前)。"""
+
+    def __init__(self, path, inner=None, replay_latency=True):
+        self.path = path
+        self.inner = inner
+        self.replay_latency = replay_latency
+        self.name = "record" if inner is not None else "replay"
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    def _bump(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def available(self):
+        return self.inner.available() if self.inner is not None else True
+
+    def describe(self):
+        return f"{self.name}:{self.path}"
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recordings (
+                    key TEXT PRIMARY KEY,
+                    task TEXT,
+                    prompt TEXT NOT NULL,
+                    chunks TEXT NOT NULL,
+                    latency_ms REAL NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    output_tokens INTEGER NOT NULL,
+                    recorded_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(prompt, generation_config=None):
+        raw = json.dumps([prompt, generation_config], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _save(self, key, task, prompt, chunks, latency_ms, usage):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, task, prompt, json.dumps(chunks, ensure_ascii=False), latency_ms, *usage, time.time()),
+        )
+        conn.commit()
+        self._bump("recorded")
+
+    def _load(self, key):
+        row = self._conn().execute(
+            "SELECT chunks, latency_ms, prompt_tokens, output_tokens FROM recordings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._bump("misses")
+            raise ReplayMiss(f"沒有這個 prompt 的錄製結果 (key={key[:12]})")
+        self._bump("replayed")
+        return json.loads(row[0]), row[1] / 1000, (row[2], row[3])
+
+    async def generate(self, prompt, timeout, generation_config=None, task=None, context=None):
+        key = self.key(prompt, generation_config)
+        if self.inner is not None:
+            started = time.perf_counter()
+            text, usage = await self.inner.generate(prompt, timeout, generation_config, task, context)
+            latency_ms = (time.perf_counter() - started) * 1000
+            await asyncio.to_thread(self._save, key, task, prompt, [text], latency_ms, usage)
+            return text, usage
+        chunks, latency, usage = self._load(key)
+        if self.replay_latency:
+            await asyncio.sleep(latency)
+        return "".join(chunks), usage
+
+    def stream(self, prompt, timeout, task=None, context=None):
+        key = self.key(prompt)
+        if self.inner is not None:
+            started = time.perf_counter()
+            chunks, usage = [], (0, 0)
+            for text, chunk_usage in self.inner.stream(prompt, timeout, task, context):
+                chunks.append(text)
+                usage = chunk_usage or usage
+                yield text, chunk_usage
+            self._save(key, task, prompt, chunks, (time.perf_counter() - started) * 1000, usage)
+            return
+        chunks, latency, usage = self._load(key)
+        for i, text in enumerate(chunks):
+            if self.replay_latency:
+                time.sleep(latency / len(chunks))
+            yield text, usage if i == len(chunks) - 1 else None
+
+
+class SyntheticProvider:
+    """不連網的假後端：延遲為對數常態分布 (中位數 median_ms、形狀 sigma)，
+    error_rate 的比例丟出可重試的 ServiceUnavailable，timeout_rate 的比例故意超過單次逾時。
+    回應內容依 task 產生合法的 JSON / 文字，同一個 prompt 的內容固定。"""
+
+    name = "synthetic"
+
+    def __init__(self, median_ms=800, sigma=0.5, error_rate=0.0, timeout_rate=0.0, seed=None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"responses": 0, "injected_errors": 0, "injected_timeouts": 0}
+
+    def _bump(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def available(self):
+        return True
+
+    def describe(self):
+        return (f"synthetic (median {self.median_ms:g}ms, sigma {self.sigma:g}, "
+                f"errors {self.error_rate:g}, timeouts {self.timeout_rate:g})")
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _draw(self):
+        """回傳 (延遲秒數, "ok" / "error" / "timeout")。"""
+        with self._rng_lock:
+            latency = self.median_ms / 1000 * math.exp(self.sigma * self._rng.gauss(0, 1))
+            roll = self._rng.random()
+        if roll < self.error_rate:
+            return latency, "error"
+        if roll < self.error_rate + self.timeout_rate:
+            return latency, "timeout"
+        return latency, "ok"
+
+    def _respond(self, prompt, task, context):
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        responder = _RESPONDERS.get(task)
+        text = responder(context or {}, rng) if responder else f"(synthetic response to {len(prompt)} chars)"
+        self._bump("responses")
+        return text, (len(prompt) // 4, len(text) // 4)
+
+    async def generate(self, prompt, timeout, generation_config=None, task=None, context=None):
+        latency, outcome = self._draw()
+        if outcome == "timeout":
+            self._bump("injected_timeouts")
+            await asyncio.sleep(timeout + 1)        # gemini_client 的單次逾時會先觸發
+        await asyncio.sleep(latency)
+        if outcome == "error":
+            self._bump("injected_errors")
+            raise google_exceptions.ServiceUnavailable("synthetic error")
+        return self._respond(prompt, task, context)
+
+    def stream(self, prompt, timeout, task=None, context=None):
+        latency, outcome = self._draw()
+        time.sleep(min(latency, timeout))
+        if outcome != "ok":
+            self._bump("injected_errors" if outcome == "error" else "injected_timeouts")
+            raise google_exceptions.ServiceUnavailable(f"synthetic {outcome}")
+        text, usage = self._respond(prompt, task, context)
+        pieces = [p for p in text.replace("。", "。\n").splitlines(keepends=True) if p]
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(latency / 10)
+            yield piece, usage if i == len(pieces) - 1 else None
+
+
+# --- 合成後端的回應內容 ---
+
+_SYNTHETIC_WORDS = ["abandon", "abundant", "accurate", "adapt", "adequate", "advocate", "allocate",
+                    "ambiguous", "anticipate", "arbitrary", "assess", "assume", "coherent", "compatible"]
+
+
+def _word_info(context, rng):
+    word = context.get("word", "word")
+    collocation = f"{word} the plan"
+    return json.dumps({
+        "word": word,
+        "level": 4,
+        "part_of_speech": rng.choice(("n.", "v.", "adj.")),
+        "definition": f"（合成資料）{word} 的定義",
+        "collocation": collocation,
+        "mnemonic": f"（合成資料）把 {word} 拆開來記",
+        "example1": f"After a long discussion, the team decided to **{collocation}** before the deadline.",
+        "example2": f"Nobody expected the manager to **{collocation}** so quickly last week.",
+        "etymology": {"prefixes": [], "roots": [], "suffixes": []},
+        "relations": {"synonyms": rng.sample(_SYNTHETIC_WORDS, 2), "antonyms": []},
+    }, ensure_ascii=False)
+
+
+def _suggestions(context, rng):
+    term = context.get("term", "")
+    return json.dumps({"suggestions": [
+        {"word": word, "hint": f"（合成資料）與「{term}」相關的用法"} for word in rng.sample(_SYNTHETIC_WORDS, 3)
+    ]}, ensure_ascii=False)
+
+
+def _multi_cloze(context, rng):
+    words = context.get("words", [])
+    templates = ["At first, nobody wanted to {} anything.", "Then the teacher said it was important to {} it.",
+                 "Everyone agreed the result would {} them.", "In the end, they learned how to {} together."]
+    rng.shuffle(templates)
+    lines = [templates[i % len(templates)].format(word) for i, word in enumerate(words)]
+    return json.dumps({"story": " ".join(lines)}, ensure_ascii=False)
+
+
+def _explanation(context, rng):
+    return (f"「{context.get('guess', '')}」不是這一題的答案。正確答案是 {context.get('word', '')}，"
+            f"意思是「{context.get('definition', '')}」。試著把它放回句子裡再念一次，會更容易記住。")
+
+
+def _sentence_feedback(context, rng):
+    # 原本寫死在 get_sentence_feedback 的測試情境，方便檢查三種 UI 狀態
+    word, sentence = context.get("word", ""), context.get("sentence", "").lower()
+    if word == "abandon" and "sinking ship" in sentence:
+        feedback = {
+            "analysis": "文法完全正確！時態與語意都非常清晰。使用 'refused to do something' 的句型搭配這個單字非常道地。",
+            "suggestion": "The captain refused to abandon the sinking ship. (你的句子已經很棒了，維持這樣就好！)",
+            "usage_ok": True,
+        }
+    elif word == "absolute" and "confident" in sentence:
+        feedback = {
+            "analysis": "你使用了 'absolute' 這個形容詞來修飾，方向是正確的。不過 'confident' 是形容詞，"
+                        "在動詞 have 後面應該要用名詞 'confidence' 才符合文法。",
+            "suggestion": "I have absolute confidence in you.",
+            "usage_ok": True,
+        }
+    elif word == "desert" and "homework" in sentence:
+        feedback = {
+            "analysis": "'desert' 通常用來指「遺棄、拋棄（人、地方或重大責任）」，帶有殘忍或背棄的意味。"
+                        "用來形容「放棄寫作業」語氣太重且非常不自然。",
+            "suggestion": "I want to give up on my homework. (放棄一般的事物用 give up 即可)",
+            "usage_ok": False,
+        }
+    else:
+        feedback = {
+            "analysis": "這是一個預設的測試分析。你的句子結構基本完整。",
+            "suggestion": "這是 AI 建議的優化版本。",
+            "usage_ok": rng.random() < 0.8,
+        }
+    return json.dumps(feedback, ensure_ascii=False)
+
+
+_RESPONDERS = {
+    "word_info": _word_info,
+    "suggestions": _suggestions,
+    "multi_cloze": _multi_cloze,
+    "explanation": _explanation,
+    "sentence_feedback": _sentence_feedback,
+}
+
+
+def from_env():
+    """依環境變數建立後端；在 load_dotenv() 之後呼叫。"""
+    kind = os.getenv("AI_PROVIDER", "gemini").strip().lower()
+    recordings = os.getenv("AI_RECORDINGS_PATH", "ai_recordings.db")
+    model_name = os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+    if kind == "gemini":
+        return GeminiProvider(os.getenv("GEMINI_API_KEY"), model_name)
+    if kind == "record":
+        return RecordReplayProvider(recordings, inner=GeminiProvider(os.getenv("GEMINI_API_KEY"), model_name))
+    if kind == "replay":
+        return RecordReplayProvider(recordings, replay_latency=os.getenv("AI_REPLAY_LATENCY", "1") != "0")
+    if kind == "synthetic":
+        seed = os.getenv("AI_SYNTHETIC_SEED")
+        return SyntheticProvider(
+            median_ms=float(os.getenv("AI_SYNTHETIC_MEDIAN_MS", "800")),
+            sigma=float(os.getenv("AI_SYNTHETIC_SIGMA", "0.5")),
+            error_rate=float(os.getenv("AI_SYNTHETIC_ERROR_RATE", "0")),
+            timeout_rate=float(os.getenv("AI_SYNTHETIC_TIMEOUT_RATE", "0")),
+            seed=int(seed) if seed else None,
+        )
+    raise ValueError(f"未知的 AI_PROVIDER：{kind} (可用：gemini、record、replay、synthetic)")
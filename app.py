@@ -1,31 +1,70 @@
 # app.py (V.Final - 修復完整版)
+import hmac
+import io
 import os
 import sqlite3
 import random
 import json
+import multiprocessing
 import re
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from flask_bcrypt import Bcrypt
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, Response, session, make_response, stream_with_context
+from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user, login_url
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 load_dotenv()
+import db
+import ai_cache
+import search
+import sampler
+import srs
+import reviews
+import wordlist
+import word_store
+import word_cards
+import user_cache
+import passwords
+import story_pool
+import enrich
+import gemini_client
+import local_dict
+import blanking
+import metrics
+import decks
+import level_catalog
+import affix_index
+import import_words
 from a_gemini_tool import (
     get_word_info, 
     get_sentence_feedback, 
-    get_wrong_answer_explanation, 
+    get_cached_wrong_answer_explanation,
+    stream_wrong_answer_explanation,
     get_english_suggestions_from_chinese,
     generate_multi_word_cloze
 )
 
 app = Flask(__name__)
+# 在反向代理後面時設定 PROXY_FIX_HOPS (代理層數)，request.remote_addr 才會是使用者的 IP 而不是代理的
+if int(os.getenv("PROXY_FIX_HOPS", "0")):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv("PROXY_FIX_HOPS")))
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "a-super-secret-key-that-no-one-can-guess")
 
-bcrypt = Bcrypt(app)
+# 答錯詳解的串流 token：簽章後的 (word_id, guess)，伺服器端不需保存狀態
+explanation_tokens = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='wrong-answer-explanation')
+EXPLANATION_TOKEN_MAX_AGE = 600
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+@login_manager.unauthorized_handler
+def unauthorized():
+    # /api/ 是頁面上的 fetch 呼叫：轉址到登入頁會被 fetch 跟隨成 200，前端會誤以為已送達；改回 401
+    if request.path.startswith('/api/'):
+        return jsonify({"error": "Login required"}), 401
+    flash(login_manager.login_message, login_manager.login_message_category)
+    return redirect(login_url(login_manager.login_view, next_url=request.url))
+
 # --- Google OAuth 設定 ---
 oauth = OAuth(app)
 google = oauth.register(
@@ -37,23 +76,126 @@ google = oauth.register(
 )
 
 def get_db_connection():
-    conn = sqlite3.connect('vocabulary.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    # 每個 app context 共用一條池化連線，於 teardown_appcontext 歸還
+    return db.get_connection()
+
+app.teardown_appcontext(db.release_connection)
+# 每個請求的延遲、SQL 與 AI 計量 (/metrics)；SLOW_REQUEST_MS 設定後記錄慢請求的查詢明細
+metrics.init_app(app)
+for _name, _stats in (("db", db.stats), ("save", word_store.stats), ("word_cards", word_cards.stats),
+                      ("users", user_cache.stats), ("passwords", passwords.stats), ("story_pool", story_pool.stats),
+                      ("gemini", gemini_client.stats), ("lookup", local_dict.stats), ("ai_cache", ai_cache.stats),
+                      ("blanking", blanking.stats), ("decks", decks.stats),
+                      ("level_catalog", level_catalog.stats), ("affix_index", affix_index.stats)):
+    metrics.register_stats(_name, _stats)
+# 例句中的 **搭配詞** 標示
+app.add_template_filter(blanking.emphasize, 'emphasize')
+# passwords 的 bcrypt 子行程 (spawn) 會重新 import 主程式 (python app.py，或 import app 的腳本)；子行程裡不要跑啟動動作
+if multiprocessing.current_process().name == 'MainProcess':
+    db.init_schema()
+    # 中文定義的反向索引在背景補上 (升級後第一次啟動可能要處理整個字典，不放在請求中)
+    local_dict.request_sync()
+    passwords.warm_up()
 
 class User(UserMixin):
     def __init__(self, id, username, password, google_id=None):
         self.id, self.username, self.password, self.google_id = id, username, password, google_id
 
-@login_manager.user_loader
-def load_user(user_id):
+def _load_user_from_db(user_id):
     conn = get_db_connection()
     user_row = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    conn.close()
     if user_row:
         return User(id=user_row['id'], username=user_row['username'], password=user_row['password'], google_id=user_row['google_id'])
     return None
 
+@login_manager.user_loader
+def load_user(user_id):
+    # 每個 @login_required 請求都會呼叫；先查行程內快取，命中時完全不碰資料庫
+    return user_cache.get(user_id, _load_user_from_db)
+
+@app.route('/api/stats/db')
+@login_required
+def db_stats():
+    return jsonify(db.stats())
+
+@app.route('/api/stats/save')
+@login_required
+def save_stats():
+    return jsonify(word_store.stats())
+
+@app.route('/api/stats/word_cards')
+@login_required
+def word_card_stats():
+    return jsonify(word_cards.stats())
+
+@app.route('/api/stats/users')
+@login_required
+def user_cache_stats():
+    return jsonify(user_cache.stats())
+
+@app.route('/api/stats/passwords')
+@login_required
+def password_stats():
+    return jsonify(passwords.stats())
+
+@app.route('/api/stats/story_pool')
+@login_required
+def story_pool_stats():
+    return jsonify(story_pool.stats())
+
+@app.route('/api/enrich/status')
+@login_required
+def enrich_status():
+    # 背景補齊 worker (python enrich.py) 的佇列進度
+    return jsonify(enrich.counts(get_db_connection()))
+
+@app.route('/api/enrich/jobs/<int:word_id>')
+@login_required
+def enrich_job_status(word_id):
+    job = enrich.job_status(get_db_connection(), word_id)
+    if not job: return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/stats/gemini')
+@login_required
+def gemini_stats():
+    return jsonify(gemini_client.stats())
+
+@app.route('/api/stats/lookup')
+@login_required
+def lookup_stats():
+    return jsonify(local_dict.stats())
+
+@app.route('/api/stats/level_catalog')
+@login_required
+def level_catalog_stats():
+    return jsonify(level_catalog.stats())
+
+@app.route('/api/stats/affix_index')
+@login_required
+def affix_index_stats():
+    return jsonify(affix_index.stats())
+
+@app.route('/api/stats/ai_cache')
+@login_required
+def ai_cache_stats():
+    return jsonify(ai_cache.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # 給 Prometheus 抓取：設定 METRICS_TOKEN 時用 Bearer token 驗證，否則與其他統計端點一樣需要登入
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    elif not current_user.is_authenticated:
+        return login_manager.unauthorized()
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def parse_id_list(value, limit=200):
+    # 解析 "1,2,3" 形式的查詢參數，忽略非數字項目
+    return [int(v) for v in (value or '').split(',')[:limit] if v.strip().isdigit()]
+
 def contains_chinese(text):
     return bool(re.search(r'[\u4e00-\u9fff]', text))
 
@@ -65,7 +207,13 @@ def register():
         if not username or not password:
             flash("使用者名稱和密碼為必填項。", "error")
             return render_template('register.html')
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        # bcrypt 在獨立的 process pool 中計算，不佔用處理請求的執行緒
+        try:
+            passwords.throttle((request.remote_addr, username.lower()))
+            hashed_password = passwords.hash_password(password)
+        except (passwords.Throttled, passwords.PasswordBusy) as e:
+            flash(str(e), "error")
+            return render_template('register.html'), 429 if isinstance(e, passwords.Throttled) else 503
         conn = get_db_connection()
         try:
             conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, hashed_password))
@@ -74,8 +222,6 @@ def register():
         except sqlite3.IntegrityError:
             flash("這個使用者名稱已經被註冊了！", "error")
             return render_template('register.html')
-        finally: 
-            conn.close()
         return redirect(url_for('login'))
     return render_template('register.html')
 
@@ -83,11 +229,22 @@ def register():
 def login():
     if request.method == 'POST':
         username, password = request.form['username'], request.form['password']
-        conn = get_db_connection()
-        user_row = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
-        if user_row and user_row['password'] and bcrypt.check_password_hash(user_row['password'], password):
+        try:
+            passwords.throttle((request.remote_addr, username.lower()))
+            conn = get_db_connection()
+            user_row = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+            valid = bool(user_row) and passwords.check_password(user_row['password'], password)
+            if valid and passwords.needs_rehash(user_row['password']):
+                # BCRYPT_ROUNDS 調整後，在使用者下次登入時用新的工作因子重新雜湊
+                conn.execute('UPDATE users SET password = ? WHERE id = ?', (passwords.hash_password(password), user_row['id']))
+                conn.commit()
+                passwords.record_rehash()
+        except (passwords.Throttled, passwords.PasswordBusy) as e:
+            flash(str(e), "error")
+            return redirect(url_for('login'))
+        if valid:
             user = User(id=user_row['id'], username=user_row['username'], password=user_row['password'])
+            user_cache.invalidate(user.id)
             login_user(user)
             return redirect(url_for('index'))
         else:
@@ -98,6 +255,7 @@ def login():
 @app.route('/logout')
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
     logout_user()
     return redirect(url_for('login'))
 
@@ -117,14 +275,13 @@ def google_callback():
         new_username = user_info.get('name', f"user_{random.randint(1000,9999)}")
         while conn.execute('SELECT * FROM users WHERE username = ?', (new_username,)).fetchone(): 
             new_username = f"{new_username}_{random.randint(100,999)}"
-        dummy_password = bcrypt.generate_password_hash('!@#$disabled-password-for-oauth$#@!').decode('utf-8')
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO users (username, password, google_id) VALUES (?, ?, ?)', (new_username, dummy_password, google_id))
+        # Google 帳號不設密碼，存入無法通過驗證的標記 (不必為固定字串計算 bcrypt)
+        conn.execute('INSERT INTO users (username, password, google_id) VALUES (?, ?, ?)', (new_username, passwords.OAUTH_MARKER, google_id))
         conn.commit()
         user_row = conn.execute('SELECT * FROM users WHERE google_id = ?', (google_id,)).fetchone()
     
     user = User(id=user_row['id'], username=user_row['username'], password=user_row['password'], google_id=user_row['google_id'])
-    conn.close()
+    user_cache.invalidate(user.id)
     login_user(user)
     return redirect(url_for('index'))
 
@@ -134,24 +291,56 @@ def google_callback():
 def index():
     query = request.args.get('query')
     conn = get_db_connection()
-    # 注意這裡將 example1 映射為 example_sentence 供前端使用
-    base_query = """
-        SELECT w.*, w.example1 AS example_sentence,
-               COALESCE(ud.review_count, 0) as review_count, 
-               COALESCE(ud.correct_count, 0) as correct_count
-        FROM words w
-        JOIN word_user_data ud ON w.id = ud.word_id
-        WHERE ud.user_id = ?
-    """
-    params = [current_user.id]
-    if query:
-        search_term = f"%{query}%"
-        base_query += " AND (w.word LIKE ? OR w.definition LIKE ?)"
-        params.extend([search_term, search_term])
-    base_query += " ORDER BY ud.last_reviewed DESC, w.id DESC"
-    words = conn.execute(base_query, tuple(params)).fetchall()
-    conn.close()
-    return render_template('index.html', words=words, query=query)
+    if query and query.strip():
+        # 有搜尋字串時走 FTS 索引，依相關度排序
+        words = search.search_user_words(conn, current_user.id, query)
+        return render_template('index.html', words=words, query=query)
+    # 依 (last_reviewed, id) 做 keyset 分頁，其餘頁面由 /api/words 無限捲動載入
+    words, next_cursor = wordlist.user_words_page(conn, current_user.id)
+    return render_template('index.html', words=words, query=query, next_cursor=next_cursor)
+
+@app.route('/api/words')
+@login_required
+def api_words():
+    conn = get_db_connection()
+    limit = request.args.get('limit', wordlist.PAGE_SIZE, type=int)
+    words, next_cursor = wordlist.user_words_page(conn, current_user.id, request.args.get('cursor'), limit)
+    return jsonify({
+        "words": [dict(w) for w in words],
+        "html": render_template('_word_cards.html', words=words),
+        "next_cursor": next_cursor
+    })
+
+@app.route('/export/<fmt>')
+@login_required
+def export_deck(fmt):
+    # 串流輸出：每段只讀一小批單字，大列表也不會整個載入記憶體
+    if fmt not in decks.FORMATS: return jsonify({"error": "Unsupported format"}), 404
+    filename = f"vocabulary-{srs.now_utc():%Y%m%d}.{fmt}"
+    return Response(stream_with_context(decks.export(get_db_connection(), current_user.id, fmt)),
+                    content_type=f"{decks.FORMATS[fmt]}; charset=utf-8",
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/import', methods=['POST'])
+@login_required
+def import_deck():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash("請選擇要匯入的 JSONL 或 CSV 檔案。", "warning")
+        return redirect(url_for('index'))
+    # 上傳的檔案邊讀邊解析，每 decks.IMPORT_CHUNK 筆一個交易
+    text = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    rows = import_words.parse_pack(text, upload.filename.lower().endswith(".csv"), upload.filename)
+    result = decks.import_deck(get_db_connection(), current_user.id, rows)
+    word_cards.clear_memory()
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(result), 400 if "error" in result else 200
+    message = f"已匯入 {result['rows']:,} 筆：新加入列表 {result['added']:,} 個字，{result['skipped']:,} 個已在列表中。"
+    if "error" in result:
+        flash(f"{message} 之後的資料有誤，停止匯入：{result['error']}", "error")
+    else:
+        flash(message, "success")
+    return redirect(url_for('index'))
 
 @app.route('/add_to_my_list/<int:word_id>', methods=['POST'])
 @login_required
@@ -163,8 +352,6 @@ def add_to_my_list(word_id):
         flash("成功將單字加入你的列表！", "success")
     except sqlite3.IntegrityError:
         flash("這個單字已經在你的列表中了。", "info")
-    finally:
-        conn.close()
     return redirect(request.referrer or url_for('index'))
 
 @app.route('/add')
@@ -187,26 +374,24 @@ def add_manual():
             word_str = request.form['word']
             definition = request.form['definition']
             example_sentence = request.form.get('example_sentence', '')
-            cursor = conn.cursor()
-            
-            cursor.execute("""
+
+            conn.execute("""
                 INSERT INTO words (word, definition, example1) 
                 VALUES (?, ?, ?)
                 ON CONFLICT(word) DO NOTHING
             """, (word_str, definition, example_sentence))
             
-            word_id_row = cursor.execute('SELECT id FROM words WHERE word = ?', (word_str,)).fetchone()
+            word_id_row = conn.execute('SELECT id FROM words WHERE word = ?', (word_str,)).fetchone()
             if word_id_row:
-                cursor.execute("INSERT OR IGNORE INTO word_user_data (user_id, word_id) VALUES (?, ?)", (current_user.id, word_id_row['id']))
+                conn.execute("INSERT OR IGNORE INTO word_user_data (user_id, word_id) VALUES (?, ?)", (current_user.id, word_id_row['id']))
                 conn.commit()
+                word_cards.clear_memory()
                 flash(f"單字 '{word_str}' 已成功手動儲存並加入列表！", "success")
             else:
                 flash("新增失敗，可能發生預期外的錯誤。", "error")
         except Exception as e:
             conn.rollback()
             flash(f"儲存時發生錯誤: {e}", "error")
-        finally:
-            conn.close()
         return redirect(url_for('index'))
     return render_template('add_manual.html')
 
@@ -216,30 +401,40 @@ def lookup():
     query = request.form['word'].strip()
     if not query: return redirect(url_for('add_smart'))
     
+    conn = get_db_connection()
+    # 先查本機字典，真的找不到才呼叫 AI；source 記錄這次由哪一條路徑回應
     if contains_chinese(query):
-        # 處理中文建議
-        ai_result = get_english_suggestions_from_chinese(query)
-        if "error" in ai_result:
-            flash(ai_result['error'], "error")
-            return redirect(url_for('add_smart'))
-        return render_template('suggestion_list.html', suggestions=ai_result.get('suggestions', []), query=query)
+        # 處理中文建議：定義都是繁體中文，先用定義的反向索引找
+        suggestions, source = local_dict.suggest(conn, query), 'local'
+        if not suggestions:
+            ai_result = get_english_suggestions_from_chinese(query)
+            if "error" in ai_result:
+                flash(ai_result['error'], "error")
+                return redirect(url_for('add_smart'))
+            suggestions, source = ai_result.get('suggestions', []), 'ai'
+        response = make_response(render_template('suggestion_list.html', suggestions=suggestions, query=query, source=source))
     else:
         # 處理英文查詢
         query = query.lower()
-        ai_result = get_word_info(query)
-        if "error" in ai_result:
-            flash(f"AI 查詢時發生錯誤: {ai_result['error']}", "error")
-            return redirect(url_for('add_smart'))
+        ai_result, source = local_dict.find_word(conn, query), 'local'
+        if ai_result is None:
+            ai_result, source = get_word_info(query), 'ai'
+            if "error" in ai_result:
+                flash(f"AI 查詢時發生錯誤: {ai_result['error']}", "error")
+                return redirect(url_for('add_smart'))
 
         # 對齊介面使用的欄位名稱 (example_sentence 對應 example1)
-        return render_template('confirm_add.html', 
+        response = make_response(render_template('confirm_add.html', 
                                word=query,
                                definition=ai_result.get('definition', ''),
                                example_sentence=ai_result.get('example1', ''),
                                etymology=ai_result.get('etymology', {}),
                                synonyms=ai_result.get('relations', {}).get('synonyms', []),
                                antonyms=ai_result.get('relations', {}).get('antonyms', []),
-                               data=ai_result)
+                               data=ai_result,
+                               source=source))
+    response.headers['X-Lookup-Source'] = source
+    return response
 
 @app.route('/save', methods=['POST'])
 @login_required
@@ -258,55 +453,17 @@ def save():
         if not word_str:
             raise ValueError("單字不得為空")
 
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO words (word, definition, example1) 
-            VALUES (?, ?, ?)
-            ON CONFLICT(word) DO NOTHING
-        """, (word_str, definition, example_sentence))
-        
-        word_id = cursor.execute('SELECT id FROM words WHERE word = ?', (word_str,)).fetchone()['id']
-
-        for p_data in etymology.get('prefixes', []):
-            if 'part' in p_data and 'meaning' in p_data:
-                cursor.execute("INSERT OR IGNORE INTO prefixes (prefix, meaning) VALUES (?, ?)", (p_data['part'], p_data['meaning']))
-                prefix_id = cursor.execute('SELECT id FROM prefixes WHERE prefix = ?', (p_data['part'],)).fetchone()['id']
-                cursor.execute("INSERT OR IGNORE INTO word_prefixes (word_id, prefix_id) VALUES (?, ?)", (word_id, prefix_id))
-        
-        for r_data in etymology.get('roots', []):
-            if 'part' in r_data and 'meaning' in r_data:
-                cursor.execute("INSERT OR IGNORE INTO roots (root, meaning) VALUES (?, ?)", (r_data['part'], r_data['meaning']))
-                root_id = cursor.execute('SELECT id FROM roots WHERE root = ?', (r_data['part'],)).fetchone()['id']
-                cursor.execute("INSERT OR IGNORE INTO word_roots (word_id, root_id) VALUES (?, ?)", (word_id, root_id))
-
-        for s_data in etymology.get('suffixes', []):
-            if 'part' in s_data and 'meaning' in s_data:
-                cursor.execute("INSERT OR IGNORE INTO suffixes (suffix, meaning) VALUES (?, ?)", (s_data['part'], s_data['meaning']))
-                suffix_id = cursor.execute('SELECT id FROM suffixes WHERE suffix = ?', (s_data['part'],)).fetchone()['id']
-                cursor.execute("INSERT OR IGNORE INTO word_suffixes (word_id, suffix_id) VALUES (?, ?)", (word_id, suffix_id))
-
-        for syn_word in synonyms:
-            cursor.execute("INSERT OR IGNORE INTO words (word) VALUES (?)", (syn_word,))
-            syn_id = cursor.execute('SELECT id FROM words WHERE word = ?', (syn_word,)).fetchone()['id']
-            cursor.execute("INSERT OR IGNORE INTO synonyms (word1_id, word2_id) VALUES (?, ?)", (word_id, syn_id))
-            cursor.execute("INSERT OR IGNORE INTO synonyms (word1_id, word2_id) VALUES (?, ?)", (syn_id, word_id))
-        
-        for ant_word in antonyms:
-            cursor.execute("INSERT OR IGNORE INTO words (word) VALUES (?)", (ant_word,))
-            ant_id = cursor.execute('SELECT id FROM words WHERE word = ?', (ant_word,)).fetchone()['id']
-            cursor.execute("INSERT OR IGNORE INTO antonyms (word1_id, word2_id) VALUES (?, ?)", (word_id, ant_id))
-            cursor.execute("INSERT OR IGNORE INTO antonyms (word1_id, word2_id) VALUES (?, ?)", (ant_id, word_id))
-        
-        cursor.execute("INSERT OR IGNORE INTO word_user_data (user_id, word_id) VALUES (?, ?)", (current_user.id, word_id))
+        # 詞源與同/反義詞以批次語句寫入，語句數統計見 /api/stats/save
+        word_store.save_word(conn, current_user.id, word_str, definition, example_sentence,
+                             etymology, synonyms, antonyms)
 
         conn.commit()
+        word_cards.clear_memory()
         flash(f"單字 '{word_str}' 已成功儲存並加入列表！", "success")
 
     except Exception as e:
         conn.rollback()
         flash(f"儲存時發生嚴重錯誤: {e}", "error")
-    finally:
-        conn.close()
             
     return redirect(url_for('add_smart'))
 
@@ -316,7 +473,6 @@ def delete_word(word_id):
     conn = get_db_connection()
     conn.execute('DELETE FROM word_user_data WHERE word_id = ? AND user_id = ?', (word_id, current_user.id))
     conn.commit()
-    conn.close()
     flash("成功從你的列表中移除單字。", "success")
     return redirect(url_for('index'))
     
@@ -330,50 +486,52 @@ def edit_word(word_id):
 @login_required
 def level_view(level_num):
     conn = get_db_connection()
-    words = conn.execute('''
-        SELECT w.*, w.example1 AS example_sentence, ud.user_id 
-        FROM words w
-        LEFT JOIN word_user_data ud ON w.id = ud.word_id AND ud.user_id = ?
-        WHERE w.level = ? ORDER BY w.word
-    ''', (current_user.id, level_num)).fetchall()
-    conn.close()
-    return render_template('level_view.html', words=words, level_num=level_num)
+    # 目錄與列表成員都有行程內快取 (以版本號檢查)，不必每次 JOIN 整個級別再排序
+    words = level_catalog.catalog(conn, level_num)
+    if not words:
+        # 沒有這一級 (level 來自網址，任意數字都可能)
+        return render_template('level_view.html', words=(), in_list=(), level_num=level_num), 404
+    in_list = level_catalog.membership(conn, current_user.id)
+    return render_template('level_view.html', words=words, in_list=in_list, level_num=level_num)
 
 @app.route('/word/<int:word_id>')
 @login_required
 def word_detail(word_id):
-    conn = get_db_connection()
-    word = conn.execute('SELECT *, example1 AS example_sentence FROM words WHERE id = ?', (word_id,)).fetchone()
-    synonyms = conn.execute('SELECT w.* FROM words w JOIN synonyms s ON w.id = s.word2_id WHERE s.word1_id = ?', (word_id,)).fetchall()
-    antonyms = conn.execute('SELECT w.* FROM words w JOIN antonyms a ON w.id = a.word2_id WHERE a.word1_id = ?', (word_id,)).fetchall()
-    prefixes = conn.execute('SELECT p.* FROM prefixes p JOIN word_prefixes wp ON p.id = wp.prefix_id WHERE wp.word_id = ?', (word_id,)).fetchall()
-    roots = conn.execute('SELECT r.* FROM roots r JOIN word_roots wr ON r.id = wr.root_id WHERE wr.word_id = ?', (word_id,)).fetchall()
-    suffixes = conn.execute('SELECT s.* FROM suffixes s JOIN word_suffixes ws ON s.id = ws.suffix_id WHERE ws.word_id = ?', (word_id,)).fetchall()
-    conn.close()
-    return render_template('word_detail.html', word=word, synonyms=synonyms, antonyms=antonyms, prefixes=prefixes, roots=roots, suffixes=suffixes)
+    # 卡片內容是公共字典資料；ETag 加上使用者 id，同一個瀏覽器切換帳號時不會誤用
+    pending_flash = bool(session.get('_flashes'))
+    cached = word_cards.peek(word_id)
+    if cached and not pending_flash and request.if_none_match.contains(f"{cached[0]}-u{current_user.id}"):
+        return Response(status=304, headers={'ETag': f'"{cached[0]}-u{current_user.id}"'})
+    entry = word_cards.get_card(get_db_connection(), word_id)
+    if entry is None:
+        flash("找不到這個單字。", "error")
+        return redirect(url_for('index'))
+    etag, card = entry
+    response = make_response(render_template('word_detail.html', **card))
+    response.set_etag(f"{etag}-u{current_user.id}")
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request) if not pending_flash else response
 
 @app.route('/explore/<affix_type>/<int:affix_id>')
 @login_required
 def explore_by_affix(affix_type, affix_id):
     conn = get_db_connection()
-    affix, words, affix_type_display = None, [], ""
-    table_map = {
-        'prefix': ('prefixes', 'word_prefixes', 'prefix_id', '字首'),
-        'root': ('roots', 'word_roots', 'root_id', '字根'),
-        'suffix': ('suffixes', 'word_suffixes', 'suffix_id', '字尾')
-    }
-    if affix_type in table_map:
-        table, join_table, id_col, display = table_map[affix_type]
-        affix_type_display = display
-        affix = conn.execute(f'SELECT * FROM {table} WHERE id = ?', (affix_id,)).fetchone()
-        words = conn.execute(f'''
-            SELECT w.* FROM words w
-            JOIN {join_table} jt ON w.id = jt.word_id
-            JOIN word_user_data ud ON w.id = ud.word_id
-            WHERE jt.{id_col} = ? AND ud.user_id = ?
-        ''', (affix_id, current_user.id)).fetchall()
-    conn.close()
-    return render_template('explore_by_affix.html', affix=affix, words=words, affix_type_display=affix_type_display)
+    affix, in_list, others, affix_type_display = None, [], [], ""
+    # 類型只能是 affix_index.KINDS 的鍵 (表名不會來自使用者輸入)；單字由 (詞源, 單字) 反向索引取出
+    if affix_type in affix_index.KINDS:
+        affix_type_display = affix_index.KINDS[affix_type].display
+        affix = affix_index.get_affix(conn, affix_type, affix_id)
+        if affix:
+            in_list, others = affix_index.explore(conn, affix_type, affix_id, current_user.id)
+    return render_template('explore_by_affix.html', affix=affix, in_list=in_list, others=others,
+                           affix_type_display=affix_type_display)
+
+@app.route('/api/recommendations')
+@login_required
+def api_recommendations():
+    # 依與列表中的字共用的字首/字根/字尾數量推薦尚未加入的字典單字
+    limit = min(max(request.args.get('limit', affix_index.RECOMMEND_LIMIT, type=int), 1), affix_index.MAX_RECOMMEND_LIMIT)
+    return jsonify(affix_index.recommend(get_db_connection(), current_user.id, limit))
 
 
 # ==========================================
@@ -383,6 +541,8 @@ def explore_by_affix(affix_type, affix_id):
 @app.route('/review_choice')
 @login_required
 def review_choice():
+    # 使用者可能接著選綜合測驗，先在背景把故事池補滿
+    story_pool.request_refill(current_user.id)
     return render_template('review_choice.html')
 
 @app.route('/review/cloze')
@@ -394,15 +554,17 @@ def review_cloze():
 @login_required
 def api_next_word():
     conn = get_db_connection()
-    word = conn.execute('''
-        SELECT w.*, w.example1 AS example_sentence FROM words w
-        JOIN word_user_data ud ON w.id = ud.word_id
-        WHERE ud.user_id = ?
-        ORDER BY RANDOM() LIMIT 1
-    ''', (current_user.id,)).fetchone()
-    conn.close()
+    # 優先出到期的字；全部都還沒到期時，改用加權隨機讓使用者可以繼續練習
+    exclude = parse_id_list(request.args.get('exclude'))
+    word = srs.next_due(conn, current_user.id, exclude=exclude)
+    if not word:
+        # 列表中除了被排除的字之外沒有別的字時，才重複出題
+        words = sampler.sample_words(conn, current_user.id, exclude=exclude) or sampler.sample_words(conn, current_user.id)
+        word = words[0] if words else None
     if not word: return jsonify({"error": "No words in your list"}), 404
-    return jsonify(dict(word))
+    word = dict(word)
+    word['cloze_sentence'] = blanking.cloze(word.get('example_sentence'), word['word'])
+    return jsonify(word)
 
 @app.route('/api/check/cloze', methods=['POST'])
 @login_required
@@ -416,36 +578,90 @@ def check_cloze_api():
     
     is_correct = (guess == word['word'].lower())
     
-    cursor = conn.cursor()
-    if is_correct:
-        cursor.execute('UPDATE word_user_data SET review_count = review_count + 1, correct_count = correct_count + 1, last_reviewed = CURRENT_TIMESTAMP WHERE user_id = ? AND word_id = ?', (current_user.id, word_id))
-    else:
-        cursor.execute('UPDATE word_user_data SET review_count = review_count + 1, last_reviewed = CURRENT_TIMESTAMP WHERE user_id = ? AND word_id = ?', (current_user.id, word_id))
+    srs.record_review(conn, current_user.id, word_id, is_correct)
     conn.commit()
-    conn.close()
     
-    explanation = ""
-    if not is_correct:
-        explanation = get_wrong_answer_explanation(word['word'], word['definition'], guess, word['example_sentence'] or '')
-    
-    return jsonify({
+    # 評分結果立即回傳；答錯詳解改由 explanation_url 以 SSE 串流 (快取命中時直接附上)
+    result = {
         "is_correct": is_correct,
         "user_guess": guess,
         "correct_word": dict(word),
-        "explanation": explanation
-    })
+        "explanation": ""
+    }
+    if not is_correct:
+        result.update(explanation_handle(word, guess))
+    return jsonify(result)
+
+def explanation_handle(word, guess):
+    cached = get_cached_wrong_answer_explanation(word['word'], word['definition'], guess, word['example1'] or '')
+    if cached is not None:
+        return {"explanation": cached}
+    token = explanation_tokens.dumps({"w": word['id'], "g": guess})
+    return {"explanation_token": token, "explanation_url": url_for('stream_explanation', token=token)}
+
+def sse_event(data, event=None):
+    # 每段文字以 JSON 字串送出，換行不會破壞 SSE 格式
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/review/explanation/<token>')
+@login_required
+def stream_explanation(token):
+    try:
+        payload = explanation_tokens.loads(token, max_age=EXPLANATION_TOKEN_MAX_AGE)
+    except BadSignature:
+        return jsonify({"error": "Invalid or expired token"}), 400
+    conn = get_db_connection()
+    word = conn.execute('SELECT word, definition, example1 FROM words WHERE id = ?', (payload['w'],)).fetchone()
+    if not word: return jsonify({"error": "Word not found"}), 404
+    args = (word['word'], word['definition'], payload['g'], word['example1'] or '')
+
+    def generate():
+        for chunk in stream_wrong_answer_explanation(*args):
+            yield sse_event(chunk)
+        yield sse_event("", event="done")
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/review/session')
+@login_required
+def api_review_session():
+    # 一次回傳接下來 k 題 (只含前端需要的欄位)，exclude 為前端緩衝區中已有或尚未送出的字
+    conn = get_db_connection()
+    k = request.args.get('k', 10, type=int)
+    words = reviews.next_session_words(conn, current_user.id, k, parse_id_list(request.args.get('exclude')))
+    return jsonify({"words": words})
+
+@app.route('/api/review/batch', methods=['POST'])
+@login_required
+def submit_review_batch():
+    # review.html 在本地評分後累積作答，一次送出；同一個 attempt_id 重送不會重複計分
+    data = request.get_json(silent=True) or {}
+    conn = get_db_connection()
+    try:
+        graded = reviews.submit_batch(conn, current_user.id, data.get('session_id'), data.get('results', []))
+    except reviews.BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"results": graded})
+
+@app.route('/api/review/explanation', methods=['POST'])
+@login_required
+def review_explanation():
+    # 不寫入作答紀錄 (作答由 /api/review/batch 負責)；快取命中直接回傳，否則給串流用的 token
+    data = request.get_json(silent=True) or {}
+    conn = get_db_connection()
+    word = conn.execute('SELECT id, word, definition, example1 FROM words WHERE id = ?', (data.get('word_id'),)).fetchone()
+    if not word: return jsonify({"error": "Word not found"}), 404
+    guess = str(data.get('guess', '')).strip().lower()
+    return jsonify(explanation_handle(word, guess))
 
 @app.route('/review/sentence')
 @login_required
 def review_sentence():
     conn = get_db_connection()
-    word = conn.execute('''
-        SELECT w.* FROM words w
-        JOIN word_user_data ud ON w.id = ud.word_id
-        WHERE ud.user_id = ?
-        ORDER BY RANDOM() LIMIT 1
-    ''', (current_user.id,)).fetchone()
-    conn.close()
+    words = sampler.sample_words(conn, current_user.id)
+    word = words[0] if words else None
     if not word:
         flash("請先將單字加入列表，才能使用造句測驗！", "warning")
         return redirect(url_for('index'))
@@ -463,32 +679,30 @@ def check_sentence():
 @login_required
 def review_multi_cloze():
     conn = get_db_connection()
-    words = conn.execute('''
-        SELECT w.word FROM words w
-        JOIN word_user_data ud ON w.id = ud.word_id
-        WHERE ud.user_id = ?
-        ORDER BY RANDOM() LIMIT 3
-    ''', (current_user.id,)).fetchall()
-    conn.close()
-    
-    if len(words) < 3:
-        flash("單字量不足！請先將至少 3 個單字加入列表才能進行綜合測驗。", "warning")
-        return redirect(url_for('review_choice'))
-        
-    word_list = [w['word'] for w in words]
-    ai_data = generate_multi_word_cloze(word_list)
-    
-    if not ai_data or "error" in ai_data:
-        flash("AI 產生測驗時發生錯誤，請稍後再試。", "error")
-        return redirect(url_for('review_choice'))
-        
-    story = ai_data.get('story', '')
-    story_with_blanks = story
-    
-    # 建立動態輸入框
-    for idx, w in enumerate(word_list):
-        pattern = re.compile(r'\b' + re.escape(w) + r'\b', re.IGNORECASE)
-        story_with_blanks = pattern.sub(f'<input type="text" name="guess_{idx}" style="width: 120px; display: inline-block; padding: 2px; margin: 0 4px;" required>', story_with_blanks)
+    # 優先取背景預先寫好的故事；池子空了 (例如第一次使用) 才當場請 AI 產生
+    pooled = story_pool.take(conn, current_user.id)
+    if pooled:
+        word_list, story = pooled['words'], pooled['story']
+    else:
+        words = sampler.sample_words(conn, current_user.id, k=3, columns="word")
+
+        if len(words) < 3:
+            flash("單字量不足！請先將至少 3 個單字加入列表才能進行綜合測驗。", "warning")
+            return redirect(url_for('review_choice'))
+
+        word_list = [w['word'] for w in words]
+        ai_data = generate_multi_word_cloze(word_list)
+
+        if not ai_data or "error" in ai_data:
+            flash("AI 產生測驗時發生錯誤，請稍後再試。", "error")
+            return redirect(url_for('review_choice'))
+
+        story = ai_data.get('story', '')
+    # 一次掃描挖掉所有目標字 (含 abandoned / abandons 等變化形)
+    story_with_blanks = blanking.render(
+        story, word_list,
+        lambda idx, original: f'<input type="text" name="guess_{idx}" style="width: 120px; display: inline-block; padding: 2px; margin: 0 4px;" required>',
+        emphasize=False)
 
     shuffled_words = list(word_list)
     random.shuffle(shuffled_words)
@@ -504,16 +718,30 @@ def check_multi_cloze():
     correct_words = json.loads(request.form['correct_words_json'])
     score = 0
     total = len(correct_words)
-    
+    if not correct_words:
+        # 沒有空格可以計分 (IN () 也不是合法的 SQL)
+        return render_template('result_multi_cloze.html', score=0, total=0, result_story="")
+
+    conn = get_db_connection()
+    placeholders = ",".join("?" * len(correct_words))
+    word_ids = {row['word']: row['id'] for row in conn.execute(
+        f'SELECT id, word FROM words WHERE word IN ({placeholders})', correct_words)}
+
     details = []
+    now = srs.now_utc()
     for idx, correct_word in enumerate(correct_words):
         guess = request.form.get(f'guess_{idx}', '').strip().lower()
-        if guess == correct_word.lower():
+        is_correct = guess == correct_word.lower()
+        if correct_word in word_ids:
+            srs.record_review(conn, current_user.id, word_ids[correct_word], is_correct, now)
+        if is_correct:
             score += 1
             details.append(f"<span style='color:green;'>{correct_word} (✅ 答對)</span>")
         else:
             details.append(f"<span style='color:red; text-decoration: line-through;'>{guess}</span> ➡️ <span style='color:green;'>{correct_word}</span>")
     
+    conn.commit()
+
     result_story_html = "你的填寫結果對照：<br><br>" + "<br>".join([f"空格 {i+1}: {d}" for i, d in enumerate(details)])
     
     return render_template('result_multi_cloze.html', score=score, total=total, result_story=result_story_html)
@@ -0,0 +1,245 @@
+# bench.py - 在 synth_data.py 產生的資料庫上量測查詢與路由的延遲 (p50/p95/p99) 與每個請求的 SQL 語句數
+#
+# 用法：python bench.py bench.db [--iterations 200] [--users 200] [--json result.json] [--compare baseline.json]
+#                              [--ai synthetic|replay]
+#
+# 先在基準 commit 上存一份 --json，改動後再用 --compare 比較。預設不會呼叫 Gemini (GEMINI_API_KEY 會被清空)；
+# --ai 時改用離線的 AI 後端 (見 ai_providers，延遲與錯誤率用 AI_SYNTHETIC_* 調整) 並加入 AI 路由。
+# 寫入類的路由會改動資料庫，請用專門的副本。
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROUTE_WARMUP = 5
+
+
+def percentile(sorted_values, p):
+    """nearest-rank 百分位數。"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples):
+    timings = sorted(ms for ms, _ in samples)
+    queries = [q for _, q in samples]
+    return {
+        "n": len(samples),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "queries_avg": round(sum(queries) / len(queries), 2) if queries else 0,
+        "queries_max": max(queries) if queries else 0,
+    }
+
+
+def _measure(db, func):
+    statements = db.statement_count()
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000, db.statement_count() - statements
+
+
+class Fixtures:
+    """從資料庫中抽出樣本 (使用者、單字、詞源、搜尋字串)，讓每次執行的參數分布一致。"""
+
+    def __init__(self, conn, user_sample, rng):
+        self.rng = rng
+        user_ids = [r[0] for r in conn.execute("SELECT DISTINCT user_id FROM word_user_data")]
+        self.user_ids = rng.sample(user_ids, min(user_sample, len(user_ids)))
+        self.word_ids = [r[0] for r in conn.execute("SELECT id FROM words WHERE definition IS NOT NULL")]
+        self.words = {r[0]: r[1] for r in conn.execute("SELECT id, word FROM words")}
+        self.affixes = [
+            (kind, r[0])
+            for kind, table in (("prefix", "prefixes"), ("root", "roots"), ("suffix", "suffixes"))
+            for r in conn.execute(f"SELECT id FROM {table}")
+        ]
+        self.terms = [r[0] for r in conn.execute(
+            "SELECT DISTINCT term FROM definition_terms WHERE length(term) = 2 LIMIT 500")]
+
+    def user(self):
+        return self.rng.choice(self.user_ids)
+
+    def word_id(self):
+        return self.rng.choice(self.word_ids)
+
+    def search_query(self):
+        word = self.words[self.word_id()]
+        start = self.rng.randrange(max(1, len(word) - 3))
+        return word[start:start + 4]
+
+
+def sql_cases(fx):
+    """直接呼叫各模組的查詢函式 (不經過 Flask)；回傳 {名稱: fn(conn)}。"""
+    import affix_index
+    import local_dict
+    import reviews
+    import sampler
+    import search
+    import srs
+    import word_cards
+    import wordlist
+
+    return {
+        "search.search_user_words": lambda c: search.search_user_words(c, fx.user(), fx.search_query()),
+        "wordlist.user_words_page": lambda c: wordlist.user_words_page(c, fx.user()),
+        "sampler.sample_words(k=3)": lambda c: sampler.sample_words(c, fx.user(), k=3),
+        "srs.due_words(10)": lambda c: srs.due_words(c, fx.user(), 10),
+        "reviews.next_session_words(10)": lambda c: reviews.next_session_words(c, fx.user(), 10),
+        "word_cards._build": lambda c: word_cards._build(c, fx.word_id()),
+        "local_dict.find_word": lambda c: local_dict.find_word(c, fx.words[fx.word_id()]),
+        "local_dict.suggest": lambda c: local_dict.suggest(c, fx.rng.choice(fx.terms)) if fx.terms else None,
+        "affix_index.recommend(20)": lambda c: affix_index.recommend(c, fx.user(), 20),
+    }
+
+
+def route_cases(fx):
+    """(名稱, method, 產生 URL 與參數的函式)；只包含不會呼叫 AI 的路由。"""
+    def review_batch():
+        word_id = fx.word_id()
+        return {"json": {"session_id": "bench", "results": [{
+            "attempt_id": f"bench-{time.perf_counter_ns()}", "word_id": word_id,
+            "guess": fx.words[word_id], "answered_at": int(time.time() * 1000)}]}}
+
+    return [
+        ("GET /", "GET", lambda: ("/", {})),
+        ("GET /?query=", "GET", lambda: ("/", {"query_string": {"query": fx.search_query()}})),
+        ("GET /api/words", "GET", lambda: ("/api/words", {})),
+        ("GET /level/<n>", "GET", lambda: (f"/level/{fx.rng.randint(1, 6)}", {})),
+        ("GET /word/<id>", "GET", lambda: (f"/word/{fx.word_id()}", {})),
+        ("GET /explore/<type>/<id>", "GET", lambda: ("/explore/%s/%d" % fx.rng.choice(fx.affixes), {})),
+        ("GET /api/recommendations", "GET", lambda: ("/api/recommendations", {})),
+        ("GET /api/review/next_word", "GET", lambda: ("/api/review/next_word", {})),
+        ("GET /api/review/session", "GET", lambda: ("/api/review/session", {"query_string": {"k": 10}})),
+        ("POST /api/review/batch", "POST", lambda: ("/api/review/batch", review_batch())),
+    ]
+
+
+def ai_route_cases(fx):
+    """會呼叫 AI 的路由；每次的參數都不同，避免被 ai_cache 命中。"""
+    from app import explanation_tokens
+
+    counter = iter(range(10 ** 9))
+
+    def explanation():
+        token = explanation_tokens.dumps({"w": fx.word_id(), "g": f"bench{next(counter)}"})
+        return f"/api/review/explanation/{token}", {"buffered": True}
+
+    def chinese_term():
+        # 罕用字組合，本機定義索引查不到，一定會走 AI
+        return "".join(chr(0x9F00 + fx.rng.randrange(0xA0)) for _ in range(3))
+
+    return [
+        ("POST /lookup (AI)", "POST", lambda: ("/lookup", {"data": {"word": f"benchword{next(counter)}"}})),
+        ("POST /lookup 中文 (AI)", "POST", lambda: ("/lookup", {"data": {"word": chinese_term()}})),
+        ("POST /check_sentence", "POST", lambda: ("/check_sentence", {"data": {
+            "word": fx.words[fx.word_id()], "user_sentence": f"This is bench sentence {next(counter)}."}})),
+        ("GET /review/multi_cloze", "GET", lambda: ("/review/multi_cloze", {})),
+        ("GET /api/review/explanation/<token>", "GET", explanation),
+    ]
+
+
+def run(path, iterations, user_sample, seed, only=None, ai=None, report=print):
+    # 必須在 import app 之前設定：資料庫路徑、獨立的 AI 快取、不呼叫 Gemini
+    os.environ["DATABASE_PATH"] = path
+    os.environ["AI_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "ai_cache.db")
+    os.environ["GEMINI_API_KEY"] = ""
+    os.environ["AI_PROVIDER"] = ai or "gemini"
+    import db
+    from app import app
+
+    rng = random.Random(seed)
+    conn = db.connect(path)
+    fx = Fixtures(conn, user_sample, rng)
+    results = {}
+
+    for name, case in sql_cases(fx).items():
+        label = f"sql {name}"
+        if only and only not in label:
+            continue
+        samples = [_measure(db, lambda: case(conn)) for _ in range(iterations)]
+        results[label] = summarize(samples)
+        report(_format_row(label, results[label]))
+
+    client = app.test_client()
+    for name, method, make in route_cases(fx) + (ai_route_cases(fx) if ai else []):
+        label = f"route {name}"
+        if only and only not in label:
+            continue
+        samples = []
+        for i in range(iterations + ROUTE_WARMUP):
+            with client.session_transaction() as s:
+                s["_user_id"] = str(fx.user())
+                s["_fresh"] = True
+            url, kwargs = make()
+            response = []
+            sample = _measure(db, lambda: response.append(client.open(url, method=method, **kwargs)))
+            if response[0].status_code >= 400:
+                raise RuntimeError(f"{name} 回傳 {response[0].status_code}: {response[0].get_data(as_text=True)[:200]}")
+            if i >= ROUTE_WARMUP:
+                samples.append(sample)
+        results[label] = summarize(samples)
+        report(_format_row(label, results[label]))
+    conn.close()
+    return results
+
+
+def _format_row(name, r):
+    return (f"{name:<44} n={r['n']:<5} p50={r['p50_ms']:>8.2f}ms p95={r['p95_ms']:>8.2f}ms "
+            f"p99={r['p99_ms']:>8.2f}ms  queries={r['queries_avg']:.1f} (max {r['queries_max']})")
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, report=print):
+    report(f"\n與 {baseline.get('revision') or '基準'} 比較 (p95 / 查詢數)：")
+    for name, r in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            report(f"  {name:<44} (新項目)")
+            continue
+        change = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        flag = "  ⚠️" if change > 20 or r["queries_avg"] > old["queries_avg"] else ""
+        report(f"  {name:<44} p95 {old['p95_ms']:>8.2f} → {r['p95_ms']:>8.2f}ms ({change:+6.1f}%)  "
+               f"queries {old['queries_avg']:.1f} → {r['queries_avg']:.1f}{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQL 與路由延遲基準測試")
+    parser.add_argument("path", help="synth_data.py 產生的資料庫 (寫入類的路由會修改它)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--users", type=int, default=200, help="抽樣的使用者數")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", help="只執行名稱包含這個字串的項目")
+    parser.add_argument("--json", help="把結果存成 JSON")
+    parser.add_argument("--compare", help="與先前存下的 JSON 結果比較")
+    parser.add_argument("--ai", choices=("synthetic", "replay"), help="使用離線 AI 後端並加入會呼叫 AI 的路由")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"錯誤：找不到資料庫 '{args.path}'，請先執行 synth_data.py。")
+
+    output = {
+        "revision": _git_revision(),
+        "database": os.path.abspath(args.path),
+        "iterations": args.iterations,
+        "ai": args.ai,
+        "results": run(args.path, args.iterations, args.users, args.seed, args.only, args.ai),
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), output)
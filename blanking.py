@@ -0,0 +1,120 @@
+# blanking.py - 克漏字挖空與例句標示：每組目標字只編譯一個合併的 regex (含詞形變化)，一次掃描完成
+import re
+
+from markupsafe import Markup, escape
+
+from lru import LRUCache
+
+VOWELS = "aeiou"
+_MARKED = r"\*\*(?P<mark>.+?)\*\*"      # AI 例句中以 **搭配詞** 標出的片段
+
+_matchers = LRUCache(maxsize=1024)
+
+
+def inflections(word):
+    """產生常見的規則變化 (-s/-es/-ies、-ed/-d/-ied、-ing、重複字尾子音、-ly)；不規則變化不處理。"""
+    w = " ".join(word.split()).lower()
+    forms = {w}
+    if not w.isalpha():
+        return forms        # 片語、連字號等只比對原形
+    if w.endswith(("s", "x", "z", "ch", "sh")):
+        forms.add(w + "es")
+    elif len(w) > 1 and w.endswith("y") and w[-2] not in VOWELS:
+        forms.add(w[:-1] + "ies")
+    else:
+        forms.add(w + "s")
+
+    if w.endswith("ee"):
+        forms.update((w + "d", w + "ing"))
+    elif w.endswith("e"):
+        forms.update((w + "d", w[:-1] + "ing"))
+    elif len(w) > 1 and w.endswith("y") and w[-2] not in VOWELS:
+        forms.update((w[:-1] + "ied", w + "ing"))
+    else:
+        forms.update((w + "ed", w + "ing"))
+        # 子音-母音-子音結尾 (stop → stopped)；多音節字不一定重複，兩種都列入
+        if len(w) >= 3 and w[-1] not in VOWELS + "wxy" and w[-2] in VOWELS and w[-3] not in VOWELS:
+            forms.update((w + w[-1] + "ed", w + w[-1] + "ing"))
+
+    if w.endswith("le"):
+        forms.add(w[:-1] + "y")
+    elif len(w) > 1 and w.endswith("y") and w[-2] not in VOWELS:
+        forms.add(w[:-1] + "ily")
+    elif not w.endswith("ly"):
+        forms.add(w + "ly")
+    return forms
+
+
+def _form_pattern(form):
+    # 片語中的空白允許換行或多個空白
+    return r"\s+".join(re.escape(part) for part in form.split())
+
+
+def matcher(words):
+    """回傳 (compiled regex, {小寫詞形: 目標字索引})；同一組目標字只編譯一次。"""
+    key = tuple(" ".join(w.split()).lower() for w in words)
+    cached = _matchers.get(key)
+    if cached is not None:
+        return cached
+    forms = {}
+    for index, word in enumerate(key):
+        for form in inflections(word):
+            forms.setdefault(form, index)       # 兩個目標字共用詞形時歸給前面那個
+    if forms:
+        # 長的排前面，避免 "abandon" 先吃掉 "abandoned" 的前半段
+        alternation = "|".join(_form_pattern(f) for f in sorted(forms, key=len, reverse=True))
+        pattern = re.compile(rf"{_MARKED}|\b(?P<word>{alternation})\b", re.IGNORECASE | re.DOTALL)
+    else:
+        pattern = re.compile(_MARKED, re.DOTALL)
+    cached = (pattern, forms)
+    _matchers.set(key, cached)
+    return cached
+
+
+def _index_of(forms, text):
+    return forms.get(" ".join(text.lower().split()))
+
+
+def render(text, words=(), blank=None, emphasize=True):
+    """跳脫 HTML 後回傳 Markup：目標字 (含變化形) 交給 blank(index, 原文) 產生替代內容，
+    **搭配詞** 轉成 <strong> (emphasize=False 時只去掉星號)。blank 為 None 時不挖空。"""
+    if not text:
+        return Markup("")
+    pattern, forms = matcher(words if blank else ())
+    pieces, pos = [], 0
+    for m in pattern.finditer(text):
+        pieces.append(escape(text[pos:m.start()]))
+        pos = m.end()
+        if m.group("mark") is not None:
+            inner = render(m.group("mark"), words, blank, emphasize=False) if blank else escape(m.group("mark"))
+            pieces.append(Markup("<strong>%s</strong>") % inner if emphasize else inner)
+        else:
+            pieces.append(Markup(blank(_index_of(forms, m.group("word")), m.group("word"))))
+    pieces.append(escape(text[pos:]))
+    return Markup("").join(pieces)
+
+
+def blank_count(text, words):
+    """每個目標字 (含變化形) 在文中出現的次數；用來確認故事真的用到每個字。"""
+    counts = [0] * len(words)
+
+    def count(index, original):
+        counts[index] += 1
+        return ""
+
+    render(text, words, count)
+    return counts
+
+
+def emphasize(text):
+    """例句的 **搭配詞** 標示 (Jinja filter)。"""
+    return render(text)
+
+
+def cloze(text, word, placeholder="_______"):
+    """單字填空題的例句：挖掉目標字及其變化形，並去掉 ** 標記。"""
+    return str(render(text, [word], lambda index, original: placeholder, emphasize=False))
+
+
+def stats():
+    return _matchers.stats()
@@ -0,0 +1,18 @@
+# conftest.py - 測試共用的 fixture：每個測試一個全新的資料庫 (基本資料表 + 所有 migration)
+import pytest
+
+import db
+import schema
+import word_cards
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = db.connect(str(tmp_path / "test.db"))
+    schema.create_base_tables(conn)
+    schema.migrate(conn)
+    conn.execute("INSERT INTO users (username, password) VALUES ('tester', '!')")
+    conn.commit()
+    word_cards.clear_memory()       # 卡片快取以 word_id 為鍵，不同測試的資料庫會重複使用 id
+    yield conn
+    conn.close()
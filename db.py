@@ -0,0 +1,199 @@
+# db.py - SQLite 連線池與效能調校
+import os
+import queue
+import sqlite3
+import threading
+import time
+from flask import g
+
+import schema
+
+DB_FILE = os.getenv("DATABASE_PATH", "vocabulary.db")
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+STATEMENT_CACHE_SIZE = 256          # 每條連線快取的 prepared statement 數量
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 20000               # 約 20MB page cache
+MMAP_SIZE = 256 * 1024 * 1024       # 256MB
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()              # 每個執行緒送出的語句數與耗時 (見 statement_count、start_profile)
+_stats_lock = threading.Lock()
+_stats = {
+    "connections_opened": 0,
+    "connections_closed": 0,
+    "checkouts": 0,
+    "reuses": 0,
+    "overflow": 0,
+    "in_use": 0,
+    "lock_waits": 0,
+    "lock_wait_total_ms": 0.0,
+    "lock_wait_max_ms": 0.0,
+    "busy_errors": 0,
+}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _record_lock_wait(ms):
+    with _stats_lock:
+        _stats["lock_waits"] += 1
+        _stats["lock_wait_total_ms"] += ms
+        _stats["lock_wait_max_ms"] = max(_stats["lock_wait_max_ms"], ms)
+
+
+def _record_statement(sql, started):
+    ms = (time.perf_counter() - started) * 1000
+    _local.statements = getattr(_local, "statements", 0) + 1
+    _local.sql_ms = getattr(_local, "sql_ms", 0.0) + ms
+    profile = getattr(_local, "profile", None)
+    if profile is not None:
+        entry = profile.get(sql)
+        if entry is None:
+            profile[sql] = [1, ms]
+        else:
+            entry[0] += 1
+            entry[1] += ms
+
+
+class PooledConnection(sqlite3.Connection):
+    """量測取得寫入鎖所花的時間 (BEGIN IMMEDIATE 到下一個語句開始之間)，並記錄每個執行緒送出的語句數與耗時。
+
+    trace callback 只在語句開始時觸發、沒有結束時間，所以耗時在 execute / executemany 中量測：
+    寫入語句是完整的執行時間，SELECT 是編譯加上取得第一列的時間 (之後逐列讀取不計入)。
+    只有 conn.execute / executemany 會被計入；conn.cursor().execute 不經過這裡，應用程式碼不要使用。"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._begin_started = None
+        self.set_trace_callback(self._trace)
+
+    def execute(self, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args, **kwargs)
+        finally:
+            _record_statement(sql, started)
+
+    def executemany(self, sql, *args, **kwargs):
+        # executemany 算一次 (與 word_store 的語句預算一致)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args, **kwargs)
+        finally:
+            _record_statement(sql, started)
+
+    def _trace(self, statement):
+        if self._begin_started is not None:
+            _record_lock_wait((time.perf_counter() - self._begin_started) * 1000)
+            self._begin_started = None
+        if statement.startswith("BEGIN IMMEDIATE"):
+            self._begin_started = time.perf_counter()
+
+
+def connect(path=None):
+    """建立一條已調校好的連線；連線池與離線腳本共用。"""
+    # isolation_level='IMMEDIATE'：在第一個寫入語句前就取得寫入鎖，
+    # 避免 deferred 交易升級時直接丟出 "database is locked" 而不等待 busy_timeout。
+    conn = sqlite3.connect(
+        path or DB_FILE,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level="IMMEDIATE",
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=PooledConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    _bump("connections_opened")
+    return conn
+
+
+def init_schema(path=None):
+    """啟動時套用尚未執行的 schema 升級。"""
+    conn = connect(path)
+    try:
+        schema.migrate(conn)
+    finally:
+        conn.close()
+        _bump("connections_closed")
+
+
+def _checkout():
+    try:
+        conn = _pool.get_nowait()
+        _bump("reuses")
+    except queue.Empty:
+        conn = connect()
+    _bump("checkouts")
+    _bump("in_use")
+    return conn
+
+
+def _checkin(conn):
+    _bump("in_use", -1)
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        # 超出池子大小的臨時連線直接關閉
+        _bump("overflow")
+        _bump("connections_closed")
+        conn.close()
+
+
+def get_connection():
+    """在目前的 app context 中取得 (並重用) 同一條連線。"""
+    if "db_conn" not in g:
+        g.db_conn = _checkout()
+    return g.db_conn
+
+
+def release_connection(exc=None):
+    """teardown_appcontext 使用：把連線還回池子。"""
+    conn = g.pop("db_conn", None)
+    if exc is not None and isinstance(exc, sqlite3.OperationalError) and "locked" in str(exc):
+        _bump("busy_errors")
+    if conn is not None:
+        _checkin(conn)
+
+
+def statement_count():
+    """目前執行緒透過 conn.execute / executemany 送出的語句累計數；前後相減即可得到單一請求的查詢數。"""
+    return getattr(_local, "statements", 0)
+
+
+def statement_time_ms():
+    """目前執行緒的語句累計耗時 (毫秒)；用法同 statement_count。"""
+    return getattr(_local, "sql_ms", 0.0)
+
+
+def start_profile():
+    """開始記錄目前執行緒每個語句 (原始 SQL 文字) 的次數與耗時，直到 stop_profile。"""
+    _local.profile = {}
+
+
+def stop_profile():
+    """結束記錄並回傳 {sql: [次數, 毫秒]}；沒有 start_profile 時回傳空 dict。"""
+    profile = getattr(_local, "profile", None)
+    _local.profile = None
+    return profile or {}
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["idle"] = _pool.qsize()
+    snapshot["pool_size"] = POOL_SIZE
+    snapshot["statement_cache_size"] = STATEMENT_CACHE_SIZE
+    if snapshot["lock_waits"]:
+        snapshot["lock_wait_avg_ms"] = snapshot["lock_wait_total_ms"] / snapshot["lock_waits"]
+    return snapshot
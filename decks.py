@@ -0,0 +1,191 @@
+# decks.py - 個人單字列表的串流匯出 (JSONL / CSV) 與匯入：分段讀寫，記憶體用量與列表大小無關
+#
+# 匯出格式就是 import_words 的單字包格式，另外附上每個字的學習進度 (progress)；
+# 匯入時只新增字典沒有的字，已在列表中的字保留原本的進度。
+import csv
+import io
+import json
+import math
+import threading
+from datetime import datetime
+
+import import_words
+import srs
+
+EXPORT_CHUNK = 400          # 每段讀幾個字 (同/反義詞查詢的 IN (...) 會用到兩倍的參數)
+IMPORT_CHUNK = 500          # 每個交易寫入幾筆
+FORMATS = {                 # 不含 charset (由路由加上 content_type)
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+}
+CSV_FIELDS = (*import_words.WORD_FIELDS, "prefixes", "roots", "suffixes", "synonyms", "antonyms",
+              *import_words.PROGRESS_FIELDS)
+MAX_COUNT = 1_000_000
+
+_stats_lock = threading.Lock()
+_stats = {"exports": 0, "exported_words": 0, "imports": 0, "imported_rows": 0, "added_to_lists": 0}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+# --- 匯出 ---
+
+def _pages(conn, user_id, chunk_size):
+    """依 word_id 做 keyset 分段：每段是獨立的短查詢 (走主鍵)，下載再久也不會一直佔著同一個讀取快照。"""
+    columns = ", ".join([*(f"w.{f}" for f in import_words.WORD_FIELDS),
+                         *(f"ud.{f}" for f in import_words.PROGRESS_FIELDS)])
+    after = 0
+    while True:
+        rows = conn.execute(f"""
+            SELECT w.id, {columns}
+            FROM word_user_data ud
+            JOIN words w ON w.id = ud.word_id
+            WHERE ud.user_id = ? AND ud.word_id > ?
+            ORDER BY ud.word_id
+            LIMIT ?
+        """, (user_id, after, chunk_size)).fetchall()
+        if not rows:
+            return
+        after = rows[-1]["id"]
+        yield rows
+
+
+def _details(conn, word_ids):
+    """這一段單字的詞源與同/反義詞：{word_id: etymology}, {word_id: relations}。"""
+    placeholders = ",".join("?" * len(word_ids))
+    etymology = {word_id: {key: [] for key, *_ in import_words.AFFIX_TABLES} for word_id in word_ids}
+    for key, table, column, link_table, link_column in import_words.AFFIX_TABLES:
+        for word_id, part, meaning in conn.execute(f"""
+            SELECT l.word_id, a.{column}, a.meaning
+            FROM {link_table} l JOIN {table} a ON a.id = l.{link_column}
+            WHERE l.word_id IN ({placeholders})
+        """, word_ids):
+            etymology[word_id][key].append({"part": part, "meaning": meaning})
+    relations = {word_id: {"synonyms": [], "antonyms": []} for word_id in word_ids}
+    for kind in ("synonyms", "antonyms"):
+        for word_id, word in conn.execute(f"""
+            SELECT t.word1_id, w.word FROM {kind} t JOIN words w ON w.id = t.word2_id
+            WHERE t.word1_id IN ({placeholders})
+            UNION ALL
+            SELECT t.word2_id, w.word FROM {kind} t JOIN words w ON w.id = t.word1_id
+            WHERE t.word2_id IN ({placeholders})
+        """, word_ids + word_ids):
+            relations[word_id][kind].append(word)
+    return etymology, relations
+
+
+def _records(conn, rows):
+    word_ids = [r["id"] for r in rows]
+    etymology, relations = _details(conn, word_ids)
+    for r in rows:
+        data = {f: r[f] for f in import_words.WORD_FIELDS}
+        data["etymology"] = etymology[r["id"]]
+        data["relations"] = relations[r["id"]]
+        data["progress"] = {f: r[f] for f in import_words.PROGRESS_FIELDS}
+        yield data
+
+
+def _csv_values(data):
+    values = [data[f] for f in import_words.WORD_FIELDS]
+    for key, *_ in import_words.AFFIX_TABLES:
+        values.append("|".join(f"{p['part']}={p['meaning'] or ''}" for p in data["etymology"][key]))
+    values += ["|".join(data["relations"]["synonyms"]), "|".join(data["relations"]["antonyms"])]
+    values += [data["progress"][f] for f in import_words.PROGRESS_FIELDS]
+    return values
+
+
+def export(conn, user_id, fmt, chunk_size=EXPORT_CHUNK):
+    """逐段產生匯出內容 (str)，給 Flask 的串流回應使用。"""
+    _bump("exports")
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM 讓 Excel 以 UTF-8 開啟 (import_words 以 utf-8-sig 讀取)
+        writer.writerow(CSV_FIELDS)
+        yield "\ufeff" + buffer.getvalue()
+    for rows in _pages(conn, user_id, chunk_size):
+        if fmt == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(_csv_values(data) for data in _records(conn, rows))
+            chunk = buffer.getvalue()
+        else:
+            chunk = "".join(json.dumps(data, ensure_ascii=False) + "\n" for data in _records(conn, rows))
+        _bump("exported_words", len(rows))
+        yield chunk
+
+
+# --- 匯入 ---
+
+def _number(progress, key, cast, low, high, default):
+    try:
+        value = cast(float(progress[key]))
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return default
+    return min(high, max(low, value)) if math.isfinite(value) else default
+
+
+def _timestamp(progress, key):
+    try:
+        return srs.format_time(datetime.strptime(progress[key], srs.TIME_FORMAT))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def progress_values(data):
+    """檢查並整理上傳的學習進度；缺少或不合法的欄位用新字的預設值 (due_at 為 None 時由觸發器設為現在)。"""
+    progress = data.get("progress")
+    if not isinstance(progress, dict):
+        progress = {}
+    review_count = _number(progress, "review_count", int, 0, MAX_COUNT, 0)
+    return (
+        review_count,
+        _number(progress, "correct_count", int, 0, review_count, 0),
+        _timestamp(progress, "last_reviewed"),
+        _number(progress, "ease", float, srs.MIN_EASE, srs.MAX_EASE, srs.DEFAULT_EASE),
+        _number(progress, "interval_days", float, 0.0, srs.MAX_INTERVAL_DAYS, 0.0),
+        _number(progress, "repetitions", int, 0, MAX_COUNT, 0),
+        _timestamp(progress, "due_at"),
+    )
+
+
+def import_deck(conn, user_id, rows, chunk_size=IMPORT_CHUNK):
+    """rows 為 import_words.parse_pack 產生的資料；每段一個交易：先把字典沒有的字補上，再加入使用者的列表。
+
+    回傳 {"rows", "added", "skipped"}；資料格式錯誤時已寫入的段落保留，並附上 "error"。"""
+    importer = import_words.ChunkImporter(conn)
+    result = {"rows": 0, "added": 0, "skipped": 0}
+    _bump("imports")
+    try:
+        for chunk in import_words.chunks(rows, chunk_size):
+            chunk = [r for r in chunk if isinstance(r, dict) and isinstance(r.get("word"), str) and r["word"].strip()]
+            for r in chunk:
+                r["word"] = r["word"].strip()
+            try:
+                importer.write_chunk(chunk, overwrite=False)
+                cur = conn.executemany("""
+                    INSERT INTO word_user_data (user_id, word_id, review_count, correct_count, last_reviewed,
+                                                ease, interval_days, repetitions, due_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id, word_id) DO NOTHING
+                """, [(user_id, importer.word_ids[r["word"]], *progress_values(r)) for r in chunk])
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            result["rows"] += len(chunk)
+            result["added"] += cur.rowcount
+            result["skipped"] += len(chunk) - cur.rowcount
+            _bump("imported_rows", len(chunk))
+            _bump("added_to_lists", cur.rowcount)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        result["error"] = str(e)
+    return result
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
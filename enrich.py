@@ -0,0 +1,243 @@
+# enrich.py - 補齊空白單字：/save 與匯入時為同/反義詞建立的 words 列只有 word 欄位，
+# 由這個 worker 行程從 enrich_jobs 佇列 (SQLite，不需要外部 broker) 取出工作，呼叫 get_word_info 補上內容。
+#
+# 用法：python enrich.py [--workers 4] [--rate 1.0] [--batch-size 20] [--once] [--db vocabulary.db]
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import db
+import import_words
+import local_dict
+import schema
+import srs
+from a_gemini_tool import get_word_info
+
+WORKERS = 4                 # 同時進行的 AI 呼叫數
+RATE_PER_SECOND = 1.0       # 所有執行緒合計每秒最多幾次 AI 呼叫
+BATCH_SIZE = 20             # 每次領取並在同一個交易中寫回的工作數
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 30   # 第 n 次失敗後等待 BASE * 2^(n-1) 秒 (含隨機抖動)
+BACKOFF_MAX_SECONDS = 3600
+STALE_SECONDS = 600         # 超過這段時間仍是 running 的工作視為 worker 中途掛掉，放回佇列
+IDLE_SLEEP_SECONDS = 30
+
+STATUSES = ("pending", "running", "done", "failed")
+
+
+class RateLimiter:
+    """平均分配呼叫時間點；多執行緒共用。rate_per_second <= 0 表示不限速。"""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+# --- 佇列 ---
+
+def counts(conn):
+    """各狀態的工作數。"""
+    result = dict.fromkeys(STATUSES, 0)
+    result.update(conn.execute("SELECT status, COUNT(*) FROM enrich_jobs GROUP BY status"))
+    return result
+
+
+def job_status(conn, word_id):
+    row = conn.execute("""
+        SELECT j.word_id, w.word, j.status, j.attempts, j.next_attempt_at, j.last_error, j.updated_at
+        FROM enrich_jobs j JOIN words w ON w.id = j.word_id
+        WHERE j.word_id = ?
+    """, (word_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def reset_stale(conn, now=None):
+    now = now or srs.now_utc()
+    cur = conn.execute(
+        "UPDATE enrich_jobs SET status = 'pending' WHERE status = 'running' AND updated_at < ?",
+        (srs.format_time(now - timedelta(seconds=STALE_SECONDS)),),
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+def release(conn, word_ids):
+    """把領取後沒處理完的工作放回佇列 (不計入嘗試次數)。"""
+    conn.rollback()
+    conn.executemany("""
+        UPDATE enrich_jobs SET status = 'pending', attempts = attempts - 1 WHERE word_id = ? AND status = 'running'
+    """, [(word_id,) for word_id in word_ids])
+    conn.commit()
+
+
+def claim(conn, limit, now=None):
+    """領取最多 limit 個已到期的工作並標成 running；回傳 [(word_id, word, attempts, already_filled), ...]。"""
+    now = srs.format_time(now or srs.now_utc())
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        jobs = conn.execute("""
+            UPDATE enrich_jobs SET status = 'running', attempts = attempts + 1, updated_at = ?
+            WHERE word_id IN (
+                SELECT word_id FROM enrich_jobs
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT ?
+            )
+            RETURNING word_id, attempts
+        """, (now, now, limit)).fetchall()
+        attempts = {row["word_id"]: row["attempts"] for row in jobs}
+        claimed = []
+        if attempts:
+            for row in conn.execute(f"""
+                SELECT id, word, definition IS NOT NULL AS filled FROM words
+                WHERE id IN ({','.join('?' * len(attempts))})
+            """, list(attempts)):
+                claimed.append((row["id"], row["word"], attempts[row["id"]], bool(row["filled"])))
+        conn.commit()
+        return claimed
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# --- 處理 ---
+
+def _fetch(word, limiter):
+    """呼叫 AI；回傳 (資料, 錯誤訊息)。"""
+    limiter.wait()
+    try:
+        data = get_word_info(word)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    if not isinstance(data, dict):
+        return None, "AI 回傳格式錯誤"
+    if "error" in data:
+        return None, str(data["error"])
+    if not data.get("definition"):
+        return None, "AI 回傳的資料缺少 definition"
+    return data, None
+
+
+def apply_results(conn, importer, results, now=None):
+    """在同一個交易裡寫回一批結果；回傳 (補齊數, 重試數, 放棄數)。"""
+    now = now or srs.now_utc()
+    stamp = srs.format_time(now)
+    done, retry, failed = [], [], []
+    rows = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # 等待 AI 期間使用者可能已經自己存了完整資料，那些字不要覆寫
+        word_ids = [job[0] for job, _, _ in results]
+        still_empty = {
+            row[0] for row in conn.execute(
+                f"SELECT id FROM words WHERE definition IS NULL AND id IN ({','.join('?' * len(word_ids))})", word_ids)
+        } if word_ids else set()
+        for (word_id, word, attempts, _), data, error in results:
+            if data is not None:
+                # AI 回傳的結構不對時當成這次失敗 (重試或放棄)，不要讓整批寫入失敗
+                try:
+                    data = dict(data, word=word)
+                    import_words.check_row(data)
+                except (TypeError, ValueError) as e:
+                    data, error = None, f"回傳格式錯誤：{e}"
+            if word_id not in still_empty:
+                done.append((stamp, word_id))
+            elif data is not None:
+                # 只連結已存在的同/反義詞，避免補一個字又產生一批新的空白字
+                relations = data.get("relations") or {}
+                data["relations"] = {
+                    kind: [w for w in relations.get(kind) or [] if w in importer.word_ids]
+                    for kind in ("synonyms", "antonyms")
+                }
+                rows.append(data)
+                done.append((stamp, word_id))
+            elif attempts >= MAX_ATTEMPTS:
+                failed.append((error, stamp, word_id))
+            else:
+                retry.append((srs.format_time(now + timedelta(seconds=backoff_seconds(attempts))), error, stamp, word_id))
+        importer.write_chunk(rows)
+        conn.executemany(
+            "UPDATE enrich_jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE word_id = ?", done)
+        conn.executemany("""
+            UPDATE enrich_jobs SET status = 'pending', next_attempt_at = ?, last_error = ?, updated_at = ?
+            WHERE word_id = ?
+        """, retry)
+        conn.executemany(
+            "UPDATE enrich_jobs SET status = 'failed', last_error = ?, updated_at = ? WHERE word_id = ?", failed)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(done), len(retry), len(failed)
+
+
+def run(conn, workers=WORKERS, rate=RATE_PER_SECOND, batch_size=BATCH_SIZE, once=False, report=print):
+    """持續處理佇列；once=True 時佇列中沒有到期的工作就結束。回傳累計 (補齊, 重試, 放棄)。"""
+    stale = reset_stale(conn)
+    if stale:
+        report(f"把 {stale} 個中斷的工作放回佇列。")
+    importer = import_words.Importer(conn)
+    limiter = RateLimiter(rate)
+    totals = [0, 0, 0]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich") as pool:
+        while True:
+            jobs = claim(conn, batch_size)
+            if not jobs:
+                if once:
+                    break
+                time.sleep(IDLE_SLEEP_SECONDS)
+                continue
+            try:
+                # 已經被補齊的字不必呼叫 AI
+                fetched = list(pool.map(
+                    lambda job: (job, *((None, None) if job[3] else _fetch(job[1], limiter))), jobs
+                ))
+                for i, n in enumerate(apply_results(conn, importer, fetched)):
+                    totals[i] += n
+            except BaseException:
+                release(conn, [job[0] for job in jobs])
+                raise
+            # 補上的定義順便寫進中文反向索引
+            local_dict.sync_index(conn)
+            elapsed = time.perf_counter() - started
+            queue = counts(conn)
+            report(f"  已補齊 {totals[0]:,} 筆、待重試 {totals[1]:,}、放棄 {totals[2]:,}；"
+                   f"佇列剩 {queue['pending']:,} 筆 ({totals[0] / elapsed * 60:,.1f} 筆/分)")
+    return tuple(totals)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用 AI 補齊只有拼字的空白單字")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="同時進行的 AI 呼叫數")
+    parser.add_argument("--rate", type=float, default=RATE_PER_SECOND, help="每秒最多幾次 AI 呼叫 (0 表示不限)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--once", action="store_true", help="處理完目前到期的工作就結束")
+    parser.add_argument("--db", default=None, help="資料庫路徑 (預設為 DATABASE_PATH 或 vocabulary.db)")
+    args = parser.parse_args()
+    conn = db.connect(args.db)
+    try:
+        schema.migrate(conn)
+        print(f"佇列狀態：{counts(conn)}")
+        done, retry, failed = run(conn, args.workers, args.rate, args.batch_size, args.once)
+        print(f"🎉 結束：補齊 {done:,} 筆、待重試 {retry:,} 筆、放棄 {failed:,} 筆。")
+    except KeyboardInterrupt:
+        print("已中斷，進行中的工作已放回佇列。")
+    finally:
+        conn.close()
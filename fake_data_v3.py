@@ -53,16 +53,22 @@ user_id = user[0]
 for item in hard_words:
     # 存入單字表
     cursor.execute('''
-        INSERT OR REPLACE INTO words (word, level, part_of_speech, definition, collocation, mnemonic, example1)
+        INSERT INTO words (word, level, part_of_speech, definition, collocation, mnemonic, example1)
         VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(word) DO UPDATE SET
+            level = excluded.level, part_of_speech = excluded.part_of_speech, definition = excluded.definition,
+            collocation = excluded.collocation, mnemonic = excluded.mnemonic, example1 = excluded.example1
     ''', (item['word'], 6, item['pos'], item['def'], item['col'], item['mne'], item['ex']))
 
     # 存入使用者學習紀錄
     word_id = cursor.execute('SELECT id FROM words WHERE word = ?', (item['word'],)).fetchone()[0]
     now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     cursor.execute('''
-        INSERT OR REPLACE INTO word_user_data (user_id, word_id, review_count, correct_count, last_reviewed)
+        INSERT INTO word_user_data (user_id, word_id, review_count, correct_count, last_reviewed)
         VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, word_id) DO UPDATE SET
+            review_count = excluded.review_count, correct_count = excluded.correct_count,
+            last_reviewed = excluded.last_reviewed
     ''', (user_id, word_id, item['reviews'], item['correct'], now))
 
 conn.commit()
@@ -0,0 +1,225 @@
+# gemini_client.py - 共用的 AI 呼叫層：每次呼叫的期限、指數退避重試、對沖請求、併發上限
+#
+# 實際送出請求的後端由 ai_providers 決定 (AI_PROVIDER：gemini / record / replay / synthetic)。
+# 所有非同步呼叫都跑在同一個背景事件迴圈上 (gRPC aio 連線綁定在建立它的迴圈)，
+# Flask 路由透過 generate() 同步等待結果，不必自己管理事件迴圈。
+import asyncio
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+import ai_providers
+
+load_dotenv()
+
+DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "30"))          # 一次呼叫 (含重試) 的總期限
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT_SECONDS", "20"))
+MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+# 超過這個時間還沒回應就再送一個相同的請求，取先回來的那個；0 = 不對沖
+HEDGE_AFTER_SECONDS = float(os.getenv("GEMINI_HEDGE_AFTER_SECONDS", "0"))
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+RETRYABLE = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    TimeoutError,
+)
+
+
+class GeminiError(RuntimeError):
+    """重試用盡、超過期限或上游回傳無法重試的錯誤。"""
+
+
+class GeminiUnavailable(GeminiError):
+    """沒有設定 GEMINI_API_KEY 或模型初始化失敗。"""
+
+
+provider = ai_providers.from_env()
+
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "errors": 0, "in_flight": 0,
+          "prompt_tokens": 0, "output_tokens": 0}
+_local = threading.local()      # 呼叫端執行緒累計的 token 數 (見 token_usage)
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _record_usage(usage):
+    prompt_tokens, output_tokens = usage
+    _bump("prompt_tokens", prompt_tokens)
+    _bump("output_tokens", output_tokens)
+    _local.prompt_tokens = getattr(_local, "prompt_tokens", 0) + prompt_tokens
+    _local.output_tokens = getattr(_local, "output_tokens", 0) + output_tokens
+
+
+def token_usage():
+    """目前執行緒透過 generate / stream 用掉的 (prompt, output) token 累計數；前後相減即可得到單次呼叫的用量。"""
+    return getattr(_local, "prompt_tokens", 0), getattr(_local, "output_tokens", 0)
+
+
+def _get_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="gemini-client", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def set_provider(new_provider):
+    """換掉後端 (bench.py 與手動測試用)；回傳原本的後端。"""
+    global provider
+    old, provider = provider, new_provider
+    return old
+
+
+def available():
+    return provider.available()
+
+
+def _check_available():
+    if not provider.available():
+        raise GeminiUnavailable("AI 模型未初始化，請檢查 API Key。")
+
+
+async def _attempt(prompt, timeout, generation_config, task, context):
+    async with _semaphore:
+        _bump("in_flight")
+        try:
+            async with asyncio.timeout(timeout):
+                return await provider.generate(prompt, timeout, generation_config, task, context)
+        finally:
+            _bump("in_flight", -1)
+
+
+async def _hedged(prompt, timeout, hedge_after, generation_config, task, context):
+    if not hedge_after or hedge_after >= timeout:
+        return await _attempt(prompt, timeout, generation_config, task, context)
+    first = asyncio.ensure_future(_attempt(prompt, timeout, generation_config, task, context))
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+    _bump("hedges")
+    second = asyncio.ensure_future(_attempt(prompt, timeout - hedge_after, generation_config, task, context))
+    pending = {first, second}
+    error = None
+    try:
+        # 取第一個成功的結果；兩個都失敗才丟出最後一個錯誤
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        _bump("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def _generate(prompt, deadline=None, hedge_after=None, generation_config=None, task=None, context=None):
+    """回傳 (文字, (prompt tokens, output tokens))；失敗時丟出 GeminiError。"""
+    _check_available()
+    deadline = deadline or DEADLINE_SECONDS
+    hedge_after = HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+    stop = time.monotonic() + deadline
+    _bump("calls")
+    last_error = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        remaining = stop - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            return await _hedged(prompt, min(ATTEMPT_TIMEOUT_SECONDS, remaining), hedge_after, generation_config,
+                                 task, context)
+        except RETRYABLE as e:
+            last_error = e
+            if isinstance(e, TimeoutError):
+                _bump("timeouts")
+        except Exception as e:
+            _bump("errors")
+            raise GeminiError(f"{type(e).__name__}: {e}") from e
+        # full jitter：0 ~ min(上限, base * 2^(n-1))，避免大家同時重試
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+        if attempt == MAX_ATTEMPTS or time.monotonic() + delay >= stop:
+            break
+        _bump("retries")
+        await asyncio.sleep(delay)
+    _bump("errors")
+    detail = f"{type(last_error).__name__}: {last_error}" if last_error else "超過期限"
+    raise GeminiError(f"AI 服務逾時或暫時無法使用 ({detail})")
+
+
+async def generate_async(prompt, deadline=None, hedge_after=None, generation_config=None, task=None, context=None):
+    """回傳模型輸出的文字；失敗時丟出 GeminiError。
+
+    task / context 描述這次呼叫的用途與參數 (例如 "word_info", {"word": ...})，只有合成後端會用來產生回應。"""
+    text, usage = await _generate(prompt, deadline, hedge_after, generation_config, task, context)
+    _record_usage(usage)
+    return text
+
+
+def generate(prompt, deadline=None, hedge_after=None, generation_config=None, task=None, context=None):
+    """generate_async 的同步版本，給 Flask 路由與背景執行緒使用。"""
+    _check_available()
+    deadline = deadline or DEADLINE_SECONDS
+    future = asyncio.run_coroutine_threadsafe(
+        _generate(prompt, deadline, hedge_after, generation_config, task, context), _get_loop()
+    )
+    try:
+        text, usage = future.result(timeout=deadline + 1)
+    except TimeoutError:
+        future.cancel()
+        _bump("timeouts")
+        raise GeminiError("AI 服務逾時") from None
+    # 在呼叫端執行緒記錄用量，token_usage() 才看得到
+    _record_usage(usage)
+    return text
+
+
+def stream(prompt, deadline=None, task=None, context=None):
+    """逐段產生模型輸出 (同步串流，給 SSE 使用)；每段之間最多等 deadline 秒。"""
+    _check_available()
+    _bump("calls")
+    usage = (0, 0)
+    try:
+        for text, chunk_usage in provider.stream(prompt, deadline or DEADLINE_SECONDS, task, context):
+            # 用量是累計值，最後一段的才是總數
+            usage = chunk_usage or usage
+            if text:
+                yield text
+    except Exception as e:
+        _bump("errors")
+        raise GeminiError(f"{type(e).__name__}: {e}") from e
+    finally:
+        _record_usage(usage)
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot.update(provider.stats())
+    snapshot.update(
+        provider=provider.name, model=provider.describe(), deadline_seconds=DEADLINE_SECONDS,
+        hedge_after_seconds=HEDGE_AFTER_SECONDS, max_concurrency=MAX_CONCURRENCY,
+    )
+    return snapshot
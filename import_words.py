@@ -0,0 +1,320 @@
+# import_words.py - 大量匯入單字包 (JSONL / CSV)：串流讀取、分段交易、可從中斷處續跑
+#
+# 用法：python import_words.py words.jsonl [--chunk-size 1000] [--restart] [--db vocabulary.db]
+#
+# JSONL 每行一個物件，格式同 seed_level4.words_to_seed：
+#   {"word": ..., "level": 4, "definition": ..., "etymology": {"prefixes": [{"part": ..., "meaning": ...}], ...},
+#    "relations": {"synonyms": [...], "antonyms": [...]}}
+# CSV 欄位：word, level, part_of_speech, definition, collocation, mnemonic, example1, example2,
+#   prefixes, roots, suffixes (格式 "part=meaning|part=meaning"), synonyms, antonyms (格式 "a|b")
+# decks.py 匯出的個人列表也是這個格式 (多了 progress 欄位，這裡會忽略)，可以直接當單字包匯入。
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+import db
+import schema
+
+CHUNK_SIZE = 1000
+SQL_VARIABLE_LIMIT = 900        # 單一 IN (...) 最多放幾個參數
+
+WORD_FIELDS = ("word", "level", "part_of_speech", "definition", "collocation", "mnemonic", "example1", "example2")
+# 個人列表的學習進度 (decks.py)；JSONL 放在 "progress" 物件中，CSV 則是同名欄位
+PROGRESS_FIELDS = ("review_count", "correct_count", "last_reviewed", "ease", "interval_days", "repetitions", "due_at")
+AFFIX_TABLES = (
+    # etymology key, 詞源表, 欄位, 關聯表, 關聯欄位
+    ("prefixes", "prefixes", "prefix", "word_prefixes", "prefix_id"),
+    ("roots", "roots", "root", "word_roots", "root_id"),
+    ("suffixes", "suffixes", "suffix", "word_suffixes", "suffix_id"),
+)
+
+
+# --- 讀取 ---
+
+def _split(value, sep="|"):
+    return [v.strip() for v in (value or "").split(sep) if v.strip()]
+
+
+def _csv_row(row):
+    etymology = {}
+    for key, *_ in AFFIX_TABLES:
+        parts = []
+        for item in _split(row.get(key)):
+            part, _, meaning = item.partition("=")
+            parts.append({"part": part.strip(), "meaning": meaning.strip()})
+        etymology[key] = parts
+    data = {field: (row.get(field) or None) for field in WORD_FIELDS}
+    if data["level"]:
+        data["level"] = int(data["level"])
+    data["etymology"] = etymology
+    data["relations"] = {"synonyms": _split(row.get("synonyms")), "antonyms": _split(row.get("antonyms"))}
+    progress = {field: row[field] for field in PROGRESS_FIELDS if row.get(field)}
+    if progress:
+        data["progress"] = progress
+    return data
+
+
+def parse_pack(f, is_csv, name="<stream>"):
+    """從文字串流逐筆產生單字資料 (檔案或上傳的檔案都可以)。"""
+    if is_csv:
+        for row in csv.DictReader(f):
+            yield _csv_row(row)
+        return
+    for line_no, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{name} 第 {line_no} 行不是合法的 JSON: {e}") from None
+
+
+def read_pack(path):
+    """逐筆產生單字資料；不會把整個檔案讀進記憶體。"""
+    # utf-8-sig：decks.py 匯出的 CSV 開頭有 BOM (讓 Excel 正確顯示中文)
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        yield from parse_pack(f, path.lower().endswith(".csv"), path)
+
+
+# --- 寫入 ---
+
+def chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _is_scalar(value):
+    return value is None or isinstance(value, (str, int, float))
+
+
+def check_row(data):
+    """寫入前檢查一筆資料的結構 (單字包可能是使用者上傳的)；不合法時丟出 ValueError 並指出是哪個字。"""
+    word = data["word"]
+    if not isinstance(word, str):
+        raise ValueError(f"word 必須是字串：{word!r}")
+    for field in WORD_FIELDS:
+        if not _is_scalar(data.get(field)):
+            raise ValueError(f"單字 {word!r} 的 {field} 必須是字串或數字")
+    etymology = data.get("etymology")
+    if etymology is not None:
+        if not isinstance(etymology, dict):
+            raise ValueError(f"單字 {word!r} 的 etymology 必須是物件")
+        for key, *_ in AFFIX_TABLES:
+            parts = etymology.get(key)
+            if parts is None:
+                continue
+            if not isinstance(parts, list) or not all(
+                isinstance(p, dict) and isinstance(p.get("part"), (str, type(None))) and _is_scalar(p.get("meaning"))
+                for p in parts
+            ):
+                raise ValueError(f"單字 {word!r} 的 etymology.{key} 必須是含 part/meaning 的物件陣列")
+    relations = data.get("relations")
+    if relations is not None:
+        if not isinstance(relations, dict):
+            raise ValueError(f"單字 {word!r} 的 relations 必須是物件")
+        for kind in ("synonyms", "antonyms"):
+            words = relations.get(kind)
+            if words is not None and (not isinstance(words, list) or not all(isinstance(w, str) for w in words)):
+                raise ValueError(f"單字 {word!r} 的 relations.{kind} 必須是字串陣列")
+
+
+class Importer:
+    """預先把單字與詞源的 id 載入記憶體，之後每段只查新出現的字。"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.word_ids = dict(conn.execute("SELECT word, id FROM words"))
+        self.affix_ids = {
+            key: dict(conn.execute(f"SELECT {column}, id FROM {table}"))
+            for key, table, column, _, _ in AFFIX_TABLES
+        }
+
+    def _resolve(self, table, column, names, id_map):
+        missing = [n for n in dict.fromkeys(names) if n not in id_map]
+        for part in chunks(missing, SQL_VARIABLE_LIMIT):
+            rows = self.conn.execute(
+                f"SELECT {column}, id FROM {table} WHERE {column} IN ({','.join('?' * len(part))})", part
+            )
+            id_map.update(rows)
+
+    def _complete_words(self, words):
+        complete = set()
+        for part in chunks(dict.fromkeys(words), SQL_VARIABLE_LIMIT):
+            complete.update(r[0] for r in self.conn.execute(
+                f"SELECT word FROM words WHERE definition IS NOT NULL AND word IN ({','.join('?' * len(part))})", part
+            ))
+        return complete
+
+    def write_chunk(self, rows, overwrite=True):
+        """寫入一段資料 (不 commit)；回傳實際處理的筆數。
+
+        overwrite=False 時 (使用者上傳的列表)，已有定義的字完全不動 (包括詞源與同/反義詞)，
+        只新增字典沒有的字、補齊只有空殼的字；words 是所有使用者共用的。"""
+        conn = self.conn
+        rows = [r for r in rows if isinstance(r, dict) and r.get("word")]
+        if not rows:
+            return 0
+        # 先檢查整段再寫入：格式錯誤時這一段完全不動 (由呼叫端 rollback)
+        for r in rows:
+            check_row(r)
+        if not overwrite:
+            complete = self._complete_words([r["word"] for r in rows])
+            written = [r for r in rows if r["word"] not in complete]
+        else:
+            written = rows
+
+        # 1. 主要單字 (upsert)
+        conn.executemany(f"""
+            INSERT INTO words (word, level, part_of_speech, definition, collocation, mnemonic, example1, example2)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(word) DO UPDATE SET
+                level=excluded.level,
+                part_of_speech=excluded.part_of_speech,
+                definition=excluded.definition,
+                collocation=excluded.collocation,
+                mnemonic=excluded.mnemonic,
+                example1=excluded.example1,
+                example2=excluded.example2
+            {"" if overwrite else "WHERE words.definition IS NULL"}
+        """, [tuple(r.get(f) for f in WORD_FIELDS) for r in written])
+
+        # 2. 同/反義詞中尚未存在的字
+        related = {
+            w for r in written
+            for kind in ("synonyms", "antonyms")
+            for w in (r.get("relations") or {}).get(kind, []) if w
+        }
+        conn.executemany("INSERT OR IGNORE INTO words (word) VALUES (?)",
+                         [(w,) for w in related if w not in self.word_ids])
+        self._resolve("words", "word", [r["word"] for r in rows] + list(related), self.word_ids)
+
+        # 3. 詞源
+        links = {key: [] for key, *_ in AFFIX_TABLES}
+        for key, table, column, _, _ in AFFIX_TABLES:
+            id_map = self.affix_ids[key]
+            new_parts = {}
+            for r in written:
+                for p in (r.get("etymology") or {}).get(key, []):
+                    if isinstance(p, dict) and p.get("part") and p["part"] not in id_map:
+                        new_parts.setdefault(p["part"], p.get("meaning"))
+            conn.executemany(f"INSERT OR IGNORE INTO {table} ({column}, meaning) VALUES (?, ?)", new_parts.items())
+            self._resolve(table, column, new_parts, id_map)
+            for r in written:
+                word_id = self.word_ids[r["word"]]
+                for p in (r.get("etymology") or {}).get(key, []):
+                    if isinstance(p, dict) and p.get("part") in id_map:
+                        links[key].append((word_id, id_map[p["part"]]))
+        for key, _, _, link_table, link_column in AFFIX_TABLES:
+            conn.executemany(f"INSERT OR IGNORE INTO {link_table} (word_id, {link_column}) VALUES (?, ?)", links[key])
+
+        # 4. 同/反義詞：每對只存一筆 (word1_id < word2_id)
+        for kind in ("synonyms", "antonyms"):
+            pairs = set()
+            for r in written:
+                word_id = self.word_ids[r["word"]]
+                for other in (r.get("relations") or {}).get(kind, []):
+                    other_id = self.word_ids.get(other)
+                    if other_id and other_id != word_id:
+                        pairs.add((min(word_id, other_id), max(word_id, other_id)))
+            conn.executemany(f"INSERT OR IGNORE INTO {kind} (word1_id, word2_id) VALUES (?, ?)", sorted(pairs))
+        return len(rows)
+
+
+
+class ChunkImporter(Importer):
+    """使用者上傳的列表用：不預先載入整個字典，每段只查這一段用到的字與詞源 (記憶體與延遲不隨字典大小成長)。"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.word_ids = {}
+        self.affix_ids = {key: {} for key, *_ in AFFIX_TABLES}
+
+    def write_chunk(self, rows, overwrite=True):
+        # 只保留這一段的 id；寫入後 word_ids 仍可查到這一段的字 (decks 要用來加入使用者列表)
+        self.word_ids.clear()
+        for id_map in self.affix_ids.values():
+            id_map.clear()
+        return super().write_chunk(rows, overwrite)
+
+# --- 續跑進度 ---
+
+def _load_checkpoint(conn, source, size):
+    row = conn.execute("SELECT rows_done, source_size FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+    if row is None:
+        return 0
+    if row[1] != size:
+        print(f"'{source}' 的檔案大小與上次不同，從頭開始匯入。")
+        return 0
+    return row[0]
+
+
+def _save_checkpoint(conn, source, size, rows_done, finished=False):
+    conn.execute("""
+        INSERT INTO import_checkpoints (source, source_size, rows_done, finished, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(source) DO UPDATE SET
+            source_size=excluded.source_size, rows_done=excluded.rows_done,
+            finished=excluded.finished, updated_at=excluded.updated_at
+    """, (source, size, rows_done, int(finished)))
+
+
+def import_rows(conn, rows, chunk_size=CHUNK_SIZE, source=None, source_size=None, start=0, report=print):
+    """分段寫入 rows；每段一個交易，並在同一個交易裡更新 checkpoint (有 source 時)。"""
+    importer = Importer(conn)
+    done = start
+    started = time.perf_counter()
+    for chunk in chunks(rows, chunk_size):
+        try:
+            importer.write_chunk(chunk)
+            done += len(chunk)
+            if source:
+                _save_checkpoint(conn, source, source_size, done)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        elapsed = time.perf_counter() - started
+        rate = (done - start) / elapsed if elapsed else 0.0
+        report(f"  已處理 {done:,} 筆 ({rate:,.0f} 筆/秒)")
+    if source:
+        _save_checkpoint(conn, source, source_size, done, finished=True)
+        conn.commit()
+    return done - start
+
+
+def import_file(path, chunk_size=CHUNK_SIZE, restart=False, db_path=None):
+    source = os.path.abspath(path)
+    size = os.path.getsize(path)
+    conn = db.connect(db_path)
+    try:
+        schema.migrate(conn)
+        start = 0 if restart else _load_checkpoint(conn, source, size)
+        if start:
+            print(f"從第 {start:,} 筆之後繼續匯入 '{path}'。")
+        rows = itertools.islice(read_pack(path), start, None)
+        count = import_rows(conn, rows, chunk_size, source, size, start)
+        print(f"🎉 匯入完成：本次處理 {count:,} 筆，共 {start + count:,} 筆。")
+        return count
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="匯入 JSONL / CSV 單字包")
+    parser.add_argument("path")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="忽略上次的進度，從頭匯入")
+    parser.add_argument("--db", default=None, help="資料庫路徑 (預設為 DATABASE_PATH 或 vocabulary.db)")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"錯誤：找不到檔案 '{args.path}'。")
+    import_file(args.path, args.chunk_size, args.restart, args.db)
@@ -0,0 +1,91 @@
+# level_catalog.py - level_view 的快取：各級單字目錄 (依字母排序) 全行程共用，每位使用者的列表成員是排序好的 word id 陣列
+#
+# 兩者都附帶版本號 (schema._level_catalog 的觸發器維護)；每次請求只查兩個主鍵，版本沒變就直接使用快取。
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from lru import LRUCache
+
+MEMBER_CACHE_ENTRIES = int(os.getenv("LEVEL_MEMBER_CACHE_ENTRIES", "4096"))
+CATALOG_CACHE_ENTRIES = int(os.getenv("LEVEL_CATALOG_CACHE_ENTRIES", "16"))   # 實際只有少數幾級
+
+CatalogWord = namedtuple("CatalogWord", "id word definition")
+
+_catalogs = LRUCache(maxsize=CATALOG_CACHE_ENTRIES)     # level -> (version, tuple[CatalogWord])
+_members = LRUCache(maxsize=MEMBER_CACHE_ENTRIES)
+_stats_lock = threading.Lock()
+_stats = {"catalog_hits": 0, "catalog_loads": 0, "member_hits": 0, "member_loads": 0}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+class Membership:
+    """使用者列表中的 word id (排序好的 array)；`word_id in membership` 以二分搜尋判斷。"""
+
+    __slots__ = ("ids",)
+
+    def __init__(self, ids):
+        self.ids = array("q", ids)
+
+    def __contains__(self, word_id):
+        i = bisect_left(self.ids, word_id)
+        return i < len(self.ids) and self.ids[i] == word_id
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _version(conn, sql, key):
+    row = conn.execute(sql, (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def catalog(conn, level):
+    """回傳該級所有單字 (CatalogWord，依拼字排序)；沒有這一級時回傳空 tuple (不快取，level 來自網址)。"""
+    # 先讀版本再讀資料：讀取期間若有變動，存下的是舊版本號，下一次請求就會重新載入
+    version = _version(conn, "SELECT version FROM level_catalog_versions WHERE level = ?", level)
+    cached = _catalogs.get(level)
+    if cached is not None and cached[0] == version:
+        _bump("catalog_hits")
+        return cached[1]
+    words = tuple(CatalogWord(*r) for r in conn.execute(
+        "SELECT id, word, definition FROM words WHERE level = ? ORDER BY word", (level,)
+    ))
+    _bump("catalog_loads")
+    if words:
+        _catalogs.set(level, (version, words))
+    return words
+
+
+def membership(conn, user_id):
+    """回傳使用者列表的 Membership。"""
+    version = _version(conn, "SELECT version FROM word_list_versions WHERE user_id = ?", user_id)
+    cached = _members.get(user_id)
+    if cached is not None and cached[0] == version:
+        _bump("member_hits")
+        return cached[1]
+    members = Membership(r[0] for r in conn.execute(
+        "SELECT word_id FROM word_user_data WHERE user_id = ? ORDER BY word_id", (user_id,)
+    ))
+    _members.set(user_id, (version, members))
+    _bump("member_loads")
+    return members
+
+
+def clear_memory():
+    _catalogs.clear()
+    _members.clear()
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["catalog_cache"] = _catalogs.stats()
+    snapshot["member_cache"] = _members.stats()
+    return snapshot
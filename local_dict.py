@@ -0,0 +1,150 @@
+# local_dict.py - /lookup 先查本機字典：英文查 words (詞源與同/反義詞由卡片快取組回)，中文查定義的反向索引
+#
+# 反向索引由背景執行緒 (以及 enrich.py worker) 依 definition_terms_dirty 增量更新；請求路徑只讀，不寫索引。
+import os
+import re
+import threading
+
+import db
+import word_cards
+
+SYNC_CHUNK = 2000           # 每個交易重建幾個單字的索引
+SYNC_INTERVAL_SECONDS = int(os.getenv("DEFINITION_SYNC_SECONDS", "30"))   # 沒有被喚醒時多久檢查一次
+SUGGESTION_LIMIT = 5
+CANDIDATE_LIMIT = 50        # 反向索引取回的候選數 (之後再確認整段詞語確實出現在定義中)
+
+_CJK = re.compile(r'[\u4e00-\u9fff]+')
+_stats_lock = threading.Lock()
+_stats = {"word_local": 0, "word_miss": 0, "chinese_local": 0, "chinese_miss": 0, "indexed": 0,
+          "sync_errors": 0}
+_sync_wakeup = threading.Event()
+_sync_thread = None
+_sync_lock = threading.Lock()
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def definition_terms(text):
+    """定義中每段中文的單字與相鄰兩字。"""
+    terms = set()
+    for run in _CJK.findall(text or ""):
+        terms.update(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _query_terms(query):
+    # 查詢只需要兩字詞 (單一個字時用單字)；全部命中的才是候選
+    terms = set()
+    for run in _CJK.findall(query):
+        terms.update([run] if len(run) == 1 else (run[i:i + 2] for i in range(len(run) - 1)))
+    return terms
+
+
+def sync_index(conn):
+    """重建定義有變動 (觸發器記在 definition_terms_dirty) 的單字的索引；回傳處理的單字數。"""
+    total = 0
+    while True:
+        word_ids = [r[0] for r in conn.execute("SELECT word_id FROM definition_terms_dirty LIMIT ?", (SYNC_CHUNK,))]
+        if not word_ids:
+            return total
+        placeholders = ",".join("?" * len(word_ids))
+        try:
+            rows = conn.execute(f"SELECT id, definition FROM words WHERE id IN ({placeholders})", word_ids).fetchall()
+            conn.execute(f"DELETE FROM definition_terms WHERE word_id IN ({placeholders})", word_ids)
+            conn.executemany("INSERT OR IGNORE INTO definition_terms (term, word_id) VALUES (?, ?)",
+                             [(term, row[0]) for row in rows for term in definition_terms(row[1])])
+            conn.execute(f"DELETE FROM definition_terms_dirty WHERE word_id IN ({placeholders})", word_ids)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        total += len(word_ids)
+        _bump("indexed", len(word_ids))
+
+
+def request_sync():
+    """喚醒背景索引執行緒 (不等待)；啟動時與中文查詢時呼叫。"""
+    global _sync_thread
+    # fork 出來的 worker 會繼承已經不存在的執行緒物件，所以看 is_alive 而不是只看 None
+    if _sync_thread is None or not _sync_thread.is_alive():
+        with _sync_lock:
+            if _sync_thread is None or not _sync_thread.is_alive():
+                _sync_thread = threading.Thread(target=_sync_worker, name="definition-index", daemon=True)
+                _sync_thread.start()
+    _sync_wakeup.set()
+
+
+def _sync_worker():
+    conn = db.connect()
+    while True:
+        try:
+            sync_index(conn)
+        except Exception as e:
+            _bump("sync_errors")
+            print(f"更新定義索引時發生錯誤: {e}")
+        # 先等再清：索引期間收到的喚醒會讓下一輪立刻再跑一次
+        _sync_wakeup.wait(SYNC_INTERVAL_SECONDS)
+        _sync_wakeup.clear()
+
+
+def find_word(conn, word):
+    """本機字典有完整資料時，回傳與 get_word_info 相同格式的 dict；否則回傳 None。
+
+    手動新增的字可能只有空字串 (add_manual)，不算完整，仍交給 AI 查詢。"""
+    row = conn.execute(
+        "SELECT id FROM words WHERE word = ? AND coalesce(definition, '') <> '' AND coalesce(example1, '') <> ''",
+        (word,)
+    ).fetchone()
+    entry = word_cards.get_card(conn, row["id"]) if row else None
+    if entry is None:
+        _bump("word_miss")
+        return None
+    _bump("word_local")
+    card = entry[1]
+    data = {k: v for k, v in card["word"].items() if k not in ("id", "example_sentence")}
+    # 同時帶 part 與 prefix/root/suffix 欄位：/save 讀 part，確認頁顯示讀後者
+    data["etymology"] = {
+        key: [{"part": a[column], column: a[column], "meaning": a["meaning"]} for a in card[key]]
+        for key, column in (("prefixes", "prefix"), ("roots", "root"), ("suffixes", "suffix"))
+    }
+    data["relations"] = {
+        "synonyms": [w["word"] for w in card["synonyms"]],
+        "antonyms": [w["word"] for w in card["antonyms"]],
+    }
+    return data
+
+
+def suggest(conn, query, limit=SUGGESTION_LIMIT):
+    """依中文查詢從定義反向索引找英文單字；回傳與 get_english_suggestions_from_chinese 相同格式的 list。"""
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    # 剛改過定義的字可能還沒進索引 (背景更新)；這裡只讀
+    request_sync()
+    rows = conn.execute(f"""
+        SELECT w.word, w.part_of_speech, w.definition
+        FROM (
+            SELECT word_id FROM definition_terms WHERE term IN ({','.join('?' * len(terms))})
+            GROUP BY word_id HAVING COUNT(*) = ?
+        ) t
+        JOIN words w ON w.id = t.word_id
+        ORDER BY length(w.definition), w.level
+        LIMIT ?
+    """, (*terms, len(terms), CANDIDATE_LIMIT)).fetchall()
+    # 兩字詞都命中不代表整段詞語相連出現，再確認一次
+    runs = _CJK.findall(query)
+    suggestions = [
+        {"word": r["word"], "hint": " ".join(filter(None, (r["part_of_speech"], r["definition"])))}
+        for r in rows if all(run in r["definition"] for run in runs)
+    ][:limit]
+    _bump("chinese_local" if suggestions else "chinese_miss")
+    return suggestions
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
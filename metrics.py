@@ -0,0 +1,283 @@
+# metrics.py - 每個路由的延遲、SQL 語句數與耗時、樣板渲染時間、AI 呼叫的延遲/錯誤/token；/metrics 以 Prometheus 文字格式輸出
+#
+# 請求層：before/after_request 量測 (串流回應只算到送出標頭為止)；SQL 由 db 的 start_profile 記錄這個請求的每個語句；
+# 樣板渲染時間來自 Flask 的 before_render_template / template_rendered 訊號。
+# SLOW_REQUEST_MS > 0 時，超過門檻的請求會連同耗時最多的語句一起寫進 app.logger。
+import functools
+import inspect
+import os
+import re
+import threading
+import time
+
+from flask import before_render_template, current_app, g, request, template_rendered
+
+import db
+import gemini_client
+from lru import LRUCache
+
+PREFIX = "vocab"
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+AI_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))     # 0 = 不記錄慢請求
+SLOW_LOG_STATEMENTS = 10                                        # 慢請求紀錄中列出幾個最耗時的語句
+
+_SQL_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([A-Za-z_]\w*)", re.IGNORECASE)
+_PLACEHOLDERS = re.compile(r"\?(?:\s*,\s*\?)+")
+_NAME_UNSAFE = re.compile(r"[^a-zA-Z0-9_]")
+
+_lock = threading.Lock()
+_local = threading.local()          # 目前執行緒的樣板渲染與 AI 呼叫累計時間 (毫秒)
+_statement_labels = LRUCache(maxsize=4096)
+_stats_sources = {}
+
+
+class _Family:
+    """一組同名、不同標籤的 counter 或 histogram。"""
+
+    def __init__(self, name, help_text, labels, buckets=None):
+        self.name = f"{PREFIX}_{name}"
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def inc(self, label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def observe(self, label_values, value):
+        with _lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        kind = "histogram" if self.buckets else "counter"
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {kind}"]
+        with _lock:
+            items = sorted((k, (list(v[0]), v[1], v[2]) if self.buckets else v) for k, v in self.values.items())
+        for label_values, value in items:
+            labels = _labels(self.labels, label_values)
+            if not self.buckets:
+                lines.append(f"{self.name}{_braces(labels)} {_number(value)}")
+                continue
+            counts, total, n = value
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_braces(labels + _labels(('le',), (bound,)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_braces(labels + _labels(('le',), ('+Inf',)))} {n}")
+            lines.append(f"{self.name}_sum{_braces(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_braces(labels)} {n}")
+        return lines
+
+
+REQUEST_SECONDS = _Family("http_request_duration_seconds", "請求處理時間", ("method", "route"), REQUEST_BUCKETS)
+REQUESTS = _Family("http_requests_total", "請求數", ("method", "route", "status"))
+REQUEST_SQL_STATEMENTS = _Family("http_request_sql_statements_total", "請求送出的 SQL 語句數", ("method", "route"))
+REQUEST_SQL_SECONDS = _Family("http_request_sql_seconds_total", "請求中 SQL 語句的耗時", ("method", "route"))
+REQUEST_RENDER_SECONDS = _Family("http_request_render_seconds_total", "請求中樣板渲染的耗時", ("method", "route"))
+REQUEST_AI_SECONDS = _Family("http_request_ai_seconds_total", "請求中等待 AI 的時間", ("method", "route"))
+SQL_STATEMENTS = _Family("sql_statements_total", "請求中的 SQL 語句數 (依語句類型與資料表)", ("op", "table"))
+SQL_SECONDS = _Family("sql_statement_seconds_total", "請求中的 SQL 語句耗時 (依語句類型與資料表)", ("op", "table"))
+AI_SECONDS = _Family("ai_call_duration_seconds", "a_gemini_tool 函式的呼叫時間 (不含快取命中)", ("function",), AI_BUCKETS)
+AI_CALLS = _Family("ai_calls_total", "a_gemini_tool 函式的呼叫數", ("function", "outcome"))
+AI_TOKENS = _Family("ai_tokens_total", "a_gemini_tool 函式用掉的 token 數", ("function", "kind"))
+FAMILIES = (REQUEST_SECONDS, REQUESTS, REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS, REQUEST_RENDER_SECONDS,
+            REQUEST_AI_SECONDS, SQL_STATEMENTS, SQL_SECONDS, AI_SECONDS, AI_CALLS, AI_TOKENS)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    return [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+
+
+def _braces(labels):
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _number(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+def _elapsed(name):
+    return getattr(_local, name, 0.0)
+
+
+def _add_elapsed(name, ms):
+    setattr(_local, name, _elapsed(name) + ms)
+
+
+def statement_label(sql):
+    """(語句類型, 第一個資料表)，例如 ("SELECT", "words")；當作 Prometheus 標籤，數量有限。"""
+    label = _statement_labels.get(sql)
+    if label is None:
+        text = sql.lstrip()
+        match = _SQL_TABLE.search(text)
+        label = (text.split(None, 1)[0].upper() if text else "", match.group(1) if match else "")
+        _statement_labels.set(sql, label)
+    return label
+
+
+def _normalize_sql(sql, limit=200):
+    text = _PLACEHOLDERS.sub("?, ...", " ".join(sql.split()))
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+# --- 請求 ---
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+
+def _before_request():
+    g.metrics_started = (time.perf_counter(), db.statement_count(), db.statement_time_ms(),
+                         _elapsed("render_ms"), _elapsed("ai_ms"))
+    db.start_profile()
+
+
+def _after_request(response):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+    began, statements, sql_ms, render_ms, ai_ms = started
+    elapsed_ms = (time.perf_counter() - began) * 1000
+    statements = db.statement_count() - statements
+    sql_ms = db.statement_time_ms() - sql_ms
+    render_ms = _elapsed("render_ms") - render_ms
+    ai_ms = _elapsed("ai_ms") - ai_ms
+    profile = db.stop_profile()
+
+    key = (request.method, _route())
+    REQUEST_SECONDS.observe(key, elapsed_ms / 1000)
+    REQUESTS.inc((*key, str(response.status_code)))
+    REQUEST_SQL_STATEMENTS.inc(key, statements)
+    REQUEST_SQL_SECONDS.inc(key, sql_ms / 1000)
+    REQUEST_RENDER_SECONDS.inc(key, render_ms / 1000)
+    REQUEST_AI_SECONDS.inc(key, ai_ms / 1000)
+    for sql, (count, ms) in profile.items():
+        label = statement_label(sql)
+        SQL_STATEMENTS.inc(label, count)
+        SQL_SECONDS.inc(label, ms / 1000)
+
+    if SLOW_REQUEST_MS and elapsed_ms >= SLOW_REQUEST_MS:
+        lines = [
+            f"慢請求 {request.method} {request.full_path.rstrip('?')} ({response.status_code}) {elapsed_ms:.1f}ms："
+            f"SQL {statements} 句 {sql_ms:.1f}ms、樣板 {render_ms:.1f}ms、AI {ai_ms:.1f}ms、"
+            f"其他 {max(0.0, elapsed_ms - sql_ms - render_ms - ai_ms):.1f}ms"
+        ]
+        top = sorted(profile.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_LOG_STATEMENTS]
+        lines += [f"  {count:>4}× {ms:8.2f}ms  {_normalize_sql(sql)}" for sql, (count, ms) in top]
+        current_app.logger.warning("\n".join(lines))
+    return response
+
+
+def _render_started(sender, template, context, **extra):
+    stack = getattr(_local, "render_started", None)
+    if stack is None:
+        stack = _local.render_started = []
+    stack.append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    stack = getattr(_local, "render_started", None)
+    if stack:
+        ms = (time.perf_counter() - stack.pop()) * 1000
+        if not stack:       # 巢狀渲染只算最外層
+            _add_elapsed("render_ms", ms)
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+
+
+# --- AI 呼叫 ---
+
+def _default_is_error(result):
+    return isinstance(result, dict) and "error" in result
+
+
+def _record_ai(name, started, tokens, error):
+    seconds = time.perf_counter() - started
+    _add_elapsed("ai_ms", seconds * 1000)
+    prompt_tokens, output_tokens = (now - before for now, before in zip(gemini_client.token_usage(), tokens))
+    AI_SECONDS.observe((name,), seconds)
+    AI_CALLS.inc((name, "error" if error else "ok"))
+    AI_TOKENS.inc((name, "prompt"), prompt_tokens)
+    AI_TOKENS.inc((name, "output"), output_tokens)
+
+
+def ai_call(name, is_error=None):
+    """a_gemini_tool 函式的裝飾器：記錄延遲、錯誤與 token 數。放在 cached_ai_call 內層，快取命中不計入。
+
+    這些函式多半把錯誤轉成 {"error": ...} 或錯誤訊息字串回傳，is_error 用來辨識 (預設看 "error" 鍵)。
+    產生器函式量測到迭代結束為止。"""
+    is_error = is_error or _default_is_error
+
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def stream_wrapper(*args, **kwargs):
+                tokens, started, error = gemini_client.token_usage(), time.perf_counter(), False
+                try:
+                    for chunk in func(*args, **kwargs):
+                        error = error or is_error(chunk)
+                        yield chunk
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    _record_ai(name, started, tokens, error)
+            return stream_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tokens, started, error = gemini_client.token_usage(), time.perf_counter(), True
+            try:
+                result = func(*args, **kwargs)
+                error = is_error(result)
+                return result
+            finally:
+                _record_ai(name, started, tokens, error)
+        return wrapper
+    return decorator
+
+
+# --- 輸出 ---
+
+def register_stats(name, func):
+    """把各模組 stats() 中的數值一併輸出 (gauge，名稱為 vocab_<name>_<key>)。"""
+    _stats_sources[name] = func
+
+
+def _stats_lines():
+    lines = []
+    for source, func in _stats_sources.items():
+        for key, value in func().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = _NAME_UNSAFE.sub("_", f"{PREFIX}_{source}_{key}")
+            lines += [f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+    return lines
+
+
+def render():
+    """Prometheus 文字格式 (text/plain; version=0.0.4)。"""
+    lines = []
+    for family in FAMILIES:
+        lines += family.render()
+    lines += _stats_lines()
+    return "\n".join(lines) + "\n"
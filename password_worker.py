@@ -0,0 +1,15 @@
+# password_worker.py - passwords 的 process pool 在子行程中執行的函式；只 import bcrypt，子行程啟動時不必載入其他模組
+import bcrypt
+
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def check_password(hashed, password):
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def ready():
+    """啟動時預先送一個空工作，讓子行程先啟動好。"""
+    return True
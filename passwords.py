@@ -0,0 +1,143 @@
+# passwords.py - bcrypt 雜湊移到獨立的 process pool：限制排隊數量、依 IP 與帳號節流、工作因子可調整
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import password_worker
+
+ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "16"))       # 同時排隊 + 執行中的雜湊工作上限
+TIMEOUT_SECONDS = 10
+ATTEMPTS_PER_WINDOW = int(os.getenv("AUTH_ATTEMPTS_PER_MINUTE", "10"))
+WINDOW_SECONDS = 60
+
+# Google 登入的帳號沒有密碼；不是合法的 bcrypt 雜湊，永遠不會驗證成功
+OAUTH_MARKER = "!oauth"
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_attempts = {}
+_attempts_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"hashes": 0, "checks": 0, "rehashes": 0, "rejected_busy": 0, "throttled": 0, "in_flight": 0,
+          "pool_restarts": 0}
+
+
+class PasswordBusy(RuntimeError):
+    """排隊中的雜湊工作已達上限。"""
+
+
+class Throttled(RuntimeError):
+    """同一個 IP 在時間窗內嘗試太多次。"""
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+# --- 主行程 ---
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn：不要把持有 SQLite 連線與執行緒的 web 行程 fork 出去。子行程會重新 import 主程式
+                # (python app.py 時就是 app.py)，app.py 的啟動動作因此只在 MainProcess 執行
+                _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _discard_pool(broken):
+    """子行程異常結束後 executor 就永久不能用；丟掉它，下一次 _pool() 會重建。"""
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:     # 其他執行緒已經換過了
+            return
+        _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    _bump("pool_restarts")
+
+
+def _run(func, *args):
+    if not _slots.acquire(blocking=False):
+        _bump("rejected_busy")
+        raise PasswordBusy("密碼驗證服務忙碌中，請稍後再試。")
+    _bump("in_flight")
+    pool = _pool()
+    try:
+        return pool.submit(func, *args).result(timeout=TIMEOUT_SECONDS)
+    except FutureTimeout:
+        raise PasswordBusy("密碼驗證逾時，請稍後再試。") from None
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise PasswordBusy("密碼驗證服務重新啟動中，請稍後再試。") from None
+    finally:
+        _bump("in_flight", -1)
+        _slots.release()
+
+
+def warm_up():
+    """預先啟動所有子行程 (spawn 啟動要載入主程式，約一秒多)，不等待；讓第一個登入請求不必付這個成本。"""
+    pool = _pool()
+    for _ in range(WORKERS):
+        pool.submit(password_worker.ready)
+
+
+def throttle(key):
+    """同一個 key (通常是 (IP, 使用者名稱)) 在 WINDOW_SECONDS 內最多 ATTEMPTS_PER_WINDOW 次。"""
+    now = time.monotonic()
+    with _attempts_lock:
+        window = _attempts.setdefault(key, deque())
+        while window and now - window[0] > WINDOW_SECONDS:
+            window.popleft()
+        if len(window) >= ATTEMPTS_PER_WINDOW:
+            _bump("throttled")
+            raise Throttled("嘗試次數過多，請一分鐘後再試。")
+        window.append(now)
+        # 偶爾清掉已經沒有紀錄的 key，避免字典無限成長
+        if len(_attempts) > 10000:
+            for stale in [k for k, w in _attempts.items() if not w or now - w[-1] > WINDOW_SECONDS]:
+                del _attempts[stale]
+
+
+def is_usable(hashed):
+    return bool(hashed) and hashed.startswith("$2")
+
+
+def hash_password(password):
+    _bump("hashes")
+    return _run(password_worker.hash_password, password, ROUNDS)
+
+
+def check_password(hashed, password):
+    if not is_usable(hashed):
+        return False
+    _bump("checks")
+    return _run(password_worker.check_password, hashed, password)
+
+
+def needs_rehash(hashed):
+    """雜湊的工作因子與目前設定不同時回傳 True (格式：$2b$<rounds>$...)。"""
+    try:
+        return int(hashed.split("$")[2]) != ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+
+def record_rehash():
+    _bump("rehashes")
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot.update(rounds=ROUNDS, workers=WORKERS, max_pending=MAX_PENDING)
+    return snapshot
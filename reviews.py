@@ -0,0 +1,131 @@
+# reviews.py - 複習作答的批次送出：一次交易完成評分、冪等紀錄與 SRS 更新
+from datetime import datetime, timedelta, timezone
+
+import blanking
+import sampler
+import srs
+
+MAX_BATCH = 200
+MAX_ID_LENGTH = 64
+MAX_SESSION_WORDS = 50
+# 離線佇列可能隔一陣子才送出，但更早的作答時間 (例如 0 → 1970 年) 視為用戶端時鐘錯誤
+MAX_ANSWER_AGE = timedelta(days=1)
+# 前端題目緩衝區只需要這幾個欄位
+SESSION_FIELDS = ("id", "word", "definition", "example_sentence")
+SESSION_COLUMNS = "w.id, w.word, w.definition, w.example1 AS example_sentence"
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _parse_answered_at(value, now):
+    # 接受 epoch 毫秒或 ISO 8601；無法解析或在未來的時間一律以伺服器時間為準，太舊的夾到 MAX_ANSWER_AGE 之前
+    try:
+        if isinstance(value, (int, float)):
+            dt = datetime.fromtimestamp(value / 1000, timezone.utc)
+        elif isinstance(value, str) and value:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if dt.tzinfo is not None:
+                dt = dt.astimezone(timezone.utc)
+        else:
+            return now
+    except (ValueError, OverflowError, OSError):
+        return now
+    dt = dt.replace(tzinfo=None, microsecond=0)
+    return min(max(dt, now - MAX_ANSWER_AGE), now)
+
+
+def _validate(session_id, results):
+    if not isinstance(session_id, str) or not session_id or len(session_id) > MAX_ID_LENGTH:
+        raise BatchError("session_id 必須是 1~64 個字元的字串")
+    if not isinstance(results, list):
+        raise BatchError("results 必須是陣列")
+    if len(results) > MAX_BATCH:
+        raise BatchError(f"一次最多送出 {MAX_BATCH} 筆作答")
+    cleaned, seen = [], set()
+    for item in results:
+        if not isinstance(item, dict):
+            raise BatchError("results 的每一筆都必須是物件")
+        attempt_id = str(item.get("attempt_id", ""))
+        if not attempt_id or len(attempt_id) > MAX_ID_LENGTH:
+            raise BatchError("每筆作答都需要 attempt_id")
+        try:
+            word_id = int(item.get("word_id"))
+        except (TypeError, ValueError):
+            raise BatchError("word_id 必須是整數")
+        if attempt_id in seen:
+            continue
+        seen.add(attempt_id)
+        cleaned.append((attempt_id, word_id, str(item.get("guess") or "").strip().lower(), item.get("answered_at")))
+    return cleaned
+
+
+def submit_batch(conn, user_id, session_id, results):
+    """評分並寫入一批作答；已處理過的 attempt_id 會回傳 duplicate=True 而不重複計分。"""
+    cleaned = _validate(session_id, results)
+    if not cleaned:
+        return []
+    now = srs.now_utc()
+    attempt_ids = [a[0] for a in cleaned]
+    word_ids = sorted({a[1] for a in cleaned})
+
+    # BEGIN IMMEDIATE 先拿寫入鎖，讓「檢查已處理」與「寫入」在同一個交易裡，避免同批資料並行重送被算兩次
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = {
+            row[0]: bool(row[1])
+            for row in conn.execute(f"""
+                SELECT attempt_id, is_correct FROM review_attempts
+                WHERE user_id = ? AND session_id = ? AND attempt_id IN ({",".join("?" * len(attempt_ids))})
+            """, (user_id, session_id, *attempt_ids))
+        }
+        answers = {
+            row[0]: row[1]
+            for row in conn.execute(f"""
+                SELECT w.id, w.word FROM words w
+                JOIN word_user_data ud ON ud.word_id = w.id AND ud.user_id = ?
+                WHERE w.id IN ({",".join("?" * len(word_ids))})
+            """, (user_id, *word_ids))
+        }
+
+        graded, attempts, reviews = [], [], []
+        for attempt_id, word_id, guess, answered_at in cleaned:
+            if attempt_id in done:
+                graded.append({"attempt_id": attempt_id, "word_id": word_id, "is_correct": done[attempt_id], "duplicate": True})
+                continue
+            if word_id not in answers:
+                graded.append({"attempt_id": attempt_id, "word_id": word_id, "error": "not_in_list"})
+                continue
+            is_correct = guess == answers[word_id].lower()
+            answered_at = _parse_answered_at(answered_at, now)
+            attempts.append((user_id, session_id, attempt_id, word_id, guess, int(is_correct), srs.format_time(answered_at)))
+            reviews.append((word_id, is_correct, answered_at))
+            graded.append({"attempt_id": attempt_id, "word_id": word_id, "is_correct": is_correct,
+                           "correct_word": answers[word_id], "duplicate": False})
+
+        conn.executemany("""
+            INSERT INTO review_attempts (user_id, session_id, attempt_id, word_id, guess, is_correct, answered_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, attempts)
+        srs.apply_reviews(conn, user_id, reviews)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return graded
+
+
+def next_session_words(conn, user_id, k, exclude=()):
+    """一次取出接下來的 k 題：先出已到期的字，不足時以加權隨機補齊。"""
+    k = max(1, min(k, MAX_SESSION_WORDS))
+    exclude = set(exclude)
+    words = [dict(row) for row in srs.due_words(conn, user_id, k, exclude=exclude, columns=SESSION_COLUMNS)]
+    if len(words) < k:
+        exclude.update(w["id"] for w in words)
+        for row in sampler.sample_words(conn, user_id, k - len(words), columns="review", exclude=exclude):
+            words.append({field: row[field] for field in SESSION_FIELDS})
+    for word in words:
+        word["cloze_sentence"] = blanking.cloze(word["example_sentence"], word["word"])
+    return words
@@ -0,0 +1,97 @@
+# sampler.py - 以 word_user_data.ord 隨機抽題 (索引查找，不用 ORDER BY RANDOM())
+import random
+
+import schema
+
+MAX_ROUNDS = 4          # 加權抽樣的最多嘗試回合；每回合是一次 IN (...) 索引查找
+OVERSAMPLE = 3          # 每回合抽出的候選數 = 需要數量 × OVERSAMPLE
+
+_COLUMNS = {
+    "full": "w.*, w.example1 AS example_sentence",
+    "word": "w.word",
+    "review": "w.id, w.word, w.definition, w.example1 AS example_sentence",
+}
+
+
+def weight(review_count, correct_count):
+    """答錯率越高權重越大；加上平滑讓沒複習過的字 (0/0) 落在 0.5。"""
+    return (review_count - correct_count + 1) / (review_count + 2)
+
+
+def _ordinal_count(conn, user_id):
+    row = conn.execute("SELECT MAX(ord) FROM word_user_data WHERE user_id = ?", (user_id,)).fetchone()
+    return 0 if row[0] is None else row[0] + 1
+
+
+def sample_words(conn, user_id, k=1, weighted=True, columns="full", exclude=()):
+    """抽出 k 個不重複的單字；weighted=True 時以答錯率做 rejection sampling。
+
+    exclude 中的 word_id 會被跳過 (列表很小時可能因此少於 k 個)。
+
+    每次查詢只做 MAX(ord) 與一次 ord IN (...) 的索引查找，與列表大小無關。
+    """
+    exclude = set(exclude)
+    n = _ordinal_count(conn, user_id)
+    if n == 0:
+        return []
+    k = min(k, n)
+    picked, seen, fallback = [], set(), []
+    for _ in range(MAX_ROUNDS):
+        need = k - len(picked)
+        ords = _sample_unseen(n, min(n - len(seen), need * OVERSAMPLE), seen)
+        if not ords:
+            break
+        seen.update(ords)
+        placeholders = ",".join("?" * len(ords))
+        rows = conn.execute(f"""
+            SELECT {_COLUMNS[columns]}, ud.word_id, ud.review_count, ud.correct_count FROM word_user_data ud
+            JOIN words w ON w.id = ud.word_id
+            WHERE ud.user_id = ? AND ud.ord IN ({placeholders})
+        """, (user_id, *ords)).fetchall()
+        for row in rows:
+            if row["word_id"] in exclude:
+                continue
+            if not weighted or random.random() < weight(row["review_count"], row["correct_count"]):
+                picked.append(row)
+                if len(picked) == k:
+                    return picked
+            else:
+                fallback.append(row)
+    # 回合用完仍不足 (例如全部都答得很好) 時，用被拒絕的候選補齊
+    random.shuffle(fallback)
+    return picked + fallback[:k - len(picked)]
+
+
+def _sample_unseen(n, count, seen):
+    if count * 2 >= n - len(seen):
+        # 列表很小 (或快抽完了) 時直接列舉剩下的序號
+        return random.sample([o for o in range(n) if o not in seen], count)
+    ords = set()
+    while len(ords) < count:
+        o = random.randrange(n)
+        if o not in seen:
+            ords.add(o)
+    return list(ords)
+
+
+def renumber(conn):
+    """重新壓實所有使用者的 ord；批次匯入或 INSERT OR REPLACE 之後可執行一次。"""
+    try:
+        for sql in schema.RENUMBER_ORDINALS_SQL:
+            conn.execute(sql)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+if __name__ == "__main__":
+    import sys
+    import sqlite3
+
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else "vocabulary.db")
+    try:
+        renumber(conn)
+        print("已重新編排 word_user_data.ord。")
+    finally:
+        conn.close()
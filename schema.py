@@ -0,0 +1,516 @@
+# schema.py - 既有資料庫的增量 schema 升級 (以 PRAGMA user_version 記錄進度，可重複執行)
+import sqlite3
+
+# setup_database.py 建立全新資料庫時的基本資料表；之後的結構變更一律透過 MIGRATIONS
+BASE_TABLES_SQL = """
+    CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT NOT NULL UNIQUE, password TEXT NOT NULL, google_id TEXT UNIQUE);
+
+    CREATE TABLE words (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        word TEXT NOT NULL UNIQUE,
+        level INTEGER,
+        part_of_speech TEXT,
+        definition TEXT,
+        collocation TEXT,
+        mnemonic TEXT,
+        example1 TEXT,
+        example2 TEXT
+    );
+
+    CREATE TABLE word_user_data (
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        word_id INTEGER NOT NULL REFERENCES words(id),
+        review_count INTEGER NOT NULL DEFAULT 0,
+        correct_count INTEGER NOT NULL DEFAULT 0,
+        last_reviewed TIMESTAMP,
+        PRIMARY KEY (user_id, word_id)
+    );
+
+    CREATE TABLE synonyms (word1_id INTEGER, word2_id INTEGER, PRIMARY KEY (word1_id, word2_id));
+    CREATE TABLE antonyms (word1_id INTEGER, word2_id INTEGER, PRIMARY KEY (word1_id, word2_id));
+    CREATE TABLE prefixes (id INTEGER PRIMARY KEY, prefix TEXT UNIQUE, meaning TEXT);
+    CREATE TABLE roots (id INTEGER PRIMARY KEY, root TEXT UNIQUE, meaning TEXT);
+    CREATE TABLE suffixes (id INTEGER PRIMARY KEY, suffix TEXT UNIQUE, meaning TEXT);
+    CREATE TABLE word_prefixes (word_id INTEGER, prefix_id INTEGER, PRIMARY KEY (word_id, prefix_id));
+    CREATE TABLE word_roots (word_id INTEGER, root_id INTEGER, PRIMARY KEY (word_id, root_id));
+    CREATE TABLE word_suffixes (word_id INTEGER, suffix_id INTEGER, PRIMARY KEY (word_id, suffix_id));
+"""
+
+
+def create_base_tables(conn):
+    conn.executescript(BASE_TABLES_SQL)
+    conn.commit()
+
+
+
+def _words_fts(conn):
+    # trigram 分詞：英文可做前綴/子字串比對，中文定義不需斷詞也能搜尋 (查詢至少 3 個字元)
+    conn.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+            word, definition, collocation, mnemonic, example1, example2,
+            content='words', content_rowid='id', tokenize='trigram'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS words_fts_ai AFTER INSERT ON words BEGIN
+            INSERT INTO words_fts (rowid, word, definition, collocation, mnemonic, example1, example2)
+            VALUES (new.id, new.word, new.definition, new.collocation, new.mnemonic, new.example1, new.example2);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS words_fts_ad AFTER DELETE ON words BEGIN
+            INSERT INTO words_fts (words_fts, rowid, word, definition, collocation, mnemonic, example1, example2)
+            VALUES ('delete', old.id, old.word, old.definition, old.collocation, old.mnemonic, old.example1, old.example2);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS words_fts_au AFTER UPDATE ON words BEGIN
+            INSERT INTO words_fts (words_fts, rowid, word, definition, collocation, mnemonic, example1, example2)
+            VALUES ('delete', old.id, old.word, old.definition, old.collocation, old.mnemonic, old.example1, old.example2);
+            INSERT INTO words_fts (rowid, word, definition, collocation, mnemonic, example1, example2)
+            VALUES (new.id, new.word, new.definition, new.collocation, new.mnemonic, new.example1, new.example2);
+        END;
+
+        INSERT INTO words_fts (words_fts) VALUES ('rebuild');
+    """)
+
+
+# 依 word_id 重新編排每位使用者的 ord (0..n-1)；INSERT OR REPLACE 不會觸發刪除觸發器而可能留下空號
+# (user_id, ord) 有 UNIQUE 索引且逐列檢查，直接改成新序號會撞到還沒改的列；先全部移到負數 (-1-rn)，再翻回 0..n-1
+RENUMBER_ORDINALS_SQL = (
+    """
+    UPDATE word_user_data SET ord = -1 - r.rn
+    FROM (
+        SELECT user_id, word_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY word_id) - 1 AS rn
+        FROM word_user_data
+    ) AS r
+    WHERE word_user_data.user_id = r.user_id AND word_user_data.word_id = r.word_id
+    """,
+    "UPDATE word_user_data SET ord = -1 - ord WHERE ord < 0",
+)
+
+
+def _word_user_data_ordinal(conn):
+    # 每位使用者的單字有一個連續的序號 ord，抽題時隨機產生序號後直接走索引，不必排序整個列表
+    conn.execute("ALTER TABLE word_user_data ADD COLUMN ord INTEGER")
+    for sql in RENUMBER_ORDINALS_SQL:
+        conn.execute(sql)
+    conn.executescript("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_word_user_data_ord ON word_user_data (user_id, ord);
+
+        -- 新增：接在最大序號之後
+        CREATE TRIGGER IF NOT EXISTS word_user_data_ord_ai AFTER INSERT ON word_user_data
+        WHEN new.ord IS NULL BEGIN
+            UPDATE word_user_data
+            SET ord = (SELECT COALESCE(MAX(ord), -1) + 1 FROM word_user_data WHERE user_id = new.user_id)
+            WHERE user_id = new.user_id AND word_id = new.word_id;
+        END;
+
+        -- 刪除：把最後一個序號搬進空出來的位置，維持 0..n-1 連續
+        CREATE TRIGGER IF NOT EXISTS word_user_data_ord_ad AFTER DELETE ON word_user_data BEGIN
+            UPDATE word_user_data SET ord = old.ord
+            WHERE user_id = old.user_id
+              AND ord = (SELECT MAX(ord) FROM word_user_data WHERE user_id = old.user_id)
+              AND ord > old.ord;
+        END;
+    """)
+
+
+def _word_user_data_srs(conn):
+    # SM-2 間隔重複的狀態；due_at 與 last_reviewed 同為 UTC 'YYYY-MM-DD HH:MM:SS' 字串
+    conn.execute("ALTER TABLE word_user_data ADD COLUMN ease REAL NOT NULL DEFAULT 2.5")
+    conn.execute("ALTER TABLE word_user_data ADD COLUMN interval_days REAL NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE word_user_data ADD COLUMN repetitions INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE word_user_data ADD COLUMN due_at TIMESTAMP")
+    conn.execute("UPDATE word_user_data SET due_at = COALESCE(last_reviewed, CURRENT_TIMESTAMP)")
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_word_user_data_due ON word_user_data (user_id, due_at);
+
+        -- 新加入的單字立即到期
+        CREATE TRIGGER IF NOT EXISTS word_user_data_due_ai AFTER INSERT ON word_user_data
+        WHEN new.due_at IS NULL BEGIN
+            UPDATE word_user_data SET due_at = CURRENT_TIMESTAMP
+            WHERE user_id = new.user_id AND word_id = new.word_id;
+        END;
+    """)
+
+
+def _review_attempts(conn):
+    # 批次作答的冪等紀錄：同一個 (session_id, attempt_id) 重送只會計分一次
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS review_attempts (
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            session_id TEXT NOT NULL,
+            attempt_id TEXT NOT NULL,
+            word_id INTEGER NOT NULL REFERENCES words(id),
+            guess TEXT,
+            is_correct INTEGER NOT NULL,
+            answered_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, session_id, attempt_id)
+        );
+    """)
+
+
+def _word_user_data_recent_index(conn):
+    # 首頁依 (last_reviewed DESC, word_id DESC) 做 keyset 分頁
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_word_user_data_recent ON word_user_data (user_id, last_reviewed, word_id)"
+    )
+
+
+def _canonical_relations(conn):
+    # 同/反義詞原本每對存兩筆 (a,b)、(b,a)；改成只留 word1_id < word2_id 的一筆，反向查詢靠 word2_id 索引
+    for table in ("synonyms", "antonyms"):
+        conn.executescript(f"""
+            INSERT OR IGNORE INTO {table} (word1_id, word2_id)
+                SELECT word2_id, word1_id FROM {table} WHERE word1_id > word2_id;
+            DELETE FROM {table} WHERE word1_id >= word2_id;
+            CREATE INDEX IF NOT EXISTS idx_{table}_word2 ON {table} (word2_id, word1_id);
+        """)
+
+
+def _import_checkpoints(conn):
+    # import_words.py 的續跑進度；與每段資料在同一個交易中更新
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            source_size INTEGER,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP
+        );
+    """)
+
+
+def _word_cards(conn):
+    # word_detail 的預先組好的卡片；任何相關資料變動時由觸發器把 version 加一並清掉 payload
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS word_cards (
+            word_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1,
+            payload BLOB,
+            etag TEXT,
+            built_at TIMESTAMP
+        );
+    """)
+    bump = "UPDATE word_cards SET version = version + 1, payload = NULL, etag = NULL WHERE word_id"
+    related = """
+        SELECT word2_id FROM synonyms WHERE word1_id = {0} UNION SELECT word1_id FROM synonyms WHERE word2_id = {0}
+        UNION SELECT word2_id FROM antonyms WHERE word1_id = {0} UNION SELECT word1_id FROM antonyms WHERE word2_id = {0}
+    """
+    triggers = {
+        "word_cards_words_au": f"AFTER UPDATE ON words BEGIN {bump} = new.id; END",
+        "word_cards_words_ad": f"AFTER DELETE ON words BEGIN {bump} = old.id; END",
+        # 卡片上會顯示同/反義詞的拼字
+        "word_cards_words_word_au": f"AFTER UPDATE OF word ON words BEGIN {bump} IN ({related.format('new.id')}); END",
+    }
+    for table in ("synonyms", "antonyms"):
+        for event, row in (("INSERT", "new"), ("DELETE", "old")):
+            triggers[f"word_cards_{table}_a{event[0].lower()}"] = (
+                f"AFTER {event} ON {table} BEGIN {bump} IN ({row}.word1_id, {row}.word2_id); END"
+            )
+    for table, link_table, id_col in (("prefixes", "word_prefixes", "prefix_id"),
+                                      ("roots", "word_roots", "root_id"),
+                                      ("suffixes", "word_suffixes", "suffix_id")):
+        for event, row in (("INSERT", "new"), ("DELETE", "old")):
+            triggers[f"word_cards_{link_table}_a{event[0].lower()}"] = (
+                f"AFTER {event} ON {link_table} BEGIN {bump} = {row}.word_id; END"
+            )
+        triggers[f"word_cards_{table}_au"] = (
+            f"AFTER UPDATE ON {table} BEGIN {bump} IN (SELECT word_id FROM {link_table} WHERE {id_col} = new.id); END"
+        )
+    for name, body in triggers.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def _oauth_password_marker(conn):
+    # Google 帳號原本存的是固定字串的 bcrypt 雜湊 (知道字串就能用密碼登入)；改成無法驗證的標記
+    conn.execute("UPDATE users SET password = '!oauth' WHERE google_id IS NOT NULL")
+
+
+def _cloze_stories(conn):
+    # 綜合克漏字的預產故事池：每篇故事記下用到的單字，單字離開使用者列表時由觸發器一併刪除
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS cloze_stories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            words TEXT NOT NULL,
+            story TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_cloze_stories_user ON cloze_stories (user_id, id);
+
+        CREATE TABLE IF NOT EXISTS cloze_story_words (
+            story_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            word_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, word_id, story_id)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS cloze_stories_ad AFTER DELETE ON cloze_stories BEGIN
+            DELETE FROM cloze_story_words WHERE user_id = old.user_id AND story_id = old.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS cloze_stories_word_user_data_ad AFTER DELETE ON word_user_data BEGIN
+            DELETE FROM cloze_stories WHERE id IN (
+                SELECT story_id FROM cloze_story_words WHERE user_id = old.user_id AND word_id = old.word_id
+            );
+        END;
+    """)
+
+
+def _enrich_jobs(conn):
+    # 同/反義詞寫入時只建立了 word 欄位的空白單字；每個空白字一筆補齊工作，由 enrich.py 的 worker 處理
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS enrich_jobs (
+            word_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_enrich_jobs_due ON enrich_jobs (status, next_attempt_at);
+
+        CREATE TRIGGER IF NOT EXISTS enrich_jobs_words_ai AFTER INSERT ON words
+        WHEN new.definition IS NULL BEGIN
+            INSERT OR IGNORE INTO enrich_jobs (word_id) VALUES (new.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS enrich_jobs_words_ad AFTER DELETE ON words BEGIN
+            DELETE FROM enrich_jobs WHERE word_id = old.id;
+        END;
+
+        INSERT OR IGNORE INTO enrich_jobs (word_id) SELECT id FROM words WHERE definition IS NULL;
+    """)
+
+
+def _definition_terms(conn):
+    # 中文定義的反向索引 (單字 + 相鄰兩字)，讓中文查詢先從本機字典找；由 local_dict 依 dirty 表增量更新
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS definition_terms (
+            term TEXT NOT NULL,
+            word_id INTEGER NOT NULL,
+            PRIMARY KEY (term, word_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_definition_terms_word ON definition_terms (word_id);
+
+        CREATE TABLE IF NOT EXISTS definition_terms_dirty (word_id INTEGER PRIMARY KEY);
+
+        CREATE TRIGGER IF NOT EXISTS definition_terms_words_ai AFTER INSERT ON words
+        WHEN new.definition IS NOT NULL BEGIN
+            INSERT OR IGNORE INTO definition_terms_dirty (word_id) VALUES (new.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS definition_terms_words_au AFTER UPDATE OF definition ON words BEGIN
+            INSERT OR IGNORE INTO definition_terms_dirty (word_id) VALUES (new.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS definition_terms_words_ad AFTER DELETE ON words BEGIN
+            DELETE FROM definition_terms WHERE word_id = old.id;
+            DELETE FROM definition_terms_dirty WHERE word_id = old.id;
+        END;
+
+        INSERT OR IGNORE INTO definition_terms_dirty (word_id) SELECT id FROM words WHERE definition IS NOT NULL;
+    """)
+
+
+def _level_catalog(conn):
+    # level_view 的快取 (level_catalog.py) 以版本號判斷是否過期；觸發器涵蓋所有寫入者 (其他 worker、匯入腳本)
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_words_level_word ON words (level, word);
+
+        CREATE TABLE IF NOT EXISTS level_catalog_versions (level INTEGER PRIMARY KEY, version INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS word_list_versions (user_id INTEGER PRIMARY KEY, version INTEGER NOT NULL);
+
+        CREATE TRIGGER IF NOT EXISTS level_catalog_words_ai AFTER INSERT ON words
+        WHEN new.level IS NOT NULL BEGIN
+            INSERT INTO level_catalog_versions (level, version) VALUES (new.level, 1)
+            ON CONFLICT(level) DO UPDATE SET version = version + 1;
+        END;
+
+        -- 只有列表頁會用到的欄位變動才算
+        CREATE TRIGGER IF NOT EXISTS level_catalog_words_au AFTER UPDATE OF word, level, definition ON words BEGIN
+            INSERT INTO level_catalog_versions (level, version) SELECT old.level, 1 WHERE old.level IS NOT NULL
+            ON CONFLICT(level) DO UPDATE SET version = version + 1;
+            INSERT INTO level_catalog_versions (level, version) SELECT new.level, 1
+            WHERE new.level IS NOT NULL AND new.level IS NOT old.level
+            ON CONFLICT(level) DO UPDATE SET version = version + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS level_catalog_words_ad AFTER DELETE ON words
+        WHEN old.level IS NOT NULL BEGIN
+            INSERT INTO level_catalog_versions (level, version) VALUES (old.level, 1)
+            ON CONFLICT(level) DO UPDATE SET version = version + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS word_list_versions_ai AFTER INSERT ON word_user_data BEGIN
+            INSERT INTO word_list_versions (user_id, version) VALUES (new.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS word_list_versions_ad AFTER DELETE ON word_user_data BEGIN
+            INSERT INTO word_list_versions (user_id, version) VALUES (old.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+        END;
+    """)
+
+
+def _affix_index(conn):
+    # 詞源 → 單字的反向索引 (affix_index.py)：關聯表的主鍵是 (word_id, affix_id)，反方向另外建索引；
+    # 每個詞源的單字數與每種詞源的版本號由觸發器維護 (INSERT OR IGNORE 沒寫入時不會觸發)
+    statements = [
+        "CREATE TABLE IF NOT EXISTS affix_counts ("
+        " kind TEXT NOT NULL, affix_id INTEGER NOT NULL, word_count INTEGER NOT NULL,"
+        " PRIMARY KEY (kind, affix_id)) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS affix_index_versions (kind TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+    ]
+    bump = ("INSERT INTO affix_index_versions (kind, version) VALUES ('{kind}', 1) "
+            "ON CONFLICT(kind) DO UPDATE SET version = version + 1;")
+    for kind, link_table, id_col in (("prefix", "word_prefixes", "prefix_id"),
+                                     ("root", "word_roots", "root_id"),
+                                     ("suffix", "word_suffixes", "suffix_id")):
+        statements += [
+            f"CREATE INDEX IF NOT EXISTS idx_{link_table}_affix ON {link_table} ({id_col}, word_id)",
+            f"INSERT OR REPLACE INTO affix_counts (kind, affix_id, word_count) "
+            f"SELECT '{kind}', {id_col}, COUNT(*) FROM {link_table} GROUP BY {id_col}",
+            f"CREATE TRIGGER IF NOT EXISTS affix_index_{link_table}_ai AFTER INSERT ON {link_table} BEGIN "
+            f"INSERT INTO affix_counts (kind, affix_id, word_count) VALUES ('{kind}', new.{id_col}, 1) "
+            f"ON CONFLICT(kind, affix_id) DO UPDATE SET word_count = word_count + 1; "
+            f"{bump.format(kind=kind)} END",
+            f"CREATE TRIGGER IF NOT EXISTS affix_index_{link_table}_ad AFTER DELETE ON {link_table} BEGIN "
+            f"UPDATE affix_counts SET word_count = word_count - 1 WHERE kind = '{kind}' AND affix_id = old.{id_col}; "
+            f"{bump.format(kind=kind)} END",
+        ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+
+def _definition_terms_upsert_triggers(conn):
+    # 外層語句是 upsert (ON CONFLICT DO UPDATE) 或 OR REPLACE 時，觸發器內的 OR IGNORE 會被外層的衝突處理取代，
+    # 已標記過的字再次更新定義就會 UNIQUE 失敗；改用觸發器自己的 upsert 子句 (不受外層影響)
+    conn.executescript("""
+        DROP TRIGGER IF EXISTS definition_terms_words_ai;
+        DROP TRIGGER IF EXISTS definition_terms_words_au;
+
+        CREATE TRIGGER definition_terms_words_ai AFTER INSERT ON words
+        WHEN new.definition IS NOT NULL BEGIN
+            INSERT INTO definition_terms_dirty (word_id) VALUES (new.id) ON CONFLICT(word_id) DO NOTHING;
+        END;
+
+        CREATE TRIGGER definition_terms_words_au AFTER UPDATE OF definition ON words BEGIN
+            INSERT INTO definition_terms_dirty (word_id) VALUES (new.id) ON CONFLICT(word_id) DO NOTHING;
+        END;
+    """)
+
+
+def _affix_counts_defined_words(conn):
+    # 探索頁只列出有定義的字 (同/反義詞的空白字不算)，affix_counts 改成只計這些字；
+    # 空白字補上定義 (或定義被清空) 時由 words 的觸發器調整它所有詞源的計數
+    statements = ["DELETE FROM affix_counts"]
+    words_au, words_ad = [], []
+    bump = ("INSERT INTO affix_index_versions (kind, version) VALUES ('{kind}', 1) "
+            "ON CONFLICT(kind) DO UPDATE SET version = version + 1;")
+    for kind, link_table, id_col in (("prefix", "word_prefixes", "prefix_id"),
+                                     ("root", "word_roots", "root_id"),
+                                     ("suffix", "word_suffixes", "suffix_id")):
+        defined = "EXISTS (SELECT 1 FROM words WHERE id = {row}.word_id AND definition IS NOT NULL)"
+        statements += [
+            f"INSERT INTO affix_counts (kind, affix_id, word_count) "
+            f"SELECT '{kind}', l.{id_col}, COUNT(*) FROM {link_table} l JOIN words w ON w.id = l.word_id "
+            f"WHERE w.definition IS NOT NULL GROUP BY l.{id_col}",
+            f"DROP TRIGGER IF EXISTS affix_index_{link_table}_ai",
+            f"DROP TRIGGER IF EXISTS affix_index_{link_table}_ad",
+            # 版本號照舊每次都加 (posting list 含空白字)，計數只算有定義的字
+            f"CREATE TRIGGER affix_index_{link_table}_ai AFTER INSERT ON {link_table} BEGIN "
+            f"INSERT INTO affix_counts (kind, affix_id, word_count) SELECT '{kind}', new.{id_col}, 1 "
+            f"WHERE {defined.format(row='new')} "
+            f"ON CONFLICT(kind, affix_id) DO UPDATE SET word_count = word_count + 1; "
+            f"{bump.format(kind=kind)} END",
+            f"CREATE TRIGGER affix_index_{link_table}_ad AFTER DELETE ON {link_table} BEGIN "
+            f"UPDATE affix_counts SET word_count = word_count - 1 "
+            f"WHERE kind = '{kind}' AND affix_id = old.{id_col} AND {defined.format(row='old')}; "
+            f"{bump.format(kind=kind)} END",
+        ]
+        words_au.append(
+            f"INSERT INTO affix_counts (kind, affix_id, word_count) "
+            f"SELECT '{kind}', {id_col}, 1 FROM {link_table} WHERE word_id = new.id AND new.definition IS NOT NULL "
+            f"ON CONFLICT(kind, affix_id) DO UPDATE SET word_count = word_count + 1; "
+            f"UPDATE affix_counts SET word_count = word_count - 1 WHERE kind = '{kind}' AND new.definition IS NULL "
+            f"AND affix_id IN (SELECT {id_col} FROM {link_table} WHERE word_id = old.id);"
+        )
+        words_ad.append(
+            f"UPDATE affix_counts SET word_count = word_count - 1 "
+            f"WHERE kind = '{kind}' AND affix_id IN (SELECT {id_col} FROM {link_table} WHERE word_id = old.id);"
+        )
+    statements += [
+        "CREATE TRIGGER affix_counts_words_au AFTER UPDATE OF definition ON words "
+        f"WHEN (old.definition IS NULL) <> (new.definition IS NULL) BEGIN {' '.join(words_au)} END",
+        # 單字刪除時關聯表的列不會跟著刪，在這裡先扣掉；之後再刪關聯時單字已不存在，不會重複扣
+        "CREATE TRIGGER affix_counts_words_ad AFTER DELETE ON words "
+        f"WHEN old.definition IS NOT NULL BEGIN {' '.join(words_ad)} END",
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+# 只能往後追加；已發佈的項目不要修改或調整順序
+MIGRATIONS = [
+    _words_fts,
+    _word_user_data_ordinal,
+    _word_user_data_srs,
+    _review_attempts,
+    _word_user_data_recent_index,
+    _canonical_relations,
+    _import_checkpoints,
+    _word_cards,
+    _oauth_password_marker,
+    _cloze_stories,
+    _enrich_jobs,
+    _definition_terms,
+    _level_catalog,
+    _affix_index,
+    _definition_terms_upsert_triggers,
+    _affix_counts_defined_words,
+]
+
+
+class _Script:
+    """收集 migration 送出的 SQL (不執行)。executescript 會先自行 COMMIT 再逐句自動提交，
+    直接在連線上執行的話中途失敗會留下一半的 schema 而 user_version 沒有前進。"""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql):
+        self.statements.append(sql.strip().rstrip(";") + ";")
+
+    def executescript(self, script):
+        self.statements.append(script.strip())
+
+
+def migrate(conn):
+    """依序套用尚未執行的 migration，回傳套用的數量。
+    每個 migration 與它的 user_version 在同一個 BEGIN ... COMMIT 中：失敗時整個回滾，下次從同一個版本重試。"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    pending = MIGRATIONS[version:]
+    for number, migration in enumerate(pending, start=version + 1):
+        script = _Script()
+        migration(script)
+        body = "\n".join(script.statements)
+        try:
+            conn.executescript(f"BEGIN;\n{body}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    return len(pending)
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "vocabulary.db"
+    conn = sqlite3.connect(path)
+    try:
+        print(f"已套用 {migrate(conn)} 個 schema 升級。")
+    finally:
+        conn.close()
@@ -0,0 +1,73 @@
+# search.py - 以 FTS5 (trigram) 搜尋使用者列表，回傳排序後的結果與標示片段
+import sqlite3
+
+from markupsafe import Markup, escape
+
+MIN_FTS_LENGTH = 3          # trigram 至少需要 3 個字元才能走索引
+SNIPPET_TOKENS = 16
+# bm25 欄位權重：word, definition, collocation, mnemonic, example1, example2
+COLUMN_WEIGHTS = (10.0, 6.0, 3.0, 1.0, 1.0, 1.0)
+
+# 先用控制字元標出命中位置，跳脫 HTML 之後再換成 <mark>，避免資料內容被當成 HTML
+_OPEN, _CLOSE = "\x02", "\x03"
+
+
+def _highlight(text):
+    if not text:
+        return text
+    return Markup(str(escape(text)).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>"))
+
+
+def _fts_phrase(query):
+    # 整串當作一個 phrase，使用者輸入的引號與運算子都不會被 FTS 解析
+    return '"' + query.replace('"', '""') + '"'
+
+
+def search_user_words(conn, user_id, query, limit=200):
+    """在使用者的列表中搜尋單字，依相關度排序；每筆附上 word_hl 與 snippet。"""
+    query = query.strip()
+    if len(query) < MIN_FTS_LENGTH:
+        return _search_short(conn, user_id, query, limit)
+    weights = ", ".join(str(w) for w in COLUMN_WEIGHTS)
+    try:
+        rows = conn.execute(f"""
+            SELECT w.*, w.example1 AS example_sentence,
+                   COALESCE(ud.review_count, 0) AS review_count,
+                   COALESCE(ud.correct_count, 0) AS correct_count,
+                   highlight(words_fts, 0, ?, ?) AS word_hl,
+                   snippet(words_fts, -1, ?, ?, '…', {SNIPPET_TOKENS}) AS snippet
+            FROM words_fts
+            JOIN words w ON w.id = words_fts.rowid
+            JOIN word_user_data ud ON ud.word_id = w.id AND ud.user_id = ?
+            WHERE words_fts MATCH ?
+            ORDER BY bm25(words_fts, {weights})
+            LIMIT ?
+        """, (_OPEN, _CLOSE, _OPEN, _CLOSE, user_id, _fts_phrase(query), limit)).fetchall()
+    except sqlite3.OperationalError as e:
+        # 尚未建立 words_fts (舊資料庫未升級) 時退回 LIKE
+        print(f"FTS 搜尋失敗，改用 LIKE: {e}")
+        return _search_short(conn, user_id, query, limit)
+    results = []
+    for row in rows:
+        item = dict(row)
+        item["word_hl"] = _highlight(item["word_hl"])
+        item["snippet"] = _highlight(item["snippet"])
+        results.append(item)
+    return results
+
+
+def _search_short(conn, user_id, query, limit):
+    # 1~2 個字元的查詢 (例如「放棄」) 無法用 trigram，只掃描該使用者自己的列表
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rows = conn.execute("""
+        SELECT w.*, w.example1 AS example_sentence,
+               COALESCE(ud.review_count, 0) AS review_count,
+               COALESCE(ud.correct_count, 0) AS correct_count
+        FROM words w
+        JOIN word_user_data ud ON w.id = ud.word_id
+        WHERE ud.user_id = :user_id
+          AND (w.word LIKE :term ESCAPE '\\' OR w.definition LIKE :term ESCAPE '\\')
+        ORDER BY w.word LIKE :prefix ESCAPE '\\' DESC, ud.last_reviewed DESC, w.id DESC
+        LIMIT :limit
+    """, {"user_id": user_id, "term": f"%{escaped}%", "prefix": f"{escaped}%", "limit": limit}).fetchall()
+    return [dict(row, word_hl=None, snippet=None) for row in rows]
@@ -1,7 +1,10 @@
-import sqlite3
 import os
 import json
 
+import db
+import import_words
+import schema
+
 DB_FILE = "vocabulary.db"
 
 # --- 第四級詞彙完整資料包 ---
@@ -26,51 +29,14 @@ words_to_seed = [
 ]
 
 def seed_data(data_list):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    # 實際寫入交給 import_words (批次 executemany、完整處理字首/字根/字尾與同/反義詞)；
+    # 大型單字包請改用 `python import_words.py pack.jsonl`，可分段提交並從中斷處續跑
+    conn = db.connect(DB_FILE)
     print(f"--- 開始匯入 {len(data_list)} 個單字 ---")
     try:
-        for data in data_list:
-            word_str = data.get('word')
-            if not word_str: continue
-
-            # 1. 新增或更新主要單字
-            cursor.execute("""
-                INSERT INTO words (word, level, part_of_speech, definition, collocation, mnemonic, example1, example2) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(word) DO UPDATE SET
-                    level=excluded.level,
-                    part_of_speech=excluded.part_of_speech,
-                    definition=excluded.definition,
-                    collocation=excluded.collocation,
-                    mnemonic=excluded.mnemonic,
-                    example1=excluded.example1,
-                    example2=excluded.example2
-            """, (
-                word_str, data.get('level'), data.get('part_of_speech'), data.get('definition'), 
-                data.get('collocation'), data.get('mnemonic'), data.get('example1'), data.get('example2')
-            ))
-            word_id = cursor.execute('SELECT id FROM words WHERE word = ?', (word_str,)).fetchone()[0]
-
-            # 2. 處理詞源
-            etymology = data.get('etymology', {})
-            for p_data in etymology.get('prefixes', []):
-                cursor.execute("INSERT OR IGNORE INTO prefixes (prefix, meaning) VALUES (?, ?)", (p_data['part'], p_data['meaning']))
-                prefix_id = cursor.execute('SELECT id FROM prefixes WHERE prefix = ?', (p_data['part'],)).fetchone()[0]
-                cursor.execute("INSERT OR IGNORE INTO word_prefixes (word_id, prefix_id) VALUES (?, ?)", (word_id, prefix_id))
-            # (roots 和 suffixes 的邏輯類似)
-
-            # 3. 處理關聯
-            relations = data.get('relations', {})
-            for syn_word in relations.get('synonyms', []):
-                cursor.execute("INSERT OR IGNORE INTO words (word) VALUES (?)", (syn_word,))
-                syn_id = cursor.execute('SELECT id FROM words WHERE word = ?', (syn_word,)).fetchone()[0]
-                cursor.execute("INSERT OR IGNORE INTO synonyms (word1_id, word2_id) VALUES (?, ?)", (word_id, syn_id))
-                cursor.execute("INSERT OR IGNORE INTO synonyms (word1_id, word2_id) VALUES (?, ?)", (syn_id, word_id))
-            # (antonyms 邏輯類似)
-
-        conn.commit()
-        print(f"🎉 成功處理 {len(data_list)} 個單字！")
+        schema.migrate(conn)
+        count = import_words.import_rows(conn, data_list)
+        print(f"🎉 成功處理 {count} 個單字！")
     except Exception as e:
         conn.rollback()
         print(f"\n匯入過程中發生錯誤: {e}")
@@ -0,0 +1,198 @@
+# srs.py - SM-2 間隔重複排程：更新 word_user_data 的 ease/interval/due_at，並以 (user_id, due_at) 索引取下一張卡
+from datetime import datetime, timedelta, timezone
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"     # 與 SQLite CURRENT_TIMESTAMP 相同 (UTC)
+
+MIN_EASE = 1.3
+MAX_EASE = 3.0                        # 填空只有對/錯兩種結果，答對一律給 5 分，需要上限避免 ease 無限成長
+DEFAULT_EASE = 2.5
+QUALITY_CORRECT = 5
+QUALITY_WRONG = 2                     # 填空答錯：想不起來，但看到答案會認得
+RELEARN_DELAY = timedelta(minutes=10) # 答錯後同一輪稍後再出現
+MAX_INTERVAL_DAYS = 365.0
+
+
+def now_utc():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def format_time(dt):
+    return dt.strftime(TIME_FORMAT)
+
+
+def schedule(ease, interval_days, repetitions, quality, now):
+    """SM-2：依作答品質 (0~5) 算出新的 (ease, interval_days, repetitions, due_at)。"""
+    ease = ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    ease = min(MAX_EASE, max(MIN_EASE, ease))
+    if quality < 3:
+        return ease, 0.0, 0, now + RELEARN_DELAY
+    repetitions += 1
+    if repetitions == 1:
+        interval_days = 1.0
+    elif repetitions == 2:
+        interval_days = 6.0
+    else:
+        interval_days = min(interval_days * ease, MAX_INTERVAL_DAYS)
+    return ease, interval_days, repetitions, now + timedelta(days=interval_days)
+
+
+def record_review(conn, user_id, word_id, is_correct, now=None):
+    """更新一筆作答結果 (含 review_count/correct_count)；由呼叫端負責 commit。"""
+    now = now or now_utc()
+    row = conn.execute(
+        "SELECT ease, interval_days, repetitions FROM word_user_data WHERE user_id = ? AND word_id = ?",
+        (user_id, word_id),
+    ).fetchone()
+    if row is None:
+        return False
+    quality = QUALITY_CORRECT if is_correct else QUALITY_WRONG
+    ease, interval_days, repetitions, due_at = schedule(row[0], row[1], row[2], quality, now)
+    conn.execute("""
+        UPDATE word_user_data
+        SET review_count = review_count + 1,
+            correct_count = correct_count + ?,
+            last_reviewed = ?,
+            ease = ?, interval_days = ?, repetitions = ?, due_at = ?
+        WHERE user_id = ? AND word_id = ?
+    """, (int(is_correct), format_time(now), ease, interval_days, repetitions, format_time(due_at), user_id, word_id))
+    return True
+
+
+def apply_reviews(conn, user_id, reviews):
+    """批次套用 [(word_id, is_correct, answered_at), ...]：一次 IN 查詢讀取狀態、一次 executemany 寫回。
+
+    同一個字出現多次時依 answered_at 依序排程；由呼叫端負責交易與 commit。
+    """
+    if not reviews:
+        return 0
+    word_ids = sorted({word_id for word_id, _, _ in reviews})
+    placeholders = ",".join("?" * len(word_ids))
+    states = {
+        row[0]: [row[1], row[2], row[3], None, 0, 0, None]
+        for row in conn.execute(f"""
+            SELECT word_id, ease, interval_days, repetitions FROM word_user_data
+            WHERE user_id = ? AND word_id IN ({placeholders})
+        """, (user_id, *word_ids))
+    }
+    for word_id, is_correct, answered_at in sorted(reviews, key=lambda r: r[2]):
+        state = states.get(word_id)
+        if state is None:
+            continue
+        quality = QUALITY_CORRECT if is_correct else QUALITY_WRONG
+        state[0], state[1], state[2], state[3] = schedule(state[0], state[1], state[2], quality, answered_at)
+        state[4] += 1
+        state[5] += int(is_correct)
+        state[6] = answered_at
+    updates = [
+        (reviewed, correct, format_time(last), ease, interval_days, repetitions, format_time(due_at), user_id, word_id)
+        for word_id, (ease, interval_days, repetitions, due_at, reviewed, correct, last) in states.items()
+        if reviewed
+    ]
+    conn.executemany("""
+        UPDATE word_user_data
+        SET review_count = review_count + ?,
+            correct_count = correct_count + ?,
+            last_reviewed = ?,
+            ease = ?, interval_days = ?, repetitions = ?, due_at = ?
+        WHERE user_id = ? AND word_id = ?
+    """, updates)
+    return len(updates)
+
+
+FULL_COLUMNS = "w.*, w.example1 AS example_sentence, ud.review_count, ud.correct_count, ud.due_at"
+
+
+def due_words(conn, user_id, limit, now=None, exclude=(), columns=FULL_COLUMNS):
+    """依到期時間取出最多 limit 個已到期的單字 (沿 (user_id, due_at) 索引往後讀)。
+
+    exclude：已作答但尚未送出、或已在前端緩衝區裡的 word_id，不要再出一次。
+    """
+    now = now or now_utc()
+    exclude = list(exclude)
+    not_in = f"AND ud.word_id NOT IN ({','.join('?' * len(exclude))})" if exclude else ""
+    return conn.execute(f"""
+        SELECT {columns}
+        FROM word_user_data ud
+        JOIN words w ON w.id = ud.word_id
+        WHERE ud.user_id = ? AND ud.due_at <= ? {not_in}
+        ORDER BY ud.due_at
+        LIMIT ?
+    """, (user_id, format_time(now), *exclude, limit)).fetchall()
+
+
+def next_due(conn, user_id, now=None, exclude=()):
+    """回傳最早到期的單字 (單一索引查找)；沒有到期的字時回傳 None。"""
+    rows = due_words(conn, user_id, 1, now, exclude)
+    return rows[0] if rows else None
+
+
+def due_count(conn, user_id, now=None):
+    now = now or now_utc()
+    return conn.execute(
+        "SELECT COUNT(*) FROM word_user_data WHERE user_id = ? AND due_at <= ?", (user_id, format_time(now))
+    ).fetchone()[0]
+
+
+def _replay(review_count, correct_count, last_reviewed):
+    # 只有總次數沒有逐次紀錄：把答錯平均分散在歷次作答中重播 SM-2 (第一次算答錯，
+    # 正確率過半時最後一次算答對)，最後一次作答時間視為 last_reviewed
+    state = (DEFAULT_EASE, 0.0, 0, last_reviewed)
+    misses = review_count - correct_count
+    for i in range(review_count):
+        missed = i * misses % review_count < misses
+        quality = QUALITY_WRONG if missed else QUALITY_CORRECT
+        state = schedule(state[0], state[1], state[2], quality, last_reviewed)
+    return state
+
+
+def state_from_history(review_count, correct_count, reviewed_at):
+    """只知道作答次數與最後作答時間時推算的 (ease, interval_days, repetitions, due_at)。"""
+    if review_count > 0:
+        return _replay(review_count, min(correct_count, review_count), reviewed_at)
+    return DEFAULT_EASE, 0.0, 0, reviewed_at
+
+
+def recompute_all(conn, batch_size=1000):
+    """依既有的 review_count/correct_count/last_reviewed 重建所有排程狀態。"""
+    fallback = now_utc()
+    total = 0
+    last = (-1, -1)
+    # 依主鍵 keyset 分批讀寫，不把整張表讀進記憶體
+    while True:
+        rows = conn.execute("""
+            SELECT user_id, word_id, review_count, correct_count, last_reviewed FROM word_user_data
+            WHERE (user_id, word_id) > (?, ?)
+            ORDER BY user_id, word_id
+            LIMIT ?
+        """, (*last, batch_size)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for user_id, word_id, review_count, correct_count, last_reviewed in rows:
+            try:
+                reviewed_at = datetime.strptime(last_reviewed, TIME_FORMAT) if last_reviewed else fallback
+            except ValueError:
+                reviewed_at = fallback
+            ease, interval_days, repetitions, due_at = state_from_history(review_count, correct_count, reviewed_at)
+            updates.append((ease, interval_days, repetitions, format_time(due_at), user_id, word_id))
+        conn.executemany("""
+            UPDATE word_user_data SET ease = ?, interval_days = ?, repetitions = ?, due_at = ?
+            WHERE user_id = ? AND word_id = ?
+        """, updates)
+        total += len(updates)
+        last = (rows[-1][0], rows[-1][1])
+    conn.commit()
+    return total
+
+if __name__ == "__main__":
+    import sys
+    import sqlite3
+
+    import schema
+
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else "vocabulary.db")
+    try:
+        schema.migrate(conn)
+        print(f"已重新計算 {recompute_all(conn)} 筆複習排程。")
+    finally:
+        conn.close()
@@ -0,0 +1,178 @@
+# story_pool.py - 綜合克漏字的預產故事池：背景執行緒先請 Gemini 寫好故事，頁面載入時直接取用
+import json
+import os
+import queue
+import random
+import threading
+
+import blanking
+import db
+import sampler
+import srs
+from a_gemini_tool import generate_multi_word_cloze
+
+POOL_SIZE = int(os.getenv("CLOZE_POOL_SIZE", "3"))          # 每位使用者保留幾篇現成的故事
+WORKERS = int(os.getenv("CLOZE_POOL_WORKERS", "1"))
+WORDS_PER_STORY = 3
+DUE_CANDIDATES = 9          # 從最先到期的幾個字裡挑，讓故事多半用上接下來要複習的字
+MAX_FAILURES = 3            # 單次補貨中 AI 連續失敗幾次就放棄，等下次取用時再補
+
+_queue = queue.Queue()
+_pending = set()            # 已排隊、尚未補完的 user_id，避免重複排隊
+_pending_lock = threading.Lock()
+_threads = []
+_threads_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"served": 0, "misses": 0, "generated": 0, "ai_errors": 0, "rejected": 0, "discarded": 0}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def contains_all(story, words):
+    """故事裡每個目標字 (含變化形) 都至少出現一次 (否則挖不出空格)。"""
+    return all(blanking.blank_count(story, words))
+
+
+def take(conn, user_id):
+    """取出 (並移除) 最舊的一篇故事；回傳 {"words": [...], "story": ...} 或 None。會順便排程補貨。"""
+    row = conn.execute("""
+        DELETE FROM cloze_stories
+        WHERE id = (SELECT id FROM cloze_stories WHERE user_id = ? ORDER BY id LIMIT 1)
+        RETURNING words, story
+    """, (user_id,)).fetchone()
+    conn.commit()
+    request_refill(user_id)
+    if row is None:
+        _bump("misses")
+        return None
+    _bump("served")
+    return {"words": json.loads(row["words"]), "story": row["story"]}
+
+
+def request_refill(user_id):
+    with _pending_lock:
+        if user_id in _pending:
+            return
+        _pending.add(user_id)
+    _ensure_workers()
+    _queue.put(user_id)
+
+
+def _ensure_workers():
+    if len(_threads) >= WORKERS:
+        return
+    with _threads_lock:
+        while len(_threads) < WORKERS:
+            t = threading.Thread(target=_worker, name=f"story-pool-{len(_threads)}", daemon=True)
+            t.start()
+            _threads.append(t)
+
+
+def _worker():
+    conn = db.connect()
+    while True:
+        user_id = _queue.get()
+        try:
+            _fill(conn, user_id)
+        except Exception as e:
+            conn.rollback()
+            print(f"補充故事池 (user {user_id}) 時發生錯誤: {e}")
+        finally:
+            with _pending_lock:
+                _pending.discard(user_id)
+            _queue.task_done()
+
+
+def _pick_words(conn, user_id, taken):
+    """挑一組還沒出現在池裡的單字：優先用到期的字，不足的用加權抽樣補。回傳 [(word_id, word), ...]。"""
+    for _ in range(3):
+        due = srs.due_words(conn, user_id, DUE_CANDIDATES, columns="w.id, w.word")
+        picked = random.sample([(r["id"], r["word"]) for r in due], min(len(due), WORDS_PER_STORY - 1))
+        rest = sampler.sample_words(conn, user_id, k=WORDS_PER_STORY - len(picked), columns="word",
+                                    exclude=[word_id for word_id, _ in picked])
+        picked += [(r["word_id"], r["word"]) for r in rest]
+        if len(picked) < WORDS_PER_STORY:
+            return None
+        if frozenset(word_id for word_id, _ in picked) not in taken:
+            return picked
+    return picked
+
+
+def _fill(conn, user_id):
+    failures = 0
+    while failures < MAX_FAILURES:
+        rows = conn.execute("SELECT id FROM cloze_stories WHERE user_id = ?", (user_id,)).fetchall()
+        if len(rows) >= POOL_SIZE:
+            return
+        taken = {
+            frozenset(word_ids)
+            for word_ids in _story_word_ids(conn, user_id, [r["id"] for r in rows]).values()
+        }
+        picked = _pick_words(conn, user_id, taken)
+        if picked is None:
+            return
+        conn.commit()       # 呼叫 AI 期間不佔用任何交易
+
+        words = [w for _, w in picked]
+        ai_data = generate_multi_word_cloze(words)
+        story = (ai_data or {}).get("story") if isinstance(ai_data, dict) else None
+        if not story:
+            _bump("ai_errors")
+            failures += 1
+            continue
+        if not contains_all(story, words):
+            _bump("rejected")
+            failures += 1
+            continue
+        if _store(conn, user_id, picked, story):
+            _bump("generated")
+        else:
+            _bump("discarded")
+            failures += 1
+
+
+def _story_word_ids(conn, user_id, story_ids):
+    result = {story_id: [] for story_id in story_ids}
+    if story_ids:
+        for row in conn.execute(f"""
+            SELECT story_id, word_id FROM cloze_story_words
+            WHERE user_id = ? AND story_id IN ({','.join('?' * len(story_ids))})
+        """, (user_id, *story_ids)):
+            result[row["story_id"]].append(row["word_id"])
+    return result
+
+
+def _store(conn, user_id, picked, story):
+    """寫入故事；產生期間若有字被移出列表就丟棄 (在寫入鎖內檢查，不會與刪除交錯)。"""
+    word_ids = [word_id for word_id, _ in picked]
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        still_listed = conn.execute(f"""
+            SELECT COUNT(*) FROM word_user_data WHERE user_id = ? AND word_id IN ({','.join('?' * len(word_ids))})
+        """, (user_id, *word_ids)).fetchone()[0]
+        if still_listed != len(word_ids):
+            conn.rollback()
+            return False
+        story_id = conn.execute(
+            "INSERT INTO cloze_stories (user_id, words, story) VALUES (?, ?, ?)",
+            (user_id, json.dumps([w for _, w in picked], ensure_ascii=False), story),
+        ).lastrowid
+        conn.executemany("INSERT OR IGNORE INTO cloze_story_words (story_id, user_id, word_id) VALUES (?, ?, ?)",
+                         [(story_id, user_id, word_id) for word_id in word_ids])
+        conn.commit()
+        return True
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    with _pending_lock:
+        snapshot["pending_users"] = len(_pending)
+    snapshot.update(pool_size=POOL_SIZE, workers=len(_threads))
+    return snapshot
@@ -0,0 +1,204 @@
+# synth_data.py - 產生大規模的合成資料庫，用來量測查詢與路由在真實規模下的表現 (見 bench.py)
+#
+# 用法：python synth_data.py bench.db [--words 100000] [--users 10000] [--avg-list 200] [--seed 1]
+#
+# 單字由字首 + 字根 + 音節 + 字尾拼成 (同時寫入詞源關聯)；同義詞多半連到同字根的字，形成群聚的關係圖；
+# 單字熱門度與每位使用者的列表大小都是長尾分布，作答次數與正確率也依單字難度偏斜。
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+
+import bcrypt
+
+import db
+import import_words
+import local_dict
+import schema
+import srs
+
+PREFIXES = [
+    ("un", "不"), ("re", "再次"), ("in", "不；向內"), ("dis", "分開；否定"), ("en", "使成為"), ("non", "非"),
+    ("pre", "之前"), ("mis", "錯誤"), ("sub", "在下"), ("inter", "之間"), ("trans", "穿越"), ("over", "過度"),
+    ("anti", "反對"), ("de", "向下；去除"), ("ex", "向外"), ("co", "共同"), ("pro", "向前"), ("con", "一起"),
+    ("per", "穿過；徹底"), ("ob", "反對；朝向"), ("ad", "朝向"), ("com", "一起"), ("super", "超過"), ("auto", "自己"),
+]
+ROOTS = [
+    ("spect", "看"), ("port", "攜帶"), ("dict", "說"), ("duct", "引導"), ("ject", "投擲"), ("scrib", "寫"),
+    ("vert", "轉"), ("mit", "送"), ("struct", "建造"), ("tract", "拉"), ("rupt", "破裂"), ("cred", "相信"),
+    ("fer", "帶來"), ("graph", "寫；畫"), ("voc", "聲音；呼喚"), ("loqu", "說話"), ("magn", "大"), ("anim", "心靈"),
+    ("ten", "握住"), ("ven", "來"), ("pend", "懸掛"), ("press", "壓"), ("cept", "拿取"), ("cap", "頭；拿"),
+    ("fac", "做"), ("pos", "放置"), ("ced", "走"), ("clud", "關閉"), ("sens", "感覺"), ("vis", "看見"),
+    ("aud", "聽"), ("mov", "移動"), ("form", "形狀"), ("fin", "結束"), ("gen", "產生"), ("log", "言語；學問"),
+    ("path", "感受"), ("phon", "聲音"), ("therm", "熱"), ("chron", "時間"), ("bio", "生命"), ("geo", "土地"),
+]
+SUFFIXES = [
+    ("able", "能夠…的", "adj."), ("ible", "能夠…的", "adj."), ("ous", "充滿…的", "adj."), ("ive", "有…性質的", "adj."),
+    ("al", "…的", "adj."), ("ful", "充滿…的", "adj."), ("less", "沒有…的", "adj."), ("ic", "…的", "adj."),
+    ("tion", "行為；狀態", "n."), ("ment", "行為；結果", "n."), ("ness", "性質", "n."), ("ity", "性質", "n."),
+    ("er", "做…的人", "n."), ("or", "做…的人", "n."), ("ist", "從事…的人", "n."), ("ism", "主義", "n."),
+    ("ize", "使…化", "v."), ("ify", "使成為", "v."), ("ate", "使…", "v."), ("en", "使變得", "v."),
+]
+SYLLABLES = ["", "a", "i", "o", "u", "e", "ar", "er", "or", "il", "an", "in", "ul", "et", "em", "os", "id", "ac"]
+# 定義用的中文詞彙 (讓 /lookup 的中文反向索引有足夠多樣的詞)
+CHINESE_TERMS = [
+    "放棄", "堅持", "改變", "發展", "影響", "保護", "表達", "解釋", "證明", "拒絕", "接受", "承認", "懷疑", "相信",
+    "尊重", "忽略", "強調", "減少", "增加", "限制", "避免", "依賴", "控制", "管理", "溝通", "合作", "競爭", "支持",
+    "反對", "批評", "讚美", "鼓勵", "警告", "要求", "建議", "描述", "比較", "區分", "分析", "評估", "預測", "觀察",
+    "謹慎", "勇敢", "慷慨", "吝嗇", "謙虛", "驕傲", "誠實", "狡猾", "冷靜", "急躁", "樂觀", "悲觀", "固執", "靈活",
+    "短暫", "永久", "模糊", "清楚", "複雜", "簡單", "珍貴", "普通", "神秘", "明顯", "危險", "安全", "古老", "現代",
+]
+COLLOCATION_NOUNS = ["plan", "decision", "idea", "effort", "team", "problem", "result", "attitude", "change", "story"]
+
+POPULARITY_SKEW = 1.1       # 單字熱門度的 Zipf 指數
+MAX_REVIEWS = 200
+HISTORY_DAYS = 120
+PASSWORD = "password"       # 所有合成使用者的密碼 (bench.py 直接寫 session，不需要登入)
+
+
+def _make_words(rng, count):
+    """產生 count 個不重複的單字與其組成 (prefix, root, syllable, suffix)。"""
+    combos = itertools.product([None] + PREFIXES, ROOTS, SYLLABLES, [None] + SUFFIXES)
+    pool = list(combos)
+    if count > len(pool):
+        sys.exit(f"錯誤：最多只能產生 {len(pool):,} 個不重複的合成單字。")
+    rng.shuffle(pool)
+    seen, words = set(), []
+    for prefix, root, syllable, suffix in pool:
+        text = (prefix[0] if prefix else "") + root[0] + syllable + (suffix[0] if suffix else "")
+        if text in seen:
+            continue
+        seen.add(text)
+        words.append((text, prefix, root, suffix))
+        if len(words) == count:
+            break
+    return words
+
+
+def _pack_rows(rng, words):
+    """轉成 import_words 的 JSONL 格式；同義詞偏向同字根的字。"""
+    by_root = {}
+    for text, _, root, _ in words:
+        by_root.setdefault(root[0], []).append(text)
+    texts = [w[0] for w in words]
+    for text, prefix, root, suffix in words:
+        pos = suffix[2] if suffix else rng.choice(("n.", "v.", "adj."))
+        terms = rng.sample(CHINESE_TERMS, 2)
+        noun = rng.choice(COLLOCATION_NOUNS)
+        collocation = f"{text} {noun}" if pos == "adj." else f"{text} the {noun}"
+        siblings = by_root[root[0]]
+        synonyms = [w for w in rng.sample(siblings, min(len(siblings), rng.randint(0, 4))) if w != text]
+        antonyms = rng.sample(texts, rng.randint(0, 1))
+        yield {
+            "word": text,
+            "level": rng.randint(1, 6),
+            "part_of_speech": pos,
+            "definition": f"{terms[0]}的；{root[1]}，{terms[1]}",
+            "collocation": collocation,
+            "mnemonic": f"【字根】{root[0]} ({root[1]})" + (f" + -{suffix[0]} ({suffix[1]})" if suffix else ""),
+            "example1": f"Everyone noticed the **{collocation}** during the meeting.",
+            "example2": f"It is hard to explain why the {noun} felt so {text}.",
+            "etymology": {
+                "prefixes": [{"part": prefix[0], "meaning": prefix[1]}] if prefix else [],
+                "roots": [{"part": root[0], "meaning": root[1]}],
+                "suffixes": [{"part": suffix[0], "meaning": suffix[1]}] if suffix else [],
+            },
+            "relations": {"synonyms": synonyms, "antonyms": [w for w in antonyms if w != text]},
+        }
+
+
+def _zipf_weights(n, skew):
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def _list_size(rng, avg, word_count):
+    # 對數常態：大部分使用者只有幾十個字，少數重度使用者有上千個
+    sigma = 1.0
+    size = int(rng.lognormvariate(math.log(avg) - sigma ** 2 / 2, sigma))
+    return max(1, min(size, word_count))
+
+
+def _history(rng, difficulty, now):
+    if rng.random() < 0.25:
+        return 0, 0, None       # 加入後還沒複習過
+    reviews = min(MAX_REVIEWS, int(rng.expovariate(1 / 8)) + 1)
+    accuracy = rng.betavariate(8 * (1 - difficulty) + 1, 8 * difficulty + 1)
+    correct = sum(rng.random() < accuracy for _ in range(reviews))
+    reviewed_at = now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+    return reviews, correct, reviewed_at
+
+
+def _insert_users(conn, rng, user_count, avg_list, report):
+    word_ids = [r[0] for r in conn.execute("SELECT id FROM words ORDER BY id")]
+    rng.shuffle(word_ids)       # 熱門度與 id 無關
+    cum_weights = _zipf_weights(len(word_ids), POPULARITY_SKEW)
+    difficulty = {word_id: rng.random() for word_id in word_ids}
+    hashed = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(4)).decode("utf-8")
+    conn.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                     [(f"user{i:05d}", hashed) for i in range(1, user_count + 1)])
+    user_ids = [r[0] for r in conn.execute("SELECT id FROM users ORDER BY id")]
+    now = srs.now_utc()
+    total, batch = 0, []
+    started = time.perf_counter()
+    for n, user_id in enumerate(user_ids, start=1):
+        size = _list_size(rng, avg_list, len(word_ids))
+        picked = set()
+        while len(picked) < size:
+            picked.update(rng.choices(word_ids, cum_weights=cum_weights, k=size - len(picked)))
+        for ord_, word_id in enumerate(sorted(picked)):
+            reviews, correct, reviewed_at = _history(rng, difficulty[word_id], now)
+            ease, interval_days, repetitions, due_at = srs.state_from_history(reviews, correct, reviewed_at or now)
+            batch.append((user_id, word_id, reviews, correct, reviewed_at and srs.format_time(reviewed_at),
+                          ord_, ease, interval_days, repetitions, srs.format_time(due_at)))
+        if len(batch) >= 50000 or n == len(user_ids):
+            # 直接給 ord 與 due_at，插入時不觸發補值的觸發器
+            conn.executemany("""
+                INSERT INTO word_user_data (user_id, word_id, review_count, correct_count, last_reviewed,
+                                            ord, ease, interval_days, repetitions, due_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+            conn.commit()
+            total += len(batch)
+            batch = []
+            report(f"  使用者 {n:,}/{len(user_ids):,}，列表資料 {total:,} 筆 "
+                   f"({total / (time.perf_counter() - started):,.0f} 筆/秒)")
+    return total
+
+
+def generate(path, words=100000, users=10000, avg_list=200, seed=1, report=print):
+    if os.path.exists(path):
+        sys.exit(f"錯誤：'{path}' 已存在，請指定新的檔案。")
+    rng = random.Random(seed)
+    conn = db.connect(path)
+    try:
+        schema.create_base_tables(conn)
+        schema.migrate(conn)
+        report(f"產生 {words:,} 個單字...")
+        import_words.import_rows(conn, _pack_rows(rng, _make_words(rng, words)), chunk_size=5000, report=report)
+        # 同義詞先以空白字建立、稍後才補上完整資料；這些字不需要背景補齊
+        conn.execute("DELETE FROM enrich_jobs WHERE word_id IN (SELECT id FROM words WHERE definition IS NOT NULL)")
+        conn.commit()
+        report(f"產生 {users:,} 位使用者的列表與作答紀錄...")
+        rows = _insert_users(conn, rng, users, avg_list, report)
+        report("建立中文定義索引與統計資訊...")
+        local_dict.sync_index(conn)
+        conn.execute("ANALYZE")
+        conn.commit()
+        report(f"🎉 完成：{words:,} 個單字、{users:,} 位使用者、{rows:,} 筆列表資料 → {path}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="產生大規模的合成單字資料庫")
+    parser.add_argument("path")
+    parser.add_argument("--words", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--avg-list", type=int, default=200, help="每位使用者列表的平均單字數")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.path, args.words, args.users, args.avg_list, args.seed)
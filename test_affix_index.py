@@ -0,0 +1,53 @@
+# test_affix_index.py - 詞源的單字數與推薦都只算有定義的字 (同探索頁)
+import affix_index
+import level_catalog
+import word_store
+
+
+def _root_id(conn, part):
+    return conn.execute("SELECT id FROM roots WHERE root = ?", (part,)).fetchone()[0]
+
+
+def _add_to_dictionary(conn, word, definition, root):
+    # 不在使用者列表中的字典單字 (definition 為 None 時是同/反義詞產生的空白字)
+    conn.execute("INSERT INTO words (word, definition) VALUES (?, ?)", (word, definition))
+    conn.execute("INSERT OR IGNORE INTO roots (root, meaning) VALUES (?, '')", (root,))
+    conn.execute("INSERT INTO word_roots (word_id, root_id) SELECT w.id, r.id FROM words w, roots r "
+                 "WHERE w.word = ? AND r.root = ?", (word, root))
+
+
+def _word_count(conn, part):
+    return affix_index.get_affix(conn, "root", _root_id(conn, part))["word_count"]
+
+
+def test_word_count_skips_stubs_until_defined(conn):
+    word_store.save_word(conn, 1, "inspect", "檢查", "", {"roots": [{"part": "spect", "meaning": "看"}]})
+    _add_to_dictionary(conn, "spectator", None, "spect")
+    conn.commit()
+    assert _word_count(conn, "spect") == 1
+
+    conn.execute("UPDATE words SET definition = '觀眾' WHERE word = 'spectator'")
+    assert _word_count(conn, "spect") == 2
+    in_list, others = affix_index.explore(conn, "root", _root_id(conn, "spect"), 1)
+    assert len(in_list) + len(others) == 2
+
+    conn.execute("UPDATE words SET definition = NULL WHERE word = 'spectator'")
+    assert _word_count(conn, "spect") == 1
+    conn.execute("DELETE FROM words WHERE word = 'inspect'")
+    conn.execute("DELETE FROM word_roots WHERE word_id NOT IN (SELECT id FROM words)")
+    assert _word_count(conn, "spect") == 0
+
+
+def test_recommend_fills_limit_past_stubs(conn):
+    word_store.save_word(conn, 1, "inspect", "檢查", "", {"roots": [{"part": "spect", "meaning": "看"}]})
+    # 第一批候選 (limit * POOL_FACTOR) 全是空白字，有定義的字排在後面
+    stubs = 2 * affix_index.POOL_FACTOR
+    for i in range(stubs):
+        _add_to_dictionary(conn, f"aspect{i:02d}", None, "spect")
+    for i in range(3):
+        _add_to_dictionary(conn, f"spectrum{i}", "光譜", "spect")
+    conn.commit()
+    level_catalog.clear_memory()
+    affix_index.clear_memory()
+    words = affix_index.recommend(conn, 1, limit=2)
+    assert [w["word"] for w in words] == ["spectrum0", "spectrum1"]
@@ -0,0 +1,30 @@
+# test_local_dict.py - /lookup 的本機字典：只有完整資料的字才算命中
+import local_dict
+import word_store
+
+
+def _add_manual(conn, word, definition, example):
+    # 與 app.add_manual 相同的寫法：表單沒填的欄位是空字串
+    conn.execute("INSERT INTO words (word, definition, example1) VALUES (?, ?, ?) ON CONFLICT(word) DO NOTHING",
+                 (word, definition, example))
+    conn.commit()
+
+
+def test_manual_stub_is_not_a_local_hit(conn):
+    _add_manual(conn, "stubword", "", "")
+    assert local_dict.find_word(conn, "stubword") is None
+
+
+def test_manual_word_without_example_is_not_a_local_hit(conn):
+    _add_manual(conn, "halfword", "只有定義", "")
+    assert local_dict.find_word(conn, "halfword") is None
+
+
+def test_complete_word_is_a_local_hit(conn):
+    word_store.save_word(conn, 1, "inspect", "檢查", "They inspect the car.",
+                         {"roots": [{"part": "spect", "meaning": "看"}]}, synonyms=["examine"])
+    conn.commit()
+    data = local_dict.find_word(conn, "inspect")
+    assert data["definition"] == "檢查"
+    assert data["etymology"]["roots"][0]["part"] == "spect"
+    assert data["relations"]["synonyms"] == ["examine"]
@@ -0,0 +1,26 @@
+# test_schema.py - migration 的 DDL 與 user_version 一起提交
+import sqlite3
+
+import pytest
+
+import db
+import schema
+
+
+def _broken(conn):
+    conn.execute("CREATE TABLE half_applied (id INTEGER PRIMARY KEY)")
+    conn.execute("INSERT INTO no_such_table VALUES (1)")
+
+
+def test_failed_migration_rolls_back(tmp_path, monkeypatch):
+    conn = db.connect(str(tmp_path / "test.db"))
+    schema.create_base_tables(conn)
+    schema.migrate(conn)
+    version = len(schema.MIGRATIONS)
+    monkeypatch.setattr(schema, "MIGRATIONS", schema.MIGRATIONS + [_broken])
+    with pytest.raises(sqlite3.OperationalError):
+        schema.migrate(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == version
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_applied'").fetchone() is None
+    assert not conn.in_transaction
+    conn.close()
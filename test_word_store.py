@@ -0,0 +1,40 @@
+# test_word_store.py - /save 的語句數回歸測試：一次完整儲存不可超過 word_store.STATEMENT_BUDGET
+import db
+import word_store
+
+ETYMOLOGY = {
+    "prefixes": [{"part": "in", "meaning": "向內"}, {"part": "re", "meaning": "再"}],
+    "roots": [{"part": "spect", "meaning": "看"}],
+    "suffixes": [{"part": "ion", "meaning": "名詞"}],
+}
+
+
+def _save(conn, word, **kwargs):
+    before = db.statement_count()
+    word_id, statements = word_store.save_word(conn, 1, word, "定義", "例句", **kwargs)
+    conn.commit()
+    return word_id, db.statement_count() - before, statements
+
+
+def test_full_save_within_budget(conn):
+    _, executed, statements = _save(conn, "inspection", etymology=ETYMOLOGY,
+                                     synonyms=["examination", "review"], antonyms=["neglect"])
+    assert executed <= word_store.STATEMENT_BUDGET
+    assert statements == executed
+
+
+def test_resave_with_existing_affixes_within_budget(conn):
+    _save(conn, "inspection", etymology=ETYMOLOGY, synonyms=["examination"], antonyms=["neglect"])
+    _, executed, _ = _save(conn, "introspection", etymology=ETYMOLOGY,
+                           synonyms=["inspection", "reflection"], antonyms=["neglect", "inspection"])
+    assert executed <= word_store.STATEMENT_BUDGET
+
+
+def test_save_writes_links(conn):
+    word_id, _, _ = _save(conn, "inspection", etymology=ETYMOLOGY, synonyms=["examination"], antonyms=["neglect"])
+    assert conn.execute("SELECT COUNT(*) FROM word_prefixes WHERE word_id = ?", (word_id,)).fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM word_roots WHERE word_id = ?", (word_id,)).fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM synonyms").fetchone()[0] == 1
+    assert conn.execute(
+        "SELECT COUNT(*) FROM word_user_data WHERE user_id = 1 AND word_id = ?", (word_id,)
+    ).fetchone()[0] == 1
@@ -0,0 +1,30 @@
+# user_cache.py - Flask-Login load_user 的使用者快取 (LRU + TTL)，避免每個請求都查 users 表
+import os
+
+from lru import LRUCache
+
+MAX_ENTRIES = int(os.getenv("USER_CACHE_ENTRIES", "4096"))
+# 其他行程改了使用者資料時，最晚在這段時間後生效；本行程內的修改請呼叫 invalidate()
+TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+
+_cache = LRUCache(maxsize=MAX_ENTRIES, ttl=TTL_SECONDS)
+
+
+def get(user_id, loader):
+    """回傳快取中的使用者；沒有時呼叫 loader(user_id) 載入 (回傳 None 的結果不快取)。"""
+    key = str(user_id)
+    user = _cache.get(key)
+    if user is None:
+        user = loader(key)
+        if user is not None:
+            _cache.set(key, user)
+    return user
+
+
+def invalidate(user_id):
+    """使用者資料 (密碼、名稱、google_id) 變更後呼叫。"""
+    _cache.pop(str(user_id))
+
+
+def stats():
+    return _cache.stats()
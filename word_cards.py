@@ -0,0 +1,111 @@
+# word_cards.py - word_detail 的卡片快取：SQLite 中的壓縮 JSON + 行程內 LRU，配合強 ETag
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+from lru import LRUCache
+
+# 模板或卡片格式變更時調高，讓舊的 ETag 全部失效
+CARD_FORMAT_VERSION = 2
+# 行程內快取的存活時間；其他行程 (例如匯入腳本) 的修改最晚在這段時間後生效
+MEMORY_TTL_SECONDS = int(os.getenv("WORD_CARD_MEMORY_TTL", "60"))
+
+_memory = LRUCache(maxsize=int(os.getenv("WORD_CARD_MEMORY_ENTRIES", "4096")), ttl=MEMORY_TTL_SECONDS)
+_stats_lock = threading.Lock()
+_stats = {"db_hits": 0, "builds": 0, "build_races": 0}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _build(conn, word_id):
+    word = conn.execute('SELECT *, example1 AS example_sentence FROM words WHERE id = ?', (word_id,)).fetchone()
+    if word is None:
+        return None
+
+    def related(table):
+        # 每對只存一筆 (word1_id < word2_id)，兩個方向都要查；卡片只需要 id 與拼字
+        return [dict(r) for r in conn.execute(f'''
+            SELECT w.id, w.word FROM words w JOIN {table} t ON w.id = t.word2_id WHERE t.word1_id = ?
+            UNION ALL
+            SELECT w.id, w.word FROM words w JOIN {table} t ON w.id = t.word1_id WHERE t.word2_id = ?
+        ''', (word_id, word_id))]
+
+    def affixes(table, link_table, id_col):
+        return [dict(r) for r in conn.execute(
+            f'SELECT a.* FROM {table} a JOIN {link_table} l ON a.id = l.{id_col} WHERE l.word_id = ?', (word_id,))]
+
+    return {
+        "word": dict(word),
+        "synonyms": related("synonyms"),
+        "antonyms": related("antonyms"),
+        "prefixes": affixes("prefixes", "word_prefixes", "prefix_id"),
+        "roots": affixes("roots", "word_roots", "root_id"),
+        "suffixes": affixes("suffixes", "word_suffixes", "suffix_id"),
+    }
+
+
+def _etag_for(raw):
+    digest = hashlib.sha256(raw).hexdigest()[:20]
+    return f"c{CARD_FORMAT_VERSION}-{digest}"
+
+
+def peek(word_id):
+    """只查行程內快取 (不碰資料庫)；回傳 (etag, card) 或 None。"""
+    return _memory.get(word_id)
+
+
+def get_card(conn, word_id):
+    """回傳 (etag, card)；單字不存在時回傳 None。"""
+    cached = _memory.get(word_id)
+    if cached is not None:
+        return cached
+
+    row = conn.execute("SELECT version, payload, etag FROM word_cards WHERE word_id = ?", (word_id,)).fetchone()
+    if row is not None and row["payload"] is not None:
+        _bump("db_hits")
+        entry = (row["etag"], json.loads(zlib.decompress(row["payload"])))
+        _memory.set(word_id, entry)
+        return entry
+
+    version = row["version"] if row is not None else None
+    card = _build(conn, word_id)
+    if card is None:
+        return None
+    _bump("builds")
+    raw = json.dumps(card, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    entry = (_etag_for(raw), card)
+    payload = zlib.compress(raw)
+    # 只在建構期間 version 沒被觸發器改動時才寫回，避免把舊內容存成新版本
+    if version is None:
+        cur = conn.execute("""
+            INSERT OR IGNORE INTO word_cards (word_id, version, payload, etag, built_at)
+            VALUES (?, 1, ?, ?, CURRENT_TIMESTAMP)
+        """, (word_id, payload, entry[0]))
+    else:
+        cur = conn.execute("""
+            UPDATE word_cards SET payload = ?, etag = ?, built_at = CURRENT_TIMESTAMP
+            WHERE word_id = ? AND version = ?
+        """, (payload, entry[0], word_id, version))
+    conn.commit()
+    if cur.rowcount:
+        _memory.set(word_id, entry)
+    else:
+        _bump("build_races")
+    return entry
+
+
+def clear_memory():
+    """本行程內寫入單字資料後呼叫 (資料庫中的卡片已由觸發器失效)。"""
+    _memory.clear()
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["memory"] = _memory.stats()
+    return snapshot
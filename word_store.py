@@ -0,0 +1,116 @@
+# word_store.py - /save 的批次寫入：以 executemany + 單次 IN 查詢處理詞源與同/反義詞
+import logging
+import threading
+
+# 一次完整儲存 (三種詞源 + 同義 + 反義) 的語句數上限；超過代表寫入路徑退化回逐筆查詢
+STATEMENT_BUDGET = 13
+
+AFFIX_TABLES = (
+    # etymology key, 詞源表, 欄位, 關聯表, 關聯欄位
+    ("prefixes", "prefixes", "prefix", "word_prefixes", "prefix_id"),
+    ("roots", "roots", "root", "word_roots", "root_id"),
+    ("suffixes", "suffixes", "suffix", "word_suffixes", "suffix_id"),
+)
+
+logger = logging.getLogger(__name__)
+_stats_lock = threading.Lock()
+_stats = {"saves": 0, "statements_total": 0, "statements_max": 0, "over_budget": 0}
+
+
+class _CountingCursor:
+    """計算送進 SQLite 的語句數 (executemany 算一次)。"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.statements = 0
+
+    def execute(self, sql, params=()):
+        self.statements += 1
+        return self._conn.execute(sql, params)
+
+    def executemany(self, sql, seq):
+        seq = list(seq)
+        if not seq:
+            return None
+        self.statements += 1
+        return self._conn.executemany(sql, seq)
+
+
+def canonical_pairs(word_id, other_ids):
+    # 同/反義詞是對稱關係，每一對只存一筆 (word1_id < word2_id)
+    return sorted({(min(word_id, o), max(word_id, o)) for o in other_ids if o != word_id})
+
+
+def _clean_parts(parts):
+    return {p["part"]: p["meaning"] for p in parts or [] if isinstance(p, dict) and "part" in p and "meaning" in p}
+
+
+def save_word(conn, user_id, word, definition, example_sentence, etymology=None, synonyms=(), antonyms=()):
+    """寫入單字、詞源、同/反義詞並加入使用者列表；回傳 (word_id, 語句數)。由呼叫端 commit。"""
+    cur = _CountingCursor(conn)
+    etymology = etymology or {}
+    synonyms = [s for s in dict.fromkeys(synonyms or []) if s and s != word]
+    antonyms = [a for a in dict.fromkeys(antonyms or []) if a and a != word]
+    related = list(dict.fromkeys(synonyms + antonyms))
+
+    cur.execute("""
+        INSERT INTO words (word, definition, example1)
+        VALUES (?, ?, ?)
+        ON CONFLICT(word) DO NOTHING
+    """, (word, definition, example_sentence))
+    cur.executemany("INSERT OR IGNORE INTO words (word) VALUES (?)", [(w,) for w in related])
+    lookup = [word] + related
+    ids = {
+        row[1]: row[0]
+        for row in cur.execute(f"SELECT id, word FROM words WHERE word IN ({','.join('?' * len(lookup))})", lookup)
+    }
+    word_id = ids[word]
+
+    # 詞源：每種各一次 executemany 寫入，三種一起用一個 UNION ALL 查回 id
+    parts_by_key = {key: _clean_parts(etymology.get(key)) for key, *_ in AFFIX_TABLES}
+    selects, params = [], []
+    for key, table, column, _, _ in AFFIX_TABLES:
+        parts = parts_by_key[key]
+        if not parts:
+            continue
+        cur.executemany(f"INSERT OR IGNORE INTO {table} ({column}, meaning) VALUES (?, ?)", parts.items())
+        selects.append(f"SELECT '{key}', id FROM {table} WHERE {column} IN ({','.join('?' * len(parts))})")
+        params.extend(parts)
+    if selects:
+        affix_ids = {}
+        for key, affix_id in cur.execute(" UNION ALL ".join(selects), params):
+            affix_ids.setdefault(key, []).append(affix_id)
+        for key, _, _, link_table, link_column in AFFIX_TABLES:
+            cur.executemany(
+                f"INSERT OR IGNORE INTO {link_table} (word_id, {link_column}) VALUES (?, ?)",
+                [(word_id, affix_id) for affix_id in affix_ids.get(key, [])],
+            )
+
+    cur.executemany("INSERT OR IGNORE INTO synonyms (word1_id, word2_id) VALUES (?, ?)",
+                    canonical_pairs(word_id, [ids[s] for s in synonyms]))
+    cur.executemany("INSERT OR IGNORE INTO antonyms (word1_id, word2_id) VALUES (?, ?)",
+                    canonical_pairs(word_id, [ids[a] for a in antonyms]))
+    cur.execute("INSERT OR IGNORE INTO word_user_data (user_id, word_id) VALUES (?, ?)", (user_id, word_id))
+
+    _record(cur.statements)
+    return word_id, cur.statements
+
+
+def _record(statements):
+    with _stats_lock:
+        _stats["saves"] += 1
+        _stats["statements_total"] += statements
+        _stats["statements_max"] = max(_stats["statements_max"], statements)
+        if statements > STATEMENT_BUDGET:
+            _stats["over_budget"] += 1
+    if statements > STATEMENT_BUDGET:
+        logger.warning("/save 使用了 %d 個語句，超過上限 %d", statements, STATEMENT_BUDGET)
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["statement_budget"] = STATEMENT_BUDGET
+    if snapshot["saves"]:
+        snapshot["statements_avg"] = snapshot["statements_total"] / snapshot["saves"]
+    return snapshot
@@ -0,0 +1,64 @@
+# wordlist.py - 首頁單字列表的 keyset 分頁 (依 last_reviewed DESC, word_id DESC)
+import base64
+import json
+
+PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+# 只取卡片模板會用到的欄位
+CARD_COLUMNS = """
+    w.id, w.word, w.definition, w.example1, w.example1 AS example_sentence, w.mnemonic, w.collocation,
+    ud.review_count, ud.correct_count, ud.last_reviewed
+"""
+
+
+def encode_cursor(row):
+    raw = json.dumps([row["last_reviewed"], row["id"]])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """解析 cursor；格式錯誤時回傳 None (從第一頁開始)。"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_reviewed, word_id = json.loads(base64.urlsafe_b64decode(padded))
+        if (last_reviewed is None or isinstance(last_reviewed, str)) and isinstance(word_id, int):
+            return last_reviewed, word_id
+    except (ValueError, TypeError):
+        pass
+    return None
+
+
+def user_words_page(conn, user_id, cursor=None, limit=PAGE_SIZE):
+    """回傳 (rows, next_cursor)。
+
+    last_reviewed 為 NULL (尚未複習) 的字排在最後；兩段分開查詢，各自都是
+    idx_word_user_data_recent 上的一段範圍掃描，不論列表多大，每頁成本固定。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    position = decode_cursor(cursor)
+    rows = []
+    if position is None or position[0] is not None:
+        keyset = "AND (ud.last_reviewed, ud.word_id) < (?, ?)" if position else ""
+        rows = conn.execute(f"""
+            SELECT {CARD_COLUMNS}
+            FROM word_user_data ud
+            JOIN words w ON w.id = ud.word_id
+            WHERE ud.user_id = ? AND ud.last_reviewed IS NOT NULL {keyset}
+            ORDER BY ud.last_reviewed DESC, ud.word_id DESC
+            LIMIT ?
+        """, (user_id, *(position or ()), limit + 1)).fetchall()
+    if len(rows) <= limit:
+        keyset = "AND ud.word_id < ?" if position and position[0] is None else ""
+        rows += conn.execute(f"""
+            SELECT {CARD_COLUMNS}
+            FROM word_user_data ud
+            JOIN words w ON w.id = ud.word_id
+            WHERE ud.user_id = ? AND ud.last_reviewed IS NULL {keyset}
+            ORDER BY ud.word_id DESC
+            LIMIT ?
+        """, (user_id, *((position[1],) if keyset else ()), limit + 1 - len(rows))).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor